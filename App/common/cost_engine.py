@@ -1,5 +1,8 @@
 from __future__ import annotations
+from dataclasses import dataclass
 from typing import Dict, Any, List
+import time
+import numpy as np
 import pandas as pd
 from datetime import date
 
@@ -9,10 +12,14 @@ from .models import (
     ContainerPlanItem,
     EngineOptions,
     QuoteRequest,
-    filter_by_validity,
+    REEFER_COLUMN_RULES,
+    cargo_timestamp,
 )
 from .models import load_master
-from .schedule_engine import get_schedule_for
+from .master_index import MasterIndex, get_master_index, top_n
+from .pricing_rules import PricingRules
+from .quote_trace import start_trace
+from .schedule_engine import get_schedules_for
 
 # --- helpers for Valid (display only) ---
 import pandas as pd
@@ -28,126 +35,211 @@ def _valid_label(eff, exp) -> str:
     return "-" if "-" in (s1, s2) else f"{s1}-{s2}"   # ví dụ 4DEC-14DEC
 
 
-def map_reefer_containers(df: pd.DataFrame) -> pd.DataFrame:
-    """Map giá từ 20GP, 40GP, 40HQ sang 20RF, 40RF theo từng loại CommodityType và Carrier."""
-    df = df.copy()
+def commodity_mask(index: MasterIndex, rows: np.ndarray, reefer: bool, soc: bool) -> np.ndarray:
+    """FAK/REEFER + SOC filtering: mask bool theo `rows`."""
+    if not reefer and not soc:
+        return np.ones(rows.size, dtype=bool)
+    if not reefer and soc:
+        return ~index.soc_word[rows]
+    return index.is_reefer[rows]
 
-    cond_reefer_cosco = (df["CommodityType"].str.upper() == "REEFER") & (df["Carrier"].str.upper() == "COSCO")
-    df.loc[cond_reefer_cosco, "20RF"] = df.loc[cond_reefer_cosco, "20GP"]
-    df.loc[cond_reefer_cosco, "40RF"] = df.loc[cond_reefer_cosco, "40HQ"]
 
-    cond_reefer_fak_one = (df["CommodityType"].str.upper() == "REEFER FAK") & (df["Carrier"].str.upper() == "ONE")
-    df.loc[cond_reefer_fak_one, "20RF"] = df.loc[cond_reefer_fak_one, "20GP"]
-    df.loc[cond_reefer_fak_one, "40RF"] = df.loc[cond_reefer_fak_one, "40GP"]
+def markup_rules(opt: EngineOptions) -> PricingRules:
+    """
+    Rule markup của 1 request: markup_map theo carrier (mặc định từ Pipeline /
+    slider) là nền, opt.pricing_rules (nếu có) đứng sau nên thắng khi hoà.
+    """
+    rules = PricingRules.from_carrier_markups(getattr(opt, "markup_map", None) or {})
+    extra = getattr(opt, "pricing_rules", None)
+    return rules + extra if extra else rules
 
-    return df
+
+@dataclass
+class _QuoteProfile:
+    """
+    Phần việc dùng chung cho các request cùng POL / REEFER / SOC / ngày cargo /
+    loại container: tập dòng theo POL, mask hiệu lực + commodity/SOC và ma trận giá.
+    """
+    rows: np.ndarray
+    place_codes: np.ndarray
+    pod_codes: np.ndarray
+    valid: np.ndarray
+    allowed: np.ndarray
+    rates: np.ndarray
+
+
+def _profile_key(req: QuoteRequest) -> tuple:
+    ship = req.shipment
+    return (
+        str(ship.pol or "").upper().strip(),
+        ship.is_reefer(),
+        bool(ship.is_soc),
+        cargo_timestamp(ship.cargo_ready_date),
+        tuple(c.type for c in req.containers),
+    )
+
+
+def _build_profile(index: MasterIndex, req: QuoteRequest) -> _QuoteProfile:
+    ship = req.shipment
+    rows = index.rows_for_pol(ship.pol)
+
+    valid = np.zeros(rows.size, dtype=bool)
+    valid[np.searchsorted(rows, index.filter_validity(rows, ship.cargo_ready_date))] = True
+
+    return _QuoteProfile(
+        rows=rows,
+        place_codes=index.place.codes[rows],
+        pod_codes=index.pod.codes[rows],
+        valid=valid,
+        allowed=commodity_mask(index, rows, ship.is_reefer(), ship.is_soc),
+        # 20RF / 40RF quy đổi theo rule (cache trong index), kể cả Master chưa qua load_master
+        rates=index.rate_matrix(rows, [c.type for c in req.containers], REEFER_COLUMN_RULES),
+    )
 
 
 def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]:
+    return generate_quotes(master_df, [req])[0]
+
+
+def generate_quotes(master_df: pd.DataFrame, requests: List[QuoteRequest]) -> List[Dict[str, Any]]:
+    """
+    Quote nhiều request trong 1 lần gọi (vd nhiều Place of Delivery).
+    Các request cùng profile (POL, REEFER, SOC, ngày cargo, loại container)
+    dùng chung bước lọc POL, hiệu lực, commodity và ma trận giá;
+    schedule cũng được tra 1 lần cho mỗi (carrier, POD).
+    Kết quả trả về theo đúng thứ tự `requests`.
+    Request có engine_options.trace = True được gắn thêm result["trace"]
+    (bước POL = thời gian build profile, chỉ tính cho request đầu nhóm).
+    """
+    index = get_master_index(master_df)
+    results: List[Dict[str, Any]] = [{} for _ in requests]
+    schedules: Dict[tuple, Dict[str, Any]] = {}
+
+    groups: Dict[tuple, List[int]] = {}
+    for i, req in enumerate(requests):
+        groups.setdefault(_profile_key(req), []).append(i)
+
+    for members in groups.values():
+        t0 = time.perf_counter_ns()
+        profile = _build_profile(index, requests[members[0]])
+        profile_us = (time.perf_counter_ns() - t0) / 1000
+        for k, i in enumerate(members):
+            tr = start_trace("cost_engine", requests[i].engine_options)
+            tr.stage("pol", index.n_rows, profile.rows.size, profile_us if k == 0 else 0.0, shared=k > 0)
+            result = _quote_from_profile(master_df, index, profile, requests[i], schedules, tr)
+            results[i] = tr.attach(result)
+    return results
+
+
+def _quote_from_profile(
+    master_df: pd.DataFrame,
+    index: MasterIndex,
+    profile: _QuoteProfile,
+    req: QuoteRequest,
+    schedules: Dict[tuple, Dict[str, Any]],
+    tr=None,
+) -> Dict[str, Any]:
     ship = req.shipment
     opt = req.engine_options
-    df = master_df.copy()
+    tr = tr or start_trace("cost_engine", None)
 
     # 1. Filter POL
-    df["POL_up"] = df["POL"].astype(str).str.upper().str.strip()
-    df = df[df["POL_up"] == ship.pol.upper().strip()]
-    if df.empty:
+    if profile.rows.size == 0:
         return {"error": "NO_RATE", "message": "Không có giá POL."}
 
-    # 2. Filter Place of Delivery
-    key = ship.place_of_delivery.upper().strip()
-    df["PODel_up"] = df["PlaceOfDelivery"].astype(str).str.upper()
-    df = df[df["PODel_up"].str.contains(key, na=False)]
-    if df.empty:
-        return {"error": "NO_RATE", "message": "Không match PlaceOfDelivery."}
+    # 2. Filter Place of Delivery (substring, không khớp thì gần đúng theo trigram, cùng bang)
+    pos = np.flatnonzero(index.place.codes_lookup(ship.place_of_delivery)[profile.place_codes])
+    tr.stage("place", profile.rows.size, pos.size)
+    if pos.size == 0:
+        hint = index.place.suggestion_text(ship.place_of_delivery, index.codes_at(index.place, profile.rows))
+        return {"error": "NO_RATE", "message": "Không match PlaceOfDelivery." + hint}
 
     # 3. Filter POD (optional)
     if ship.pod:
-        pk = ship.pod.upper().strip()
-        df["POD_up"] = df["POD"].astype(str).str.upper()
-        df = df[df["POD_up"].str.contains(pk, na=False)]
-        if df.empty:
-            return {"error": "NO_RATE", "message": "Không match POD."}
+        n_in, pos_place = pos.size, pos
+        pos = pos[index.pod.codes_lookup(ship.pod)[profile.pod_codes[pos]]]
+        tr.stage("pod", n_in, pos.size)
+        if pos.size == 0:
+            hint = index.pod.suggestion_text(ship.pod, index.codes_at(index.pod, profile.rows[pos_place]))
+            return {"error": "NO_RATE", "message": "Không match POD." + hint}
 
     # 4. Validity filter
-    df = filter_by_validity(df, ship.cargo_ready_date)
-    if df.empty:
+    n_in = pos.size
+    pos = pos[profile.valid[pos]]
+    tr.stage("validity", n_in, pos.size)
+    if pos.size == 0:
         return {"error": "NO_RATE", "message": "Hết hiệu lực."}
 
     # 5. FAK/REEFER + SOC filtering
-    df["Routing_up"] = df["RoutingNote"].astype(str).fillna("").str.upper().str.strip()
-    df["Commodity_up"] = df["CommodityType"].astype(str).fillna("").str.upper().str.strip()
-
-    if not ship.is_reefer() and not ship.is_soc:
-        pass
-    elif not ship.is_reefer() and ship.is_soc:
-        combined_text = df["Routing_up"].fillna("") + " " + df["Commodity_up"].fillna("")
-        df = df[~combined_text.str.contains(r"\bSOC\b", na=False)]
-    elif ship.is_reefer():
-        df = df[df["Commodity_up"].str.contains("REEFER", na=False)]
-
-    # 🔁 ⬇️ THÊM BƯỚC MAPPING TẠI ĐÂY
-    df = map_reefer_containers(df)
-
-    # 6. Filter lowest price per carrier
-    if "Total" not in df.columns:
-        def calc_tmp_total(row):
-            val = 0
-            for c in req.containers:
-                r = row.get(c.type, None)
-                if isinstance(r, (float, int)):
-                    val += r
-            return val
-        df["Total"] = df.apply(calc_tmp_total, axis=1)
-
-    df = df.sort_values(["Carrier", "Total"], ascending=[True, True])
-    df = df.groupby("Carrier", as_index=False).first()
-
-    # 7. Check rate availability
-    def has_all_rates(row):
-        for c in req.containers:
-            rate = row.get(c.type, None)
-            if rate is None or (isinstance(rate, float) and pd.isna(rate)):
-                return False
-        return True
-    df = df[df.apply(has_all_rates, axis=1)].copy()
-    if df.empty:
+    n_in = pos.size
+    pos = pos[profile.allowed[pos]]
+    tr.stage("commodity_soc", n_in, pos.size)
+
+    # 5b. Preferred / excluded carriers (EngineOptions)
+    n_in = pos.size
+    if opt.preferred_carriers:
+        pos = pos[np.isin(profile.rows[pos], index.filter_carriers(profile.rows[pos], opt.preferred_carriers))]
+        if pos.size == 0:
+            return {"error": "NO_RATE", "message": f"Không có giá của các hãng: {opt.preferred_carriers}."}
+    if opt.excluded_carriers:
+        pos = pos[np.isin(profile.rows[pos], index.filter_carriers(profile.rows[pos], opt.excluded_carriers, exclude=True))]
+        if pos.size == 0:
+            return {"error": "NO_RATE", "message": "Tất cả giá đều thuộc các hãng bị exclude."}
+    if opt.preferred_carriers or opt.excluded_carriers:
+        tr.stage("carrier", n_in, pos.size)
+    rows = profile.rows[pos]
+
+    # 6. Ma trận giá (rows x container) + reefer mapping theo cột
+    qty = np.array([c.quantity for c in req.containers], dtype=np.float64)
+    rates = profile.rates[pos]
+
+    # 7. Check rate availability + giá thấp nhất mỗi carrier
+    totals = rates @ qty   # thiếu giá container nào -> NaN -> bị loại
+    best = index.cheapest_per_carrier(rows, totals)
+    tr.stage("rate_availability", rows.size, best.size)
+    if best.size == 0:
         return {"error": "NO_RATE", "message": "Thiếu giá container."}
 
-    # 8. Final price calc (with markup)
-    def calc_total(row):
-        total = 0
-        for c in req.containers:
-            rate = row[c.type]
-            carrier_key = str(row["Carrier"]).upper()
-            markup = opt.markup_map.get(carrier_key, 0) if hasattr(opt, "markup_map") else 0
-            total += (rate + markup) * c.quantity
-        return total
-    df["Total"] = df.apply(calc_total, axis=1)
+    # 8. Final price calc (with markup): ma trận markup đã compile, lấy theo dòng được chọn
+    markup = markup_rules(opt).compile(
+        index,
+        [c.type for c in req.containers],
+        tier=req.customer.tier,
+        customer=req.customer.name,
+        on_date=ship.cargo_ready_date,
+    )[rows[best]]
+    final_totals = totals[best] + markup @ qty
+    tr.stage("costing", best.size, best.size)
 
     # 9. Sort and limit result
-    df = df.sort_values("Total").reset_index(drop=True)
     max_opts = opt.max_options_per_quote or 10
-    df_top = df.head(max_opts)
+    pick = top_n(final_totals, max_opts)
+    top_rows = rows[best[pick]]
+    top_rates = rates[best[pick]] + markup[pick]
+    top_totals = final_totals[pick]
+    tr.stage("ranking", best.size, pick.size)
 
-    # 10. Build result
-    options = []
-    for idx, row in df_top.iterrows():
-        ct = {}
-        for c in req.containers:
-            if c.type in row:
-                ct[c.type] = float(row[c.type])
-
-        carrier_key = str(row["Carrier"]).upper()
-        carrier_markup = opt.markup_map.get(carrier_key, 0) if hasattr(opt, "markup_map") else 0
-        ct_with_markup = {k: v + carrier_markup for k, v in ct.items()}
-
-        sched = get_schedule_for(
-            carrier=str(row["Carrier"]),
+    # 10. Schedule cho mọi option trong 1 lần join (chỉ các cặp chưa có trong memo của batch)
+    top_records = master_df.iloc[top_rows].to_dict("records")
+    sched_keys = [
+        (str(row["Carrier"]), ship.pol, str(row["POD"]), ship.cargo_ready_date) for row in top_records
+    ]
+    missing = list(dict.fromkeys(k for k in sched_keys if k not in schedules))
+    if missing:
+        found = get_schedules_for(
+            [{"carrier": k[0], "pod": k[2]} for k in missing],
             pol=ship.pol,
-            pod_code=str(row["POD"]),
             cargo_ready_iso=ship.cargo_ready_date,
         )
+        for key, sched in zip(missing, found.to_dict("records")):
+            schedules[key] = sched
+    tr.stage("schedule_join", len(sched_keys), len(sched_keys), lookups=len(missing))
+
+    # 11. Build result
+    options = []
+    for idx, (row_id, row, sched_key) in enumerate(zip(top_rows.tolist(), top_records, sched_keys)):
+        ct_with_markup = {c.type: float(top_rates[idx, j]) for j, c in enumerate(req.containers)}
+        sched = schedules[sched_key]
 
         options.append({
             "index": idx + 1,
@@ -166,9 +258,10 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
             "RoutingNote": row.get("RoutingNote", "-"),
             "CommodityType": row.get("CommodityType", "-"),
             "container_rates": ct_with_markup,
-            "total_ocean_amount": float(row["Total"]),
+            "total_ocean_amount": float(top_totals[idx]),
             "currency": opt.currency,
             # ====== NEW: Valid đưa thẳng về UI ======
+            "source_row": row_id,   # vị trí dòng trong Master (master_df.iloc)
             "effective_date": row.get("EffectiveDate"),
             "expiration_date": row.get("ExpirationDate"),
             "valid_label": _valid_label(row.get("EffectiveDate"), row.get("ExpirationDate")),
@@ -182,7 +275,9 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
         "commodity_type": ship.commodity_type,
         "containers_summary": ", ".join(f"{c.quantity} x {c.type}" for c in req.containers),
         "is_soc": ship.is_soc,
+        "place_match": index.place.lookup_mode(ship.place_of_delivery),   # exact | fuzzy
     }
+    tr.stage("build_result", len(options), len(options))
 
     return {
         "quote_ref_no": f"QT-{date.today().strftime('%Y%m%d')}",
@@ -1,10 +1,35 @@
-from pathlib import Path
+import threading
 import pandas as pd
 
-# Đường dẫn file Shipment
-DATA_PATH = Path(
-    r"C:\Users\Nelson\OneDrive\Desktop\2. Areas\PricingSystem\App\DATA\Shipments.xlsx"
-)
+from .shipment_store import SHIPMENTS_FILE, get_shipment_store
+
+# Đường dẫn file Shipment (dữ liệu đọc qua shipment store, import lại khi file đổi)
+DATA_PATH = SHIPMENTS_FILE
+
+# sheet -> (version sheet trong store, DataFrame đã chuẩn hóa)
+_SHEET_CACHE = {}
+_SHEET_CACHE_LOCK = threading.Lock()
+
+def _prepare_sheet(sheet_name, df):
+    """Chuẩn hóa 1 sheet tháng cho dashboard / KPI."""
+    # Ngày đã parse (dayfirst) lúc import vào store; ô không phải ngày -> NaT
+    for col in ["ETD", "ETA", "ATA"]:
+        df[col] = pd.to_datetime(df[col], errors="coerce")
+
+    # Thêm label tháng từ tên sheet
+    df["Month"] = sheet_name
+
+    # Chuẩn hóa lại cột margin
+    if "Profit" in df.columns:
+        df["margin"] = df["Profit"]
+    else:
+        df["margin"] = 0
+
+    # Tạo period tháng để dùng cho KPI
+    df["ETD_Month"] = df["ETD"].dt.to_period("M")
+
+    return df
+
 
 def load_all_sheets():
     """
@@ -16,37 +41,23 @@ def load_all_sheets():
         ...
     }
     """
-
-    if not DATA_PATH.exists():
-        raise FileNotFoundError(f"[ERROR] Không tìm thấy file Excel: {DATA_PATH}")
-
-    xls = pd.ExcelFile(DATA_PATH)
-    sheet_data = {}
-
-    for sheet_name in xls.sheet_names:
-        # Đọc sheet, parse ngày nhưng KHÔNG dùng dayfirst ở đây
-        df = pd.read_excel(
-            xls,
-            sheet_name=sheet_name,
-            parse_dates=["ETD", "ETA", "ATA"],   # parse thẳng
-        )
-
-        # Xử lý ngày theo DD/MM/YYYY (nếu cần)
-        for col in ["ETD", "ETA", "ATA"]:
-            df[col] = pd.to_datetime(df[col], dayfirst=True, errors="coerce")
-
-        # Thêm label tháng từ tên sheet
-        df["Month"] = sheet_name
-
-        # Chuẩn hóa lại cột margin
-        if "Profit" in df.columns:
-            df["margin"] = df["Profit"]
-        else:
-            df["margin"] = 0
-
-        # Tạo period tháng để dùng cho KPI
-        df["ETD_Month"] = df["ETD"].dt.to_period("M")
-
-        sheet_data[sheet_name] = df
-
-    return sheet_data
+    # Chỉ đọc lại (từ shipment store) các sheet có version đổi, sheet khác dùng frame đã cache
+    store = get_shipment_store()
+    versions = store.sheet_versions()
+
+    with _SHEET_CACHE_LOCK:
+        stale = [name for name, version in versions.items() if _SHEET_CACHE.get(name, (None,))[0] != version]
+    fresh = store.load_all(sheets=stale, sync=False) if stale else {}
+
+    with _SHEET_CACHE_LOCK:
+        for name, df in fresh.items():
+            _SHEET_CACHE[name] = (versions[name], _prepare_sheet(name, df))
+        for name in list(_SHEET_CACHE):
+            if name not in versions:
+                del _SHEET_CACHE[name]
+        return {name: _SHEET_CACHE[name][1].copy() for name in versions if name in _SHEET_CACHE}
+
+
+def shipment_data_version():
+    """Version dữ liệu shipment hiện tại – dùng làm key cho st.cache_data."""
+    return get_shipment_store().version
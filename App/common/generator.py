@@ -1,10 +1,18 @@
 # ==================== GENERATOR.PY (FINAL CLEAN VERSION) ====================
 
 from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import os
 
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen.canvas import Canvas, _digester
+from reportlab.lib.rl_accel import asciiBase85Decode
+from reportlab.lib.utils import ImageReader
 from reportlab.platypus import (
     SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer, Image
 )
@@ -19,32 +27,64 @@ from .models import BASE_DIR, OUTPUT_DIR
 PDF_DIR = OUTPUT_DIR / "Quotes_Client_PDF"
 LOGO = BASE_DIR / "Assets" / "logo_pudong.png"
 
+# Stream (logo, nội dung trang) ghi dạng nhị phân, không mã hoá ASCII85:
+# ASCII85 viết bằng Python thuần chiếm ~1/2 thời gian render và làm file to hơn.
+# Chỉ áp dụng cho canvas của quote PDF (_BinaryCanvas), không đụng rl_config
 
-def generate_quote_pdf(result: Dict[str, Any]) -> str:
+# Batch ít hơn ngưỡng này thì render tuần tự (khởi động process pool không đáng)
+PARALLEL_MIN_BATCH = 4
 
-    os.makedirs(PDF_DIR, exist_ok=True)
 
-    ref = result["quote_ref_no"]
-    customer = result["summary"]["customer_name"]
-    filename = f"{ref} - {customer}.pdf"
-    pdf_path = PDF_DIR / filename
+# ================= TÀI NGUYÊN DÙNG CHUNG (cache / process) =================
 
-    doc = SimpleDocTemplate(
-        str(pdf_path),
-        pagesize=A4,
-        leftMargin=18*mm,
-        rightMargin=18*mm,
-        topMargin=12*mm,
-        bottomMargin=12*mm
-    )
+@dataclass(frozen=True)
+class _RenderAssets:
+    normal: ParagraphStyle
+    title: ParagraphStyle
+    table_style: TableStyle
+    logo_bytes: Optional[bytes]
+    logo_size: Optional[tuple]   # (width, height) đã scale vào khung 60x20mm
 
+
+@lru_cache(maxsize=1)
+def _render_assets() -> _RenderAssets:
+    """
+    Style, TableStyle và logo (đọc + scale 1 lần) cho mọi PDF.
+    Mỗi process (kể cả worker của batch) chỉ chuẩn bị 1 lần.
+    """
     styles = getSampleStyleSheet()
     normal = styles["Normal"]
     title = ParagraphStyle("title", parent=normal, fontSize=18, alignment=1)
 
+    table_style = TableStyle([
+        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#003366")),
+        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+        ("GRID", (0,0), (-1,-1), 0.3, colors.grey)
+    ])
+
+    logo_bytes, logo_size = None, None
+    if LOGO.exists():
+        logo_bytes = LOGO.read_bytes()
+        img = Image(BytesIO(logo_bytes))
+        img._restrictSize(60*mm, 20*mm)
+        logo_size = (img.drawWidth, img.drawHeight)
+
+    return _RenderAssets(normal, title, table_style, logo_bytes, logo_size)
+
+
+def quote_pdf_filename(result: Dict[str, Any]) -> str:
+    ref = result["quote_ref_no"]
+    customer = result["summary"]["customer_name"]
+    return f"{ref} - {customer}.pdf"
+
+
+def _build_story(result: Dict[str, Any], assets: _RenderAssets) -> List[Any]:
+    normal = assets.normal
+    customer = result["summary"]["customer_name"]
+
     story = []
 
-    story.append(Paragraph("QUOTATION SUMMARY", title))
+    story.append(Paragraph("QUOTATION SUMMARY", assets.title))
     story.append(Spacer(1, 10))
 
     # HEADER
@@ -75,20 +115,138 @@ def generate_quote_pdf(result: Dict[str, Any]) -> str:
         ])
 
     tbl = Table(data, colWidths=[35*mm, 30*mm, 20*mm, 20*mm, 20*mm, 25*mm])
-    tbl.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#003366")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-        ("GRID", (0,0), (-1,-1), 0.3, colors.grey)
-    ]))
+    tbl.setStyle(assets.table_style)
 
     story.append(tbl)
     story.append(Spacer(1, 15))
 
     # FOOTER
-    if LOGO.exists():
-        img = Image(str(LOGO))
-        img._restrictSize(60*mm, 20*mm)
-        story.append(img)
+    if assets.logo_bytes is not None:
+        width, height = assets.logo_size
+        story.append(Image(BytesIO(assets.logo_bytes), width=width, height=height))
+
+    return story
+
+
+# ================= RENDER =================
+
+# Ảnh đã chuyển sang nhị phân, theo tên XObject (digest nội dung) -> (ảnh, softmask).
+# PDF sau dựng lại object từ đây, không load + mã hoá lại logo mỗi lần render
+_BINARY_IMAGES: Dict[str, tuple] = {}
+
+
+def _strip_a85(img: pdfdoc.PDFImageXObject) -> None:
+    if "ASCII85Decode" in img._filters:
+        img.streamContent = asciiBase85Decode(img.streamContent)
+        img._filters = tuple(f for f in img._filters if f != "ASCII85Decode")
+
+
+def _image_state(img: pdfdoc.PDFImageXObject) -> Dict[str, Any]:
+    return {k: v for k, v in vars(img).items() if k not in ("XObjects", "_smask")}
+
+
+def _image_from_state(state: Dict[str, Any]) -> pdfdoc.PDFImageXObject:
+    img = pdfdoc.PDFImageXObject(state["name"])   # source=None: không đọc ảnh
+    img.__dict__.update(state)
+    return img
+
+
+class _BinaryCanvas(Canvas):
+    """
+    Canvas ghi page stream / ảnh dạng nhị phân (chỉ FlateDecode).
+    reportlab không có tuỳ chọn useA85 theo document nên sửa trên từng object
+    lúc canvas đăng ký XObject (cả page lẫn ảnh đều đi qua _setXObjects).
+    """
+
+    def drawImage(self, image, x, y, width=None, height=None, mask=None, *args, **kwargs):
+        if isinstance(image, ImageReader):
+            self._register_cached_image(image, mask)
+        return super().drawImage(image, x, y, width, height, mask, *args, **kwargs)
+
+    def _register_cached_image(self, image: ImageReader, mask) -> None:
+        # Đặt tên giống Canvas.drawImage; tên lệch thì chỉ là cache miss
+        rawdata = image.getRGBData()   # nạp luôn kênh alpha (_dataA)
+        alpha = image._dataA
+        mdata = alpha.getRGBData() if mask == "auto" and alpha else str(mask).encode("utf8")
+        name = _digester(rawdata + mdata)
+        cached = _BINARY_IMAGES.get(name)
+        reg_name = self._doc.getXObjectName(name)
+        if cached is None or reg_name in self._doc.idToObject:
+            return
+        img_state, smask_state = cached
+        img = _image_from_state(img_state)
+        self._doc.Reference(img, reg_name)
+        self._doc.addForm(name, img)
+        if smask_state is not None:
+            smask = _image_from_state(smask_state)
+            img.smask = self._doc.Reference(smask, self._doc.getXObjectName(smask.name))
+
+    def _setXObjects(self, thing):
+        super()._setXObjects(thing)
+        if isinstance(thing, pdfdoc.PDFPage):
+            if thing.compression and thing.stream and not thing.Contents:
+                contents = pdfdoc.PDFStream(content=thing.stream, filters=[pdfdoc.PDFZCompress])
+                contents.__Comment__ = "page stream"
+                thing.Contents = contents
+        elif isinstance(thing, pdfdoc.PDFImageXObject) and "ASCII85Decode" in thing._filters:
+            # ảnh mới tạo (softmask đi kèm được xử lý luôn, trước khi tới lượt nó)
+            smask = getattr(thing, "_smask", None)
+            _strip_a85(thing)
+            if smask is not None:
+                _strip_a85(smask)
+            _BINARY_IMAGES[thing.name] = (
+                _image_state(thing), smask and _image_state(smask)
+            )
+
+
+def render_quote_pdf(result: Dict[str, Any]) -> bytes:
+    """Render PDF ra bytes trong bộ nhớ (dùng cho st.download_button)."""
+    buf = BytesIO()
+    doc = SimpleDocTemplate(
+        buf,
+        pagesize=A4,
+        leftMargin=18*mm,
+        rightMargin=18*mm,
+        topMargin=12*mm,
+        bottomMargin=12*mm
+    )
+    story = _build_story(result, _render_assets())
+    doc.build(story, canvasmaker=_BinaryCanvas)
+    return buf.getvalue()
 
-    doc.build(story)
+
+def generate_quote_pdf(result: Dict[str, Any], out_dir: Path | str | None = None) -> str:
+
+    out_dir = out_dir or PDF_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    pdf_path = Path(out_dir) / quote_pdf_filename(result)
+
+    # Ghi file tạm rồi replace -> không bao giờ để lại PDF dở dang
+    tmp_path = pdf_path.with_name(pdf_path.name + ".tmp")
+    tmp_path.write_bytes(render_quote_pdf(result))
+    os.replace(tmp_path, pdf_path)
     return str(pdf_path)
+
+
+def _generate_quote_pdf_worker(args: tuple) -> str:
+    result, out_dir = args
+    return generate_quote_pdf(result, out_dir)
+
+
+def generate_quote_pdfs(
+    results: List[Dict[str, Any]],
+    out_dir: Path | str | None = None,
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Render nhiều quote 1 lần (vd gửi rate sheet cuối tháng cho nhiều khách).
+    Batch đủ lớn thì chia cho process pool; trả về path PDF theo đúng thứ tự input.
+    """
+    jobs = [(r, str(out_dir or PDF_DIR)) for r in results]
+    if max_workers == 1 or len(jobs) < PARALLEL_MIN_BATCH:
+        return [_generate_quote_pdf_worker(job) for job in jobs]
+
+    workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_generate_quote_pdf_worker, jobs, chunksize=chunksize))
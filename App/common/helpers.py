@@ -13,8 +13,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "DATA"
 RAW_DIR = BASE_DIR / "RAW"
 
-# Provide MASTER_FILE for upload_page compatibility
-MASTER_FILE = DATA_DIR / "MasterFullPricing.xlsx"
+# MASTER_FILE dùng chung với common.models (Data/Master_FullPricing.xlsx)
+from .models import MASTER_FILE, derive_reefer_columns
+from .master_provider import get_master_provider
 
 # --------------------------------------------
 # SAFE RERUN
@@ -28,15 +29,18 @@ def safe_rerun():
 # --------------------------------------------
 def load_master():
     if not MASTER_FILE.exists():
-        raise FileNotFoundError(f"MasterFullPricing not found at {MASTER_FILE}")
+        raise FileNotFoundError(f"Master_FullPricing not found at {MASTER_FILE}")
 
-    df = pd.read_excel(MASTER_FILE)
+    df = pd.read_excel(MASTER_FILE, sheet_name="Master")
     df.columns = df.columns.str.strip()
-    return df
+    return derive_reefer_columns(df)
 
 # --------------------------------------------
 # CACHE VERSION
 # --------------------------------------------
-@st.cache_data(show_spinner=False)
 def load_master_cached():
-    return load_master()
+    """
+    Master dùng chung cho mọi session (load 1 lần / version file,
+    tự reload ở background khi Normalize publish file mới).
+    """
+    return get_master_provider(MASTER_FILE).get().frame
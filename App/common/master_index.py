@@ -0,0 +1,438 @@
+# ==================== MASTER_INDEX.PY ====================
+"""
+Index dựng sẵn cho Master pricing.
+
+Mục tiêu: mỗi request quote KHÔNG phải copy cả Master rồi
+`astype(str).str.upper()` từng cột nữa. Index được build 1 lần cho mỗi
+version Master và giữ:
+
+  - POL chuẩn hóa  -> mảng row id
+  - PlaceOfDelivery / POD: từ điển giá trị unique + inverted token index,
+    match substring trên tập unique (nhỏ) rồi nhớ kết quả theo key;
+    không khớp thì fallback trigram (place_search.TrigramIndex)
+  - Carrier / CommodityType / RoutingNote dạng mã (codes) + cờ SOC / REEFER
+  - ExpirationDate đã parse sẵn
+
+Row id = vị trí dòng (0..n-1) trong Master, dùng với `master_df.iloc[rows]`.
+Master được coi là read-only sau khi build index.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .models import cargo_timestamp
+from .place_search import TrigramIndex
+
+
+_TOKEN_SPLIT = re.compile(r"[^A-Z0-9]+")
+_SOC_WORD = re.compile(r"\bSOC\b")
+
+# Giới hạn số key substring được nhớ cho mỗi cột
+_MEMO_LIMIT = 4096
+
+
+def _upper_strip(series: pd.Series) -> pd.Series:
+    s = series.where(series.notna(), "").astype(str)
+    return s.str.upper().str.strip()
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in _TOKEN_SPLIT.split(text) if t]
+
+
+class _Vocab:
+    """
+    1 cột chuỗi đã chuẩn hóa (UPPER + strip):
+      - codes[row]   : mã giá trị unique của từng dòng
+      - values[code] : giá trị unique
+      - postings     : code -> mảng row id (đã sort)
+      - tokens       : token -> set code (inverted index)
+    """
+
+    def __init__(self, series: pd.Series):
+        norm = _upper_strip(series)
+        codes, uniques = pd.factorize(norm, sort=False)
+        self.codes = codes.astype(np.int32)
+        self.values = np.asarray(uniques, dtype=object)
+
+        order = np.argsort(self.codes, kind="stable")
+        bounds = np.searchsorted(self.codes[order], np.arange(len(self.values) + 1))
+        self.postings = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.values))]
+        self._code_of = {v: i for i, v in enumerate(self.values)}
+
+        self.tokens: Dict[str, set] = {}
+        for code, value in enumerate(self.values):
+            for tok in _tokens(value):
+                self.tokens.setdefault(tok, set()).add(code)
+
+        self._memo: Dict[tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._fuzzy: Optional[TrigramIndex] = None
+
+    # ---------- lookup theo giá trị ----------
+    def rows_equal(self, value: str) -> np.ndarray:
+        code = self._code_of.get(str(value or "").upper().strip())
+        if code is None:
+            return np.empty(0, dtype=np.intp)
+        return self.postings[code]
+
+    def codes_matching(self, name: str, predicate: Callable[[str], bool]) -> np.ndarray:
+        """Mảng bool theo code, đánh giá predicate 1 lần / giá trị unique (có nhớ)."""
+        key = ("pred", name)
+        hit = self._memo.get(key)
+        if hit is None:
+            hit = np.fromiter((bool(predicate(v)) for v in self.values), dtype=bool, count=len(self.values))
+            self._remember(key, hit)
+        return hit
+
+    def codes_containing(self, key: str) -> np.ndarray:
+        """
+        Mảng bool theo code: giá trị chứa `key` (substring, literal).
+        Token nằm trọn bên trong key (không phải token đầu/cuối) bắt buộc
+        phải là token của giá trị -> dùng inverted index để thu hẹp ứng viên.
+        """
+        key = str(key or "").upper().strip()
+        memo_key = ("contains", key)
+        hit = self._memo.get(memo_key)
+        if hit is not None:
+            return hit
+
+        candidates: Optional[set] = None
+        inner = _tokens(key)[1:-1]
+        for tok in inner:
+            codes = self.tokens.get(tok, set())
+            candidates = set(codes) if candidates is None else candidates & codes
+            if not candidates:
+                break
+
+        hit = np.zeros(len(self.values), dtype=bool)
+        pool = range(len(self.values)) if candidates is None else candidates
+        for code in pool:
+            if key in self.values[code]:
+                hit[code] = True
+
+        self._remember(memo_key, hit)
+        return hit
+
+    @property
+    def fuzzy(self) -> TrigramIndex:
+        """Trigram index trên các giá trị unique, build lazy 1 lần."""
+        if self._fuzzy is None:
+            with self._lock:
+                if self._fuzzy is None:
+                    self._fuzzy = TrigramIndex(self.values)
+        return self._fuzzy
+
+    def codes_lookup(self, key: str) -> np.ndarray:
+        """
+        Như codes_containing, nhưng khi substring literal không khớp giá trị
+        nào thì fallback sang trigram ("CHICAGO,IL" ~ "CHICAGO (IL)", gõ sai);
+        chỉ nhận giá trị cùng bang / tỉnh với key (TrigramIndex.best_mask).
+        """
+        hit = self.codes_containing(key)
+        if hit.any():
+            return hit
+        memo_key = ("fuzzy", str(key or "").upper().strip())
+        fuzzy = self._memo.get(memo_key)
+        if fuzzy is None:
+            fuzzy = self.fuzzy.best_mask(key)
+            self._remember(memo_key, fuzzy)
+        return fuzzy
+
+    def lookup_mode(self, key: str) -> str:
+        """'exact' | 'fuzzy' | 'none' cho key (dùng memo của codes_lookup)."""
+        if self.codes_containing(key).any():
+            return "exact"
+        return "fuzzy" if self.codes_lookup(key).any() else "none"
+
+    def search(self, query: str, limit: int = 10, among: Optional[np.ndarray] = None) -> List[tuple]:
+        """[(giá trị, điểm)] gần đúng nhất cho ô search."""
+        return [(self.values[i], score) for i, score in self.fuzzy.search(query, limit=limit, among=among)]
+
+    def suggestion_text(self, query: str, among: Optional[np.ndarray] = None, limit: int = 3) -> str:
+        """' Gợi ý: A; B.' (giá trị gần đúng nhất) để ghép vào message NO_RATE; '' nếu không có."""
+        values = [v for v, _ in self.search(query, limit=limit, among=among)]
+        return f" Gợi ý: {'; '.join(values)}." if values else ""
+
+    def _remember(self, key: tuple, value: np.ndarray) -> None:
+        with self._lock:
+            if len(self._memo) >= _MEMO_LIMIT:
+                self._memo.clear()
+            self._memo[key] = value
+
+    # ---------- lọc tập row ----------
+    def select(self, rows: np.ndarray, code_mask: np.ndarray) -> np.ndarray:
+        return rows[code_mask[self.codes[rows]]]
+
+    def values_at(self, rows: np.ndarray) -> np.ndarray:
+        return self.values[self.codes[rows]]
+
+
+class MasterIndex:
+    """
+    Index read-only cho 1 version Master.
+    Tất cả hàm lọc nhận và trả về mảng row id (vị trí dòng, đã sort).
+    """
+
+    def __init__(self, master_df: pd.DataFrame, version: Optional[str] = None):
+        self.n_rows = len(master_df)
+        self._version = version
+        self._lock = threading.Lock()
+        self.all_rows = np.arange(self.n_rows, dtype=np.intp)
+
+        def col(name: str) -> pd.Series:
+            if name in master_df.columns:
+                return master_df[name]
+            return pd.Series([""] * self.n_rows, index=master_df.index)
+
+        self.pol = _Vocab(col("POL"))
+        self.place = _Vocab(col("PlaceOfDelivery"))
+        self.pod = _Vocab(col("POD"))
+        self.carrier = _Vocab(col("Carrier"))
+        self.commodity = _Vocab(col("CommodityType"))
+        self.routing = _Vocab(col("RoutingNote"))
+
+        # Cờ SOC:
+        # - soc_routing: RoutingNote chứa "SOC" (Engine)
+        # - soc_word   : RoutingNote + CommodityType có từ "SOC" (cost_engine)
+        routing_soc = self.routing.codes_matching("soc", lambda v: "SOC" in v)
+        self.soc_routing = routing_soc[self.routing.codes]
+        routing_word = self.routing.codes_matching("soc_word", lambda v: bool(_SOC_WORD.search(v)))
+        commodity_word = self.commodity.codes_matching("soc_word", lambda v: bool(_SOC_WORD.search(v)))
+        self.soc_word = routing_word[self.routing.codes] | commodity_word[self.commodity.codes]
+
+        reefer = self.commodity.codes_matching("reefer", lambda v: "REEFER" in v)
+        self.is_reefer = reefer[self.commodity.codes]
+
+        # (POL, POD, Place, Carrier) -> row id đầu tiên, build lazy khi cần
+        self._lanes: Optional[Dict[tuple, int]] = None
+
+        # Cột giá container: parse float 1 lần / cột, lấy lazy theo tên (+ rule reefer)
+        # (giữ weakref để index không níu Master cũ trong bộ nhớ)
+        self._frame_ref = weakref.ref(master_df)
+        self._rates: Dict[object, np.ndarray] = {}
+
+        if "ExpirationDate" in master_df.columns:
+            exp = pd.to_datetime(master_df["ExpirationDate"], errors="coerce", dayfirst=True)
+            self.expiration = exp.dt.normalize().to_numpy(dtype="datetime64[ns]")
+        else:
+            self.expiration = None
+
+    @property
+    def version(self) -> str:
+        """
+        Version của Master: do người build truyền vào (vd hash file), nếu không
+        thì là fingerprint nội dung, tính 1 lần khi cần.
+        """
+        if self._version is None:
+            frame = self._frame_ref()
+            self._version = master_fingerprint(frame) if frame is not None else "gone"
+        return self._version
+
+    # ---------- filters ----------
+    def rows_for_pol(self, pol: str) -> np.ndarray:
+        return self.pol.rows_equal(pol)
+
+    def filter_place(self, rows: np.ndarray, key: str) -> np.ndarray:
+        return self.place.select(rows, self.place.codes_lookup(key))
+
+    def filter_pod(self, rows: np.ndarray, key: str) -> np.ndarray:
+        return self.pod.select(rows, self.pod.codes_lookup(key))
+
+    def codes_at(self, vocab: "_Vocab", rows: np.ndarray) -> np.ndarray:
+        """Mask bool theo code của `vocab`: các giá trị xuất hiện trong `rows`."""
+        mask = np.zeros(len(vocab.values), dtype=bool)
+        mask[vocab.codes[rows]] = True
+        return mask
+
+    def places_for_pol(self, pol: str) -> List[str]:
+        """PlaceOfDelivery (UPPER) có giá từ POL, sort A-Z."""
+        return sorted(v for v in self.place.values[self.codes_at(self.place, self.rows_for_pol(pol))].tolist() if v)
+
+    def pods_for_places(self, places: List[str]) -> List[str]:
+        """POD (UPPER) của các PlaceOfDelivery (so khớp đúng), sort A-Z."""
+        parts = [self.place.rows_equal(p) for p in places]
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+        return sorted(v for v in self.pod.values[self.codes_at(self.pod, rows)].tolist() if v)
+
+    def search_places(self, query: str, pol: Optional[str] = None, limit: int = 10) -> List[tuple]:
+        """Ô search Place: [(place, điểm)] gần đúng nhất, giới hạn theo POL nếu có."""
+        among = self.codes_at(self.place, self.rows_for_pol(pol)) if pol else None
+        return self.place.search(query, limit=limit, among=among)
+
+    def filter_validity(self, rows: np.ndarray, cargo_iso: Optional[str]) -> np.ndarray:
+        """Giống models.filter_by_validity: giữ NaT hoặc ExpirationDate >= ngày cargo."""
+        if self.expiration is None:
+            return rows
+        cargo_ts = np.datetime64(cargo_timestamp(cargo_iso).to_datetime64(), "ns")
+        exp = self.expiration[rows]
+        return rows[np.isnat(exp) | (exp >= cargo_ts)]
+
+    def filter_carriers(self, rows: np.ndarray, carriers: List[str], exclude: bool = False) -> np.ndarray:
+        wanted = {str(c).upper().strip() for c in carriers}
+        code_mask = np.fromiter((v in wanted for v in self.carrier.values), dtype=bool, count=len(self.carrier.values))
+        if exclude:
+            code_mask = ~code_mask
+        return self.carrier.select(rows, code_mask)
+
+    def carriers_at(self, rows: np.ndarray) -> np.ndarray:
+        return self.carrier.values_at(rows)
+
+    # ---------- lane lookup ----------
+    def lane_row(self, pol: str, pod: str, place: str, carrier: str) -> Optional[int]:
+        """
+        Row id đầu tiên khớp đúng (POL, POD, PlaceOfDelivery, Carrier),
+        so sánh UPPER + strip. None nếu không có.
+        """
+        if self._lanes is None:
+            keys = pd.DataFrame({
+                "pol": self.pol.codes,
+                "pod": self.pod.codes,
+                "place": self.place.codes,
+                "carrier": self.carrier.codes,
+            }).drop_duplicates()
+            with self._lock:
+                self._lanes = dict(zip(map(tuple, keys.to_numpy().tolist()), keys.index.tolist()))
+
+        codes = []
+        for vocab, value in ((self.pol, pol), (self.pod, pod), (self.place, place), (self.carrier, carrier)):
+            code = vocab._code_of.get(str(value if value is not None else "").upper().strip())
+            if code is None:
+                return None
+            codes.append(code)
+        return self._lanes.get(tuple(codes))
+
+    # ---------- giá container ----------
+    def rate_column(self, cont_type: str, rules: tuple = ()) -> np.ndarray:
+        """
+        Cột giá float64 cho toàn Master (NaN nếu thiếu cột / không phải số).
+        rules: ReeferRule (models) áp cho cột `cont_type`, tính 1 lần / version
+        Master -> cột reefer đúng dù Master chưa qua derive_reefer_columns.
+        """
+        rules = tuple(r for r in rules if r.target == cont_type)
+        key = (cont_type, rules) if rules else cont_type
+        col = self._rates.get(key)
+        if col is not None:
+            return col
+        if rules:
+            col = self._reefer_column(cont_type, rules)
+        else:
+            frame = self._frame_ref()
+            if frame is not None and cont_type in frame.columns:
+                col = pd.to_numeric(frame[cont_type], errors="coerce").to_numpy(dtype=np.float64)
+            else:
+                col = np.full(self.n_rows, np.nan)
+        self._rates[key] = col
+        return col
+
+    def rate_matrix(self, rows: np.ndarray, types: List[str], rules: tuple = ()) -> np.ndarray:
+        """
+        Ma trận giá (len(rows) x len(types)).
+        rules: ReeferRule cho 20RF / 40RF (REEFER_COLUMN_RULES, ENGINE_REEFER_RULES...).
+        """
+        out = np.empty((rows.size, len(types)), dtype=np.float64)
+        for j, cont_type in enumerate(types):
+            out[:, j] = self.rate_column(cont_type, rules)[rows]
+        return out
+
+    def _reefer_column(self, target: str, rules: tuple) -> np.ndarray:
+        """Như models.derive_reefer_columns nhưng trên mảng của index (không đụng Master)."""
+        col = self.rate_column(target)
+        for rule in rules:
+            value = self.rate_column(rule.sources[0])
+            for src in rule.sources[1:]:
+                value = np.where(np.isnan(value), self.rate_column(src), value)
+            hit = np.ones(self.n_rows, dtype=bool)
+            for vocab, wanted in ((self.carrier, rule.carrier), (self.commodity, rule.commodity)):
+                if wanted:
+                    hit &= vocab.codes == vocab._code_of.get(str(wanted).upper().strip(), -1)
+            if rule.only_missing:
+                hit &= np.isnan(col)
+            col = np.where(hit, value, col)
+        return col
+
+    def carrier_lookup(self, mapping: Dict[str, float], default: float = 0.0) -> np.ndarray:
+        """Mảng giá trị theo code carrier từ dict {CARRIER: value}."""
+        norm = {str(k).upper().strip(): float(v) for k, v in (mapping or {}).items()}
+        return np.fromiter(
+            (norm.get(v, default) for v in self.carrier.values),
+            dtype=np.float64,
+            count=len(self.carrier.values),
+        )
+
+    def cheapest_per_carrier(self, rows: np.ndarray, totals: np.ndarray) -> np.ndarray:
+        """
+        Vị trí (trong `rows`) của dòng rẻ nhất cho mỗi carrier.
+        Dòng có total NaN/inf bị bỏ; hoà giá thì lấy row id nhỏ hơn.
+        """
+        ok = np.flatnonzero(np.isfinite(totals))
+        if ok.size == 0:
+            return ok
+        codes = self.carrier.codes[rows[ok]]
+        order = np.lexsort((rows[ok], totals[ok], codes))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = codes[order][1:] != codes[order][:-1]
+        return ok[order[first]]
+
+
+def master_fingerprint(master_df: pd.DataFrame) -> str:
+    """Hash nội dung Master (cột + giá trị) để làm version khi không có hash file."""
+    h = hashlib.sha1()
+    h.update(repr(list(master_df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(master_df, index=True).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def top_n(totals: np.ndarray, n: int) -> np.ndarray:
+    """
+    Vị trí của n total nhỏ nhất, sort tăng dần (hoà giá giữ thứ tự gốc).
+    Dùng argpartition để không phải sort toàn bộ khi tập lớn.
+    """
+    size = totals.size
+    if size == 0 or n <= 0:
+        return np.empty(0, dtype=np.intp)
+    if n < size:
+        kth = totals[np.argpartition(totals, n - 1)[n - 1]]
+        cand = np.flatnonzero(totals <= kth)
+    else:
+        cand = np.arange(size)
+    order = np.lexsort((cand, totals[cand]))
+    return cand[order[:n]]
+
+
+# ================= CACHE INDEX THEO MASTER =================
+
+_INDEX_CACHE: Dict[int, tuple] = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def get_master_index(master_df: pd.DataFrame, version: Optional[str] = None) -> MasterIndex:
+    """
+    Trả về MasterIndex cho đúng object Master này (build 1 lần, dùng lại
+    cho mọi request). Khi Master cũ bị giải phóng thì index cũng bị xoá.
+    """
+    key = id(master_df)
+    with _INDEX_LOCK:
+        entry = _INDEX_CACHE.get(key)
+        if entry is not None and entry[0]() is master_df:
+            return entry[1]
+
+    index = MasterIndex(master_df, version=version)
+
+    def _drop(_ref, key=key):
+        with _INDEX_LOCK:
+            cur = _INDEX_CACHE.get(key)
+            if cur is not None and cur[0] is _ref:
+                del _INDEX_CACHE[key]
+
+    with _INDEX_LOCK:
+        _INDEX_CACHE[key] = (weakref.ref(master_df, _drop), index)
+    return index
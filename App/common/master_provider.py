@@ -0,0 +1,161 @@
+# ==================== MASTER_PROVIDER.PY ====================
+"""
+Master dùng chung cho cả process (mọi session Streamlit, service, CLI).
+
+- Load Master_FullPricing.xlsx 1 lần cho mỗi version file
+  (version = hash của path + mtime + size).
+- Snapshot gồm DataFrame read-only + MasterIndex, chia sẻ giữa các session.
+- Khi Normalize publish file mới: get() vẫn trả snapshot cũ ngay lập tức,
+  đồng thời reload ở background thread rồi swap sang snapshot mới.
+- File đang ghi dở / đọc lỗi -> giữ snapshot cũ, lần check sau thử lại.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from .master_index import MasterIndex, get_master_index
+from .models import MASTER_FILE, load_master
+
+
+# Khoảng cách tối thiểu giữa 2 lần stat() file Master (giây)
+STAT_INTERVAL_SECONDS = 2.0
+
+
+def file_signature(path: Path | str) -> Optional[tuple]:
+    """(path, mtime_ns, size) của file, None nếu file không tồn tại."""
+    try:
+        st = Path(path).stat()
+    except OSError:
+        return None
+    return (str(Path(path).resolve()), st.st_mtime_ns, st.st_size)
+
+
+def signature_version(signature: tuple) -> str:
+    return hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class MasterSnapshot:
+    version: str
+    signature: tuple
+    frame: pd.DataFrame
+    index: MasterIndex
+    loaded_at: float
+
+
+class MasterProvider:
+    def __init__(
+        self,
+        path: Path | str = MASTER_FILE,
+        loader: Callable[[Path], pd.DataFrame] = load_master,
+        stat_interval: float = STAT_INTERVAL_SECONDS,
+    ):
+        self.path = Path(path)
+        self.loader = loader
+        self.stat_interval = stat_interval
+        self.last_error: Optional[str] = None
+        self.reload_count = 0
+
+        self._snapshot: Optional[MasterSnapshot] = None
+        self._lock = threading.Lock()
+        self._reloading: Optional[threading.Thread] = None
+        self._last_stat = 0.0
+
+    # ---------- public ----------
+    def get(self) -> MasterSnapshot:
+        """
+        Snapshot hiện tại. Chỉ lần đầu (chưa có snapshot) mới phải chờ load;
+        sau đó file đổi thì reload ở background, người đọc không bị block.
+        """
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._load(file_signature(self.path))
+                snap = self._snapshot
+            return snap  # type: ignore[return-value]
+
+        now = time.monotonic()
+        if now - self._last_stat >= self.stat_interval:
+            self._last_stat = now
+            sig = file_signature(self.path)
+            if sig is not None and sig != snap.signature:
+                self._start_background_reload()
+        return snap
+
+    def refresh(self, wait: bool = False) -> None:
+        """Ép kiểm tra file ngay (vd ngay sau khi Normalize xong)."""
+        self._last_stat = 0.0
+        if self._snapshot is None:
+            self.get()
+            return
+        self.get()
+        thread = self._reloading
+        if wait and thread is not None:
+            thread.join()
+
+    @property
+    def version(self) -> Optional[str]:
+        snap = self._snapshot
+        return snap.version if snap else None
+
+    # ---------- internal ----------
+    def _load(self, sig: Optional[tuple]) -> None:
+        if sig is None:
+            raise FileNotFoundError(f"Không tìm thấy Master: {self.path}")
+
+        frame = self.loader(self.path)
+        # File bị ghi đè trong lúc đang đọc -> lần get() sau sẽ thấy signature khác và reload
+        version = signature_version(sig)
+        index = get_master_index(frame, version=version)
+        self._snapshot = MasterSnapshot(
+            version=version,
+            signature=sig,
+            frame=frame,
+            index=index,
+            loaded_at=time.time(),
+        )
+        self.reload_count += 1
+        self.last_error = None
+
+    def _start_background_reload(self) -> None:
+        with self._lock:
+            if self._reloading is not None and self._reloading.is_alive():
+                return
+            thread = threading.Thread(target=self._background_reload, name="master-reload", daemon=True)
+            self._reloading = thread
+            thread.start()
+
+    def _background_reload(self) -> None:
+        try:
+            self._load(file_signature(self.path))
+        except Exception as e:  # file đang ghi dở, sheet lỗi...
+            self.last_error = f"{type(e).__name__}: {e}"
+
+
+# ================= REGISTRY (1 provider / file / process) =================
+
+_PROVIDERS: Dict[str, MasterProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_master_provider(path: Path | str = MASTER_FILE) -> MasterProvider:
+    key = str(Path(path).resolve())
+    with _PROVIDERS_LOCK:
+        provider = _PROVIDERS.get(key)
+        if provider is None:
+            provider = MasterProvider(path)
+            _PROVIDERS[key] = provider
+        return provider
+
+
+def get_master_snapshot(path: Path | str = MASTER_FILE) -> MasterSnapshot:
+    return get_master_provider(path).get()
@@ -6,6 +6,7 @@ from dataclasses import dataclass, field
 from typing import List, Dict, Optional
 from pathlib import Path
 from datetime import date
+import re
 import pandas as pd
 
 # File này nằm ở: .../PricingSystem/App/common/models.py
@@ -40,6 +41,7 @@ class CustomerInfo:
     sales_person: Optional[str] = None
     quote_date: Optional[str] = None
     valid_until: Optional[str] = None
+    tier: Optional[str] = None   # hạng khách (vd GOLD) cho rule markup
 
 
 @dataclass
@@ -76,6 +78,7 @@ class EngineOptions:
     include_premium_option: bool = False
     currency: str = "USD"
     markup_per_carrier: Dict[str, float] = field(default_factory=dict)
+    trace: bool = False   # True -> kết quả có thêm "trace" (xem common.quote_trace)
 
 
 @dataclass
@@ -97,6 +100,69 @@ def load_master(master_path: Path | str = MASTER_FILE) -> pd.DataFrame:
         raise FileNotFoundError(f"Không tìm thấy Master: {master_path}")
     df = pd.read_excel(master_path, sheet_name="Master")
     df.columns = [str(c).strip() for c in df.columns]
+    return derive_reefer_columns(df)
+
+
+# ================= REEFER COLUMNS =================
+
+@dataclass(frozen=True)
+class ReeferRule:
+    """
+    Cột reefer `target` lấy giá từ `sources` (cột đầu tiên có giá).
+    carrier / commodity: None = mọi dòng; only_missing: chỉ điền khi target đang trống.
+    """
+    target: str
+    sources: tuple
+    carrier: Optional[str] = None
+    commodity: Optional[str] = None
+    only_missing: bool = False
+
+
+# Giá reefer quy đổi theo hãng: (Carrier, CommodityType) -> cột dry tương ứng
+REEFER_COLUMN_RULES = (
+    ReeferRule("20RF", ("20GP",), carrier="COSCO", commodity="REEFER"),
+    ReeferRule("40RF", ("40HQ",), carrier="COSCO", commodity="REEFER"),
+    ReeferRule("20RF", ("20GP",), carrier="ONE", commodity="REEFER FAK"),
+    ReeferRule("40RF", ("40GP",), carrier="ONE", commodity="REEFER FAK"),
+)
+
+
+def derive_reefer_columns(df: pd.DataFrame, rules=REEFER_COLUMN_RULES) -> pd.DataFrame:
+    """
+    Tạo / điền các cột 20RF, 40RF (số) ngay trên df theo rule.
+    Gọi 1 lần lúc load Master -> lúc quote chỉ đọc cột, không map lại.
+    """
+    nan = pd.Series(float("nan"), index=df.index)
+
+    def text(col: str) -> pd.Series:
+        if col not in df.columns:
+            return pd.Series("", index=df.index)
+        return df[col].where(df[col].notna(), "").astype(str).str.upper().str.strip()
+
+    carrier, commodity = text("Carrier"), text("CommodityType")
+    numbers: Dict[str, pd.Series] = {}
+
+    def numeric(col: str) -> pd.Series:
+        if col not in numbers:
+            numbers[col] = pd.to_numeric(df[col], errors="coerce") if col in df.columns else nan
+        return numbers[col]
+
+    for rule in rules:
+        value = numeric(rule.sources[0])
+        for src in rule.sources[1:]:
+            value = value.fillna(numeric(src))
+        target = numeric(rule.target)
+        hit = pd.Series(True, index=df.index)
+        if rule.carrier:
+            hit &= carrier == rule.carrier
+        if rule.commodity:
+            hit &= commodity == rule.commodity
+        if rule.only_missing:
+            hit &= target.isna()
+        numbers[rule.target] = target.where(~hit, value)
+
+    for target in dict.fromkeys(r.target for r in rules):
+        df[target] = numbers[target]
     return df
 
 
@@ -105,6 +171,27 @@ def load_master(master_path: Path | str = MASTER_FILE) -> pd.DataFrame:
 from datetime import date
 import pandas as pd
 
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def cargo_timestamp(cargo_iso: str | None) -> pd.Timestamp:
+    """
+    Ngày cargo ở dạng pandas.Timestamp (00:00).
+    Nếu cargo_iso None hoặc parse lỗi -> lấy ngày hôm nay.
+    """
+    if cargo_iso:
+        text = str(cargo_iso).strip()
+        # yyyy-mm-dd (date.isoformat() từ UI) phải parse theo ISO;
+        # dayfirst chỉ dành cho dạng dd/mm/yyyy, dd-MMM...
+        if _ISO_DATE.match(text):
+            cargo_ts = pd.to_datetime(text, errors="coerce", format="ISO8601")
+        else:
+            cargo_ts = pd.to_datetime(text, errors="coerce", dayfirst=True)
+        if not pd.isna(cargo_ts):
+            return cargo_ts.normalize()
+    return pd.Timestamp.today().normalize()
+
+
 def filter_by_validity(df: pd.DataFrame, cargo_iso: str | None):
     """
     Lọc bảng giá theo ExpirationDate so với ngày cargo_ready_date.
@@ -117,15 +204,7 @@ def filter_by_validity(df: pd.DataFrame, cargo_iso: str | None):
     if "ExpirationDate" not in df.columns:
         return df
 
-    # Xác định ngày cargo ở dạng pandas.Timestamp (datetime64[ns])
-    if cargo_iso:
-        cargo_ts = pd.to_datetime(cargo_iso, errors="coerce", dayfirst=True)
-        if pd.isna(cargo_ts):
-            cargo_ts = pd.Timestamp.today().normalize()
-        else:
-            cargo_ts = cargo_ts.normalize()
-    else:
-        cargo_ts = pd.Timestamp.today().normalize()
+    cargo_ts = cargo_timestamp(cargo_iso)
 
     # Ép ExpirationDate về datetime64[ns] và normalize về 00:00
     exp = pd.to_datetime(df["ExpirationDate"], errors="coerce", dayfirst=True).dt.normalize()
@@ -135,4 +214,4 @@ def filter_by_validity(df: pd.DataFrame, cargo_iso: str | None):
     # - Hoặc ExpirationDate >= cargo_ts
     mask = exp.isna() | (exp >= cargo_ts)
 
-    return df[mask].copy()
\ No newline at end of file
+    return df[mask].copy()
@@ -0,0 +1,190 @@
+# ==================== PLACE_SEARCH.PY ====================
+"""
+Tìm PlaceOfDelivery / POD gần đúng bằng trigram.
+
+Match cũ là substring literal: "CHICAGO,IL" không khớp "CHICAGO, IL",
+"CHICAGO (IL)" hay "CHICAGO,ILLINOIS", gõ sai 1 chữ là không ra gì.
+
+- normalize_place(): UPPER, bỏ dấu câu, tên bang / tỉnh viết đầy đủ -> mã
+  2 chữ ("ILLINOIS" -> "IL"), gộp khoảng trắng.
+- TrigramIndex: build 1 lần trên tập giá trị unique của 1 cột (MasterIndex
+  giữ 1 index / cột / version Master). Mỗi từ được pad "  WORD " rồi cắt
+  trigram; inverted index trigram -> id giá trị.
+- search(): điểm = Jaccard trigram; giá trị chứa nguyên chuỗi query (sau
+  chuẩn hoá) luôn xếp trên. Chỉ duyệt các giá trị có chung trigram.
+  Query không ghi bang / tỉnh ("MEMPHSI") được chấm thêm trên phần tên
+  thành phố, để mã bang của giá trị không kéo điểm xuống.
+- best_mask() (engine tự chọn): query có bang / tỉnh thì chỉ nhận giá trị
+  cùng bang / tỉnh ("PORTLAND, ME" không được lấy giá "PORTLAND, OR").
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# Engine tự chọn Place gần đúng: điểm tối thiểu + biên độ quanh điểm cao nhất
+FUZZY_MIN_SCORE = 0.4
+FUZZY_BAND = 0.1
+
+# Ô search chỉ gợi ý (người dùng tự chọn) -> ngưỡng thấp hơn, bắt được cả đảo chữ
+SEARCH_MIN_SCORE = 0.25
+
+# Điểm sàn của giá trị chứa nguyên query (cao hơn mọi điểm Jaccard thường gặp)
+CONTAINS_SCORE = 0.75
+
+_NON_ALNUM = re.compile(r"[^A-Z0-9]+")
+
+# Tên bang Mỹ / tỉnh Canada viết đầy đủ -> mã 2 chữ (Master dùng lẫn cả hai)
+REGION_ALIASES = {
+    "ALABAMA": "AL", "ALASKA": "AK", "ARIZONA": "AZ", "ARKANSAS": "AR", "CALIFORNIA": "CA",
+    "COLORADO": "CO", "CONNECTICUT": "CT", "DELAWARE": "DE", "FLORIDA": "FL", "GEORGIA": "GA",
+    "HAWAII": "HI", "IDAHO": "ID", "ILLINOIS": "IL", "INDIANA": "IN", "IOWA": "IA",
+    "KANSAS": "KS", "KENTUCKY": "KY", "LOUISIANA": "LA", "MAINE": "ME", "MARYLAND": "MD",
+    "MASSACHUSETTS": "MA", "MICHIGAN": "MI", "MINNESOTA": "MN", "MISSISSIPPI": "MS",
+    "MISSOURI": "MO", "MONTANA": "MT", "NEBRASKA": "NE", "NEVADA": "NV", "OHIO": "OH",
+    "OKLAHOMA": "OK", "OREGON": "OR", "PENNSYLVANIA": "PA", "TENNESSEE": "TN", "TEXAS": "TX",
+    "UTAH": "UT", "VERMONT": "VT", "VIRGINIA": "VA", "WASHINGTON": "WA", "WISCONSIN": "WI",
+    "WYOMING": "WY", "ONTARIO": "ON", "QUEBEC": "QC", "ALBERTA": "AB", "MANITOBA": "MB",
+    "SASKATCHEWAN": "SK",
+}
+_MULTIWORD_REGIONS = {
+    "NEW HAMPSHIRE": "NH", "NEW JERSEY": "NJ", "NEW MEXICO": "NM", "NORTH CAROLINA": "NC",
+    "NORTH DAKOTA": "ND", "RHODE ISLAND": "RI", "SOUTH CAROLINA": "SC", "SOUTH DAKOTA": "SD",
+    "WEST VIRGINIA": "WV", "BRITISH COLUMBIA": "BC", "NOVA SCOTIA": "NS", "NEW BRUNSWICK": "NB",
+}
+# Chỉ thay tên bang đứng sau dấu phẩy / trong ngoặc (tránh "NEW YORK" thành phố)
+_REGION_AFTER = re.compile(
+    r"([,(/]\s*)(" + "|".join(sorted({**REGION_ALIASES, **_MULTIWORD_REGIONS}, key=len, reverse=True)) + r")\b"
+)
+_ALL_REGIONS = {**REGION_ALIASES, **_MULTIWORD_REGIONS}
+REGION_CODES = set(_ALL_REGIONS.values()) | {"NY", "DC"}
+_CITY_END = re.compile(r"[,(/]")
+_REGION_CODE_AFTER = re.compile(r"[,(/]\s*([A-Z]{2})\b")
+
+
+def normalize_place(text: Optional[str]) -> str:
+    """'Chicago (Illinois)' -> 'CHICAGO IL'; 'CHICAGO,IL' -> 'CHICAGO IL'."""
+    t = str(text or "").upper()
+    t = _REGION_AFTER.sub(lambda m: m.group(1) + _ALL_REGIONS[m.group(2)], t)
+    return " ".join(_NON_ALNUM.split(t)).strip()
+
+
+def place_region(text: Optional[str]) -> Optional[str]:
+    """
+    Mã bang / tỉnh của 1 place: mã 2 chữ đầu tiên sau dấu phẩy / ngoặc,
+    không có thì token cuối nếu là mã bang. 'Portland, Maine' -> 'ME';
+    'MEMPHIS' -> None.
+    """
+    t = str(text or "").upper()
+    t = _REGION_AFTER.sub(lambda m: m.group(1) + _ALL_REGIONS[m.group(2)], t)
+    for code in _REGION_CODE_AFTER.findall(t):
+        if code in REGION_CODES:
+            return code
+    words = normalize_place(t).split()
+    if len(words) > 1 and words[-1] in REGION_CODES:
+        return words[-1]
+    return None
+
+
+def place_city(text: Optional[str]) -> str:
+    """Phần tên thành phố (trước dấu phẩy / ngoặc đầu tiên), đã chuẩn hoá."""
+    return normalize_place(_CITY_END.split(str(text or ""), 1)[0])
+
+
+def trigrams(norm: str) -> set:
+    grams = set()
+    for word in norm.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    def __init__(self, values: Iterable[str]):
+        self.values = np.asarray(list(values), dtype=object)
+        self.norm = [normalize_place(v) for v in self.values]
+        self.region = np.asarray([place_region(v) for v in self.values], dtype=object)
+
+        self._postings, self._size = self._build([trigrams(n) for n in self.norm])
+        self._city_postings, self._city_size = self._build([trigrams(place_city(v)) for v in self.values])
+
+    @staticmethod
+    def _build(grams: List[set]) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        size = np.array([len(g) for g in grams], dtype=np.float64)
+        postings: Dict[str, List[int]] = {}
+        for i, gs in enumerate(grams):
+            for g in gs:
+                postings.setdefault(g, []).append(i)
+        return {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}, size
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _jaccard(self, qg: set, postings: Dict[str, np.ndarray], size: np.ndarray) -> np.ndarray:
+        out = np.zeros(len(self.values), dtype=np.float64)
+        lists = [postings[g] for g in qg if g in postings]
+        if lists:
+            hits = np.bincount(np.concatenate(lists), minlength=len(self.values)).astype(np.float64)
+            cand = np.flatnonzero(hits)
+            out[cand] = hits[cand] / (len(qg) + size[cand] - hits[cand])
+        return out
+
+    def scores(self, query: str, among: Optional[np.ndarray] = None) -> np.ndarray:
+        """Điểm 0..1 cho từng giá trị (0 = không liên quan). among: mask bool giới hạn tập."""
+        q = normalize_place(query)
+        if not q:
+            return np.zeros(len(self.values), dtype=np.float64)
+        qg = trigrams(q)
+        out = self._jaccard(qg, self._postings, self._size)
+        if place_region(query) is None:
+            # Query chỉ có tên thành phố -> so thêm với phần tên thành phố của giá trị
+            out = np.maximum(out, self._jaccard(qg, self._city_postings, self._city_size))
+        if among is not None:
+            out[~among] = 0.0
+        cand = np.flatnonzero(out)
+
+        # Chứa nguyên chuỗi query -> luôn trên mọi kết quả chỉ giống trigram
+        for i in cand.tolist():
+            n = self.norm[i]
+            if q in n:
+                out[i] = CONTAINS_SCORE + (1 - CONTAINS_SCORE) * len(q) / len(n)
+        return out
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        min_score: float = SEARCH_MIN_SCORE,
+        among: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """[(id giá trị, điểm)] xếp giảm dần theo điểm, hoà điểm theo tên."""
+        score = self.scores(query, among)
+        cand = np.flatnonzero(score >= min_score)
+        if cand.size == 0:
+            return []
+        order = sorted(cand.tolist(), key=lambda i: (-score[i], self.norm[i]))
+        return [(i, float(score[i])) for i in order[:limit]]
+
+    def best_mask(self, query: str, min_score: float = FUZZY_MIN_SCORE, band: float = FUZZY_BAND) -> np.ndarray:
+        """
+        Mask bool các giá trị engine nên dùng khi substring literal không ra gì:
+        giá trị chứa query đã chuẩn hoá, nếu không có thì các giá trị có điểm
+        trigram nằm trong `band` so với điểm cao nhất. Query có bang / tỉnh
+        thì bỏ các giá trị khác bang / tỉnh (rỗng -> engine báo NO_RATE kèm gợi ý).
+        """
+        score = self.scores(query)
+        top = score.max() if score.size else 0.0
+        if top < min_score:
+            return np.zeros(len(self.values), dtype=bool)
+        if top >= CONTAINS_SCORE:
+            mask = score >= CONTAINS_SCORE
+        else:
+            mask = score >= max(min_score, top - band)
+        region = place_region(query)
+        if region is not None:
+            mask &= self.region == region
+        return mask
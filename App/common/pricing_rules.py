@@ -0,0 +1,273 @@
+# ==================== PRICING_RULES.PY ====================
+"""
+Rule markup: theo carrier, lane (POL / Place / POD), container, tier khách,
+khách cụ thể và khoảng ngày hiệu lực.
+
+- priority cao hơn thắng; cùng priority thì rule cụ thể hơn (nhiều điều
+  kiện hơn) thắng rule chung, rồi tới rule khai báo sau.
+- compile() biến các rule áp dụng được thành ma trận markup
+  (số dòng Master x loại container), thẳng hàng với MasterIndex;
+  cost_engine chỉ việc lấy markup[rows] và cộng vector.
+- Rule chia bucket theo (tier, customer) + lọc theo ngày trước khi compile,
+  và kết quả compile được cache theo version Master -> thêm hàng trăm rule
+  riêng cho từng khách không làm chậm các quote khác.
+
+Dòng trong Pipeline.docx:
+    DEFAULT-MARKUP: ONE=50
+    MARKUP-RULE: CARRIER=ONE; PLACE=CHICAGO; CONTAINER=40HQ; TIER=GOLD; FROM=2026-01-01; TO=2026-03-31; AMOUNT=75
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .master_index import MasterIndex
+from .models import cargo_timestamp
+
+
+# Số ma trận markup đã compile giữ trong bộ nhớ
+COMPILED_RULES_MAXSIZE = 32
+
+_SELECTORS = ("carrier", "pol", "place", "pod", "container", "tier", "customer")
+
+# Key trong dòng MARKUP-RULE -> field của MarkupRule
+_LINE_KEYS = {
+    "CARRIER": "carrier",
+    "POL": "pol",
+    "PLACE": "place",
+    "POD": "pod",
+    "CONTAINER": "container",
+    "TIER": "tier",
+    "CUSTOMER": "customer",
+    "FROM": "valid_from",
+    "TO": "valid_to",
+    "PRIORITY": "priority",
+    "AMOUNT": "amount",
+}
+
+
+def _norm(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    v = str(value).upper().strip()
+    return v or None
+
+
+@dataclass(frozen=True)
+class MarkupRule:
+    """
+    amount: USD cộng vào mỗi container khớp rule.
+    carrier / pol / container / tier / customer: so khớp đúng (UPPER);
+    place / pod: chứa chuỗi (giống filter của generate_quote).
+    valid_from / valid_to: khoảng ngày (theo cargo ready date), None = không giới hạn.
+    """
+    amount: float
+    carrier: Optional[str] = None
+    pol: Optional[str] = None
+    place: Optional[str] = None
+    pod: Optional[str] = None
+    container: Optional[str] = None
+    tier: Optional[str] = None
+    customer: Optional[str] = None
+    valid_from: Optional[str] = None
+    valid_to: Optional[str] = None
+    priority: int = 0
+
+    @property
+    def specificity(self) -> int:
+        return sum(getattr(self, f) is not None for f in _SELECTORS)
+
+
+class PricingRules:
+    def __init__(self, rules: Iterable[MarkupRule] = ()):
+        self.rules: List[MarkupRule] = [
+            replace(r, **{f: _norm(getattr(r, f)) for f in _SELECTORS}, amount=float(r.amount))
+            for r in rules
+        ]
+        self.fingerprint = hashlib.sha1(repr(self.rules).encode("utf-8")).hexdigest()[:16]
+
+        # (tier, customer) -> [(thứ tự áp, seq)]; None = áp cho mọi tier / khách
+        self._buckets: Dict[tuple, List[Tuple[tuple, int]]] = {}
+        for seq, r in enumerate(self.rules):
+            order = (r.priority, r.specificity, seq)
+            self._buckets.setdefault((r.tier, r.customer), []).append((order, seq))
+
+        # Khoảng hiệu lực parse 1 lần
+        self._windows = [
+            (cargo_timestamp(r.valid_from) if r.valid_from else None,
+             cargo_timestamp(r.valid_to) if r.valid_to else None)
+            for r in self.rules
+        ]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __add__(self, other: "PricingRules") -> "PricingRules":
+        """Ghép 2 bộ rule; rule của `other` đứng sau (thắng khi hoà)."""
+        return PricingRules(self.rules + list(other.rules))
+
+    # ---------- tạo rule ----------
+    @classmethod
+    def from_carrier_markups(cls, mapping: Optional[Dict[str, float]]) -> "PricingRules":
+        """markup_map {CARRIER: USD} cũ -> rule theo carrier."""
+        return cls(MarkupRule(amount=float(v), carrier=k) for k, v in (mapping or {}).items())
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str], strict: bool = False) -> "PricingRules":
+        """
+        Đọc các dòng DEFAULT-MARKUP / MARKUP-RULE (vd từ Pipeline.docx).
+        Dòng sai định dạng bị bỏ qua; strict=True (input API / file --rules)
+        -> ValueError cho dòng đầu tiên không thành rule (bỏ qua dòng trống
+        và dòng bắt đầu bằng '#').
+        """
+        if strict and isinstance(lines, (str, bytes)):
+            raise ValueError("Rule markup phải là list các dòng, không phải 1 chuỗi.")
+        rules: List[MarkupRule] = []
+        for n, line in enumerate(lines, 1):
+            t = str(line or "").strip()
+            if strict and (not t or t.startswith("#")):
+                continue
+            try:
+                rules.append(_parse_line(t, strict))
+            except (KeyError, ValueError) as e:
+                if strict:
+                    raise ValueError(f"Dòng {n} không phải rule markup hợp lệ ({e}): {t}") from None
+                continue
+        return cls(rules)
+
+    # ---------- áp dụng ----------
+    def applicable(
+        self,
+        tier: Optional[str] = None,
+        customer: Optional[str] = None,
+        on_date: Optional[str] = None,
+    ) -> List[MarkupRule]:
+        """Rule áp cho (tier, khách, ngày), xếp theo thứ tự áp (rule sau đè rule trước)."""
+        return [self.rules[seq] for seq in self._applicable_seqs(tier, customer, on_date)]
+
+    def _applicable_seqs(self, tier: Optional[str], customer: Optional[str], on_date: Optional[str]) -> Tuple[int, ...]:
+        tier, customer = _norm(tier), _norm(customer)
+        day = cargo_timestamp(on_date)
+        picked: List[Tuple[tuple, int]] = []
+        for key in {(None, None), (tier, None), (None, customer), (tier, customer)}:
+            picked.extend(self._buckets.get(key, ()))
+        picked.sort()
+        out = []
+        for _, seq in picked:
+            start, end = self._windows[seq]
+            if (start is None or day >= start) and (end is None or day <= end):
+                out.append(seq)
+        return tuple(out)
+
+    def compile(
+        self,
+        index: MasterIndex,
+        containers: List[str],
+        tier: Optional[str] = None,
+        customer: Optional[str] = None,
+        on_date: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Ma trận markup (index.n_rows x len(containers)), float64, read-only.
+        Cache theo (version Master, bộ rule thực sự áp dụng, container):
+        khách / ngày khác nhau mà cùng bộ rule dùng chung 1 ma trận.
+        """
+        seqs = self._applicable_seqs(tier, customer, on_date)
+        key = (index.version, self.fingerprint, seqs, tuple(containers))
+        with _COMPILED_LOCK:
+            hit = _COMPILED.get(key)
+            if hit is not None:
+                _COMPILED.move_to_end(key)
+                return hit
+
+        out = np.zeros((index.n_rows, len(containers)), dtype=np.float64)
+        masks: Dict[tuple, np.ndarray] = {}
+        for rule in (self.rules[seq] for seq in seqs):
+            cols = [j for j, c in enumerate(containers) if rule.container in (None, str(c).upper())]
+            if not cols:
+                continue
+            rows = _rule_rows(index, rule, masks)
+            if rows is None:
+                out[:, cols] = rule.amount
+            elif rows.size:
+                out[rows[:, None], cols] = rule.amount
+        out.setflags(write=False)
+
+        with _COMPILED_LOCK:
+            _COMPILED[key] = out
+            while len(_COMPILED) > COMPILED_RULES_MAXSIZE:
+                _COMPILED.popitem(last=False)
+        return out
+
+
+def _parse_line(t: str, strict: bool = False) -> MarkupRule:
+    """1 dòng DEFAULT-MARKUP / MARKUP-RULE -> MarkupRule; KeyError / ValueError nếu sai."""
+    head, _, body = t.partition(":")
+    head = head.strip().upper()
+    if head == "DEFAULT-MARKUP":
+        carrier, _, amount = body.partition("=")
+        if strict and not carrier.strip():
+            raise ValueError("thiếu carrier")
+        rule = MarkupRule(amount=float(amount), carrier=carrier)
+    elif head == "MARKUP-RULE":
+        kwargs = {}
+        for part in body.split(";"):
+            key, _, value = part.partition("=")
+            name = _LINE_KEYS.get(key.strip().upper())
+            if strict and part.strip() and (name is None or not value.strip()):
+                raise ValueError(f"key không hợp lệ: {part.strip()}")
+            if name and value.strip():
+                kwargs[name] = value.strip()
+        kwargs["amount"] = float(kwargs["amount"])
+        kwargs["priority"] = int(kwargs.get("priority", 0))
+        rule = MarkupRule(**kwargs)
+    else:
+        raise ValueError("không phải DEFAULT-MARKUP / MARKUP-RULE")
+    if strict:
+        if not np.isfinite(rule.amount):
+            raise ValueError("AMOUNT không phải số hữu hạn")
+        for day in (rule.valid_from, rule.valid_to):
+            if day is not None and pd.isna(pd.to_datetime(day, errors="coerce", dayfirst=True)):
+                raise ValueError(f"ngày không hợp lệ: {day}")
+    return rule
+
+
+def _rule_rows(index: MasterIndex, rule: MarkupRule, masks: Dict[tuple, np.ndarray]) -> Optional[np.ndarray]:
+    """Row id khớp điều kiện lane/carrier của rule (None = mọi dòng)."""
+    conds = []
+    for name, vocab, contains in (
+        ("carrier", index.carrier, False),
+        ("pol", index.pol, False),
+        ("place", index.place, True),
+        ("pod", index.pod, True),
+    ):
+        value = getattr(rule, name)
+        if value is None:
+            continue
+        key = (name, value)
+        mask = masks.get(key)
+        if mask is None:
+            if contains:
+                code_mask = vocab.codes_containing(value)
+            else:
+                code_mask = np.zeros(len(vocab.values), dtype=bool)
+                code = vocab._code_of.get(value)
+                if code is not None:
+                    code_mask[code] = True
+            mask = code_mask[vocab.codes]
+            masks[key] = mask
+        conds.append(mask)
+    if not conds:
+        return None
+    return np.flatnonzero(np.logical_and.reduce(conds))
+
+
+_COMPILED: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_COMPILED_LOCK = threading.Lock()
@@ -0,0 +1,160 @@
+# ==================== QUOTE_CACHE.PY ====================
+"""
+Cache LRU cho kết quả quote (cost_engine.generate_quote / generate_quotes).
+
+Streamlit chạy lại cả trang mỗi lần đổi widget nên cùng 1 QuoteRequest bị
+tính lại liên tục. Key cache = version Master + version Schedule + dạng chuẩn (canonical) của
+customer, shipment, container plan và engine options (kể cả markup_map
+và fingerprint của pricing_rules).
+
+- Giới hạn số entry (LRU) + TTL theo giây.
+- Khi thấy version Master mới -> tự bỏ toàn bộ entry của version cũ.
+- invalidate() để gọi khi Normalize publish Master mới.
+- stats() trả hit/miss/eviction để chỉnh kích thước cache.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from .cost_engine import generate_quotes
+from .master_index import get_master_index
+from .models import QuoteRequest
+from .schedule_provider import schedule_version
+
+
+QUOTE_CACHE_MAXSIZE = 1024
+QUOTE_CACHE_TTL_SECONDS = 15 * 60
+
+
+def request_key(req: QuoteRequest) -> str:
+    """
+    Dạng chuẩn của 1 request -> sha1.
+    Có thêm ngày hôm nay vì engine dùng today() cho quote_date và khi thiếu
+    cargo_ready_date.
+    """
+    opts = req.engine_options
+    payload = {
+        "customer": asdict(req.customer),
+        "shipment": asdict(req.shipment),
+        "containers": [(c.type, c.quantity) for c in req.containers],
+        "options": asdict(opts),
+        "markup_map": getattr(opts, "markup_map", None) or {},
+        "pricing_rules": getattr(getattr(opts, "pricing_rules", None), "fingerprint", None),
+        "today": date.today().isoformat(),
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class QuoteCache:
+    def __init__(self, maxsize: int = QUOTE_CACHE_MAXSIZE, ttl_seconds: float = QUOTE_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, version: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._switch_version(version)
+            entry = self._data.get((version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[(version, key)]
+                self.misses += 1
+                return None
+            self._data.move_to_end((version, key))
+            self.hits += 1
+            return copy.deepcopy(value)
+
+    def put(self, version: str, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._switch_version(version)
+            self._data[(version, key)] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+            self._data.move_to_end((version, key))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Xoá toàn bộ cache (gọi khi publish Master mới)."""
+        with self._lock:
+            self._data.clear()
+            self._version = None
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "master_version": self._version,
+            }
+
+    def _switch_version(self, version: str) -> None:
+        # Master đã đổi -> entry của version cũ không bao giờ dùng lại được nữa
+        if version != self._version:
+            if self._data:
+                self._data.clear()
+                self.invalidations += 1
+            self._version = version
+
+
+# Cache dùng chung cho cả process (mọi session Streamlit)
+QUOTE_CACHE = QuoteCache()
+
+
+def cached_generate_quotes(
+    master_df: pd.DataFrame,
+    requests: List[QuoteRequest],
+    cache: QuoteCache = QUOTE_CACHE,
+) -> List[Dict[str, Any]]:
+    """
+    Như cost_engine.generate_quotes nhưng trả kết quả từ cache nếu có;
+    các request chưa có trong cache được tính chung 1 batch.
+    """
+    # Kết quả có cả ETD / vessel -> Schedule.xlsx đổi cũng phải bỏ cache
+    version = f"{get_master_index(master_df).version}+{schedule_version()}"
+    keys = [request_key(r) for r in requests]
+    results: List[Optional[Dict[str, Any]]] = [cache.get(version, k) for k in keys]
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        fresh = generate_quotes(master_df, [requests[i] for i in missing])
+        for i, res in zip(missing, fresh):
+            cache.put(version, keys[i], res)
+            results[i] = res
+    return results  # type: ignore[return-value]
+
+
+def cached_generate_quote(
+    master_df: pd.DataFrame,
+    req: QuoteRequest,
+    cache: QuoteCache = QUOTE_CACHE,
+) -> Dict[str, Any]:
+    return cached_generate_quotes(master_df, [req], cache)[0]
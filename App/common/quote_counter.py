@@ -0,0 +1,196 @@
+# ==================== QUOTE_COUNTER.PY ====================
+"""
+Bộ đếm số REF QUOTATION (CUSTOMERKEY-DDMMM-SEQ) lưu bằng SQLite.
+
+- Mỗi (CustomerKey, DateCode) là 1 dòng; cấp số mới bằng 1 câu
+  INSERT ... ON CONFLICT DO UPDATE ... RETURNING -> atomic, O(1),
+  không phụ thuộc lịch sử dài hay ngắn.
+- Journal WAL + busy_timeout: nhiều sales / nhiều process cùng quote
+  không bị trùng số, người đọc không chặn người ghi.
+- Lần đầu tạo DB sẽ import lịch sử từ quote_counters.csv cũ (nếu có).
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+from .models import DATA_DIR
+
+
+QUOTE_COUNTER_DB = DATA_DIR / "quote_counters.db"
+LEGACY_COUNTER_CSV = DATA_DIR / "quote_counters.csv"
+
+# Chờ tối đa bao lâu khi DB đang bị process khác ghi (ms)
+BUSY_TIMEOUT_MS = 10_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quote_counters (
+    customer_key TEXT NOT NULL,
+    date_code    TEXT NOT NULL,
+    counter      INTEGER NOT NULL,
+    updated_at   TEXT NOT NULL,
+    PRIMARY KEY (customer_key, date_code)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS quote_counter_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_NEXT_SQL = """
+INSERT INTO quote_counters (customer_key, date_code, counter, updated_at)
+VALUES (?, ?, 1, ?)
+ON CONFLICT (customer_key, date_code)
+DO UPDATE SET counter = counter + 1, updated_at = excluded.updated_at
+RETURNING counter
+"""
+
+# Import CSV không bao giờ làm giảm counter đã có trong DB
+_IMPORT_SQL = """
+INSERT INTO quote_counters (customer_key, date_code, counter, updated_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (customer_key, date_code)
+DO UPDATE SET counter = MAX(counter, excluded.counter), updated_at = excluded.updated_at
+"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class QuoteCounterStore:
+    def __init__(self, db_path: Path | str = QUOTE_COUNTER_DB, legacy_csv: Path | str | None = LEGACY_COUNTER_CSV):
+        self.db_path = Path(db_path)
+        self.legacy_csv = Path(legacy_csv) if legacy_csv else None
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    # ---------- public ----------
+    def next(self, customer_key: str, date_code: str) -> int:
+        """Cấp số tiếp theo cho (customer, ngày). Lần đầu trong ngày = 1."""
+        conn = self._conn()
+        row = conn.execute(_NEXT_SQL, (customer_key, date_code, _now())).fetchone()
+        return int(row[0])
+
+    def peek(self, customer_key: str, date_code: str) -> int:
+        """Số đã cấp gần nhất (0 nếu chưa có), không tăng counter."""
+        row = self._conn().execute(
+            "SELECT counter FROM quote_counters WHERE customer_key = ? AND date_code = ?",
+            (customer_key, date_code),
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def import_csv(self, csv_path: Path | str) -> int:
+        """
+        Nạp lịch sử từ file CSV cũ (CustomerKey, DateCode, Counter).
+        Trả về số dòng đã nạp.
+        """
+        df = pd.read_csv(csv_path, dtype={"CustomerKey": str, "DateCode": str})
+        df = df.dropna(subset=["CustomerKey", "DateCode", "Counter"])
+        now = _now()
+        rows = [
+            (str(k).strip(), str(d).strip(), int(c), now)
+            for k, d, c in zip(df["CustomerKey"], df["DateCode"], df["Counter"])
+        ]
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_IMPORT_SQL, rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO quote_counter_meta (key, value) VALUES (?, ?)",
+                (f"csv_imported:{Path(csv_path).resolve()}", now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Toàn bộ counter dạng DataFrame (cùng cột với CSV cũ)."""
+        cur = self._conn().execute(
+            "SELECT customer_key, date_code, counter FROM quote_counters ORDER BY customer_key, date_code"
+        )
+        return pd.DataFrame(cur.fetchall(), columns=["CustomerKey", "DateCode", "Counter"])
+
+    # ---------- internal ----------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self._ensure_db()
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None: mỗi câu lệnh tự commit (autocommit)
+        conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _ensure_db(self) -> None:
+        if self._ready:
+            return
+        with self._init_lock:
+            if self._ready:
+                return
+            os.makedirs(self.db_path.parent, exist_ok=True)
+            conn = self._open()
+            try:
+                conn.executescript(_SCHEMA)
+                self._import_legacy(conn)
+            finally:
+                conn.close()
+            self._ready = True
+
+    def _import_legacy(self, conn: sqlite3.Connection) -> None:
+        if self.legacy_csv is None or not self.legacy_csv.exists():
+            return
+        key = f"csv_imported:{self.legacy_csv.resolve()}"
+        if conn.execute("SELECT 1 FROM quote_counter_meta WHERE key = ?", (key,)).fetchone():
+            return
+        self._local.conn = conn
+        try:
+            self.import_csv(self.legacy_csv)
+        finally:
+            self._local.conn = None
+
+
+# ================= REGISTRY (1 store / file / process) =================
+
+_STORES: Dict[str, QuoteCounterStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_counter_store(
+    db_path: Path | str = QUOTE_COUNTER_DB,
+    legacy_csv: Optional[Path | str] = LEGACY_COUNTER_CSV,
+) -> QuoteCounterStore:
+    key = str(Path(db_path).resolve())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = QuoteCounterStore(db_path, legacy_csv)
+            _STORES[key] = store
+        return store
+
+
+def next_quote_counter(
+    customer_key: str,
+    date_code: str,
+    db_path: Path | str = QUOTE_COUNTER_DB,
+    legacy_csv: Optional[Path | str] = LEGACY_COUNTER_CSV,
+) -> int:
+    return get_counter_store(db_path, legacy_csv).next(customer_key, date_code)
@@ -0,0 +1,423 @@
+# ==================== QUOTE_LOG.PY ====================
+"""
+Log nội bộ của các quote (SUMMARY / OPTIONS / DETAILS) trong 1 file SQLite.
+
+Trước đây mỗi quote ghi ra 1 file xlsx 3 sheet trong Quotes_Log/ -> chậm
+và không truy vấn chéo được. Giờ:
+- 3 bảng quote_summary / quote_options / quote_details (append-only),
+  cột giữ nguyên tên cột của các sheet Excel cũ.
+- QuoteRef đã có trong log (vd counter bị reset, ref không kèm năm) ->
+  không bỏ bản ghi: lưu dưới ref có hậu tố "-2", "-3"... và ghi lại vào
+  stats()["duplicates"] / last_duplicate.
+- append() chỉ bỏ vào hàng đợi; 1 thread nền gom nhiều quote rồi ghi
+  trong 1 transaction, request không phải chờ IO.
+- Transaction của batch lỗi (SQLITE_BUSY, 1 giá trị hỏng...) -> ghi lại
+  từng quote (thử lại WRITE_RETRIES lần khi DB bận). Quote vẫn lỗi không bị
+  bỏ: giữ trong failed_items + ghi thêm ra file <db>.failed.jsonl,
+  retry_failed() đưa lại vào hàng đợi.
+- export_excel() dựng lại workbook đúng layout cũ cho 1 quote hoặc
+  cho cả 1 khoảng ngày.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .models import OUTPUT_DIR
+
+
+QUOTE_LOG_DB = OUTPUT_DIR / "Quotes_Log" / "quote_log.db"
+
+# Thread nền ghi tối đa bao nhiêu quote / transaction, và chờ gom bao lâu (giây)
+WRITE_BATCH_SIZE = 200
+WRITE_INTERVAL_SECONDS = 0.5
+
+# Batch lỗi -> ghi từng quote; DB bận (locked / busy) thì thử lại tối đa bao nhiêu lần, cách nhau bao lâu (giây)
+WRITE_RETRIES = 3
+RETRY_DELAY_SECONDS = 0.5
+
+SUMMARY_COLUMNS = [
+    "QuoteRef", "QuoteDate", "Customer", "CustomerEmail", "ContactPerson", "SalesPerson",
+    "Route", "POL", "POD", "PlaceOfDelivery", "Containers", "Incoterm", "Commodity",
+    "SOC", "Currency",
+]
+OPTION_COLUMNS = [
+    "Option", "IsRecommended", "Carrier", "RateType", "Contract", "Total",
+    "Validity", "Commodity", "Notes",
+]
+DETAIL_COLUMNS = ["Option", "Carrier", "Type", "Qty", "UnitRate", "Amount", "Currency"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quote_summary (
+    "QuoteRef"        TEXT PRIMARY KEY,
+    "QuoteDate"       TEXT NOT NULL,
+    "LoggedAt"        TEXT NOT NULL,
+    "Customer"        TEXT,
+    "CustomerEmail"   TEXT,
+    "ContactPerson"   TEXT,
+    "SalesPerson"     TEXT,
+    "Route"           TEXT,
+    "POL"             TEXT,
+    "POD"             TEXT,
+    "PlaceOfDelivery" TEXT,
+    "Containers"      TEXT,
+    "Incoterm"        TEXT,
+    "Commodity"       TEXT,
+    "SOC"             INTEGER,
+    "Currency"        TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_quote_summary_date ON quote_summary ("QuoteDate");
+CREATE INDEX IF NOT EXISTS ix_quote_summary_customer ON quote_summary ("Customer", "QuoteDate");
+
+CREATE TABLE IF NOT EXISTS quote_options (
+    "QuoteRef"      TEXT NOT NULL,
+    "Option"        INTEGER NOT NULL,
+    "IsRecommended" INTEGER,
+    "Carrier"       TEXT,
+    "RateType"      TEXT,
+    "Contract"      TEXT,
+    "Total"         REAL,
+    "Validity"      TEXT,
+    "Commodity"     TEXT,
+    "Notes"         TEXT,
+    PRIMARY KEY ("QuoteRef", "Option")
+);
+
+CREATE TABLE IF NOT EXISTS quote_details (
+    "QuoteRef" TEXT NOT NULL,
+    "Option"   INTEGER NOT NULL,
+    "Carrier"  TEXT,
+    "Type"     TEXT,
+    "Qty"      INTEGER,
+    "UnitRate" REAL,
+    "Amount"   REAL,
+    "Currency" TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_quote_details_ref ON quote_details ("QuoteRef", "Option");
+"""
+
+
+def _insert_sql(table: str, columns: List[str], verb: str = "INSERT") -> str:
+    cols = ", ".join(f'"{c}"' for c in columns)
+    marks = ", ".join("?" for _ in columns)
+    return f"{verb} INTO {table} ({cols}) VALUES ({marks})"
+
+
+def _value(v: Any) -> Any:
+    # SQLite chỉ nhận kiểu cơ bản; numpy / Timestamp / NaN quy về Python
+    if v is None:
+        return None
+    if isinstance(v, float) and v != v:
+        return None
+    if hasattr(v, "item"):
+        return v.item()
+    if isinstance(v, (str, int, float, bool)):
+        return v
+    return str(v)
+
+
+class QuoteLogStore:
+    def __init__(
+        self,
+        db_path: Path | str = QUOTE_LOG_DB,
+        batch_size: int = WRITE_BATCH_SIZE,
+        interval: float = WRITE_INTERVAL_SECONDS,
+    ):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.written = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.last_duplicate: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.failed_items: List[tuple] = []
+        self.failed_path = self.db_path.with_suffix(".failed.jsonl")
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._ensure_schema()
+
+    # ---------- ghi ----------
+    def append(
+        self,
+        summary: Dict[str, Any],
+        options: List[Dict[str, Any]],
+        details: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Đưa 1 quote vào hàng đợi ghi (không block).
+        summary / options / details: các dòng giống sheet SUMMARY / OPTIONS / DETAILS.
+        """
+        self._ensure_writer()
+        self._queue.put((dict(summary), list(options), list(details), datetime.now().isoformat(timespec="seconds")))
+
+    def flush(self) -> None:
+        """Chờ tới khi mọi quote đã append được ghi xuống DB."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def retry_failed(self) -> int:
+        """Đưa các quote ghi lỗi trước đó vào lại hàng đợi. Trả về số quote."""
+        with self._lock:
+            items, self.failed_items = self.failed_items, []
+        if items:
+            self._ensure_writer()
+            for item in items:
+                self._queue.put(item)
+        return len(items)
+
+    def close(self) -> None:
+        thread = self._writer
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+        self._writer = None
+
+    # ---------- đọc ----------
+    def read_quotes(
+        self,
+        quote_ref: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        customer: Optional[str] = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        (SUMMARY, OPTIONS, DETAILS) của 1 quote hoặc các quote có
+        QuoteDate trong [date_from, date_to] (ISO yyyy-mm-dd).
+        """
+        self.flush()
+
+        where, params = [], []
+        if quote_ref:
+            where.append('"QuoteRef" = ?')
+            params.append(quote_ref)
+        if date_from:
+            where.append('"QuoteDate" >= ?')
+            params.append(str(date_from))
+        if date_to:
+            where.append('"QuoteDate" <= ?')
+            params.append(str(date_to))
+        if customer:
+            where.append('UPPER("Customer") = UPPER(?)')
+            params.append(customer)
+        cond = (" WHERE " + " AND ".join(where)) if where else ""
+
+        refs_sql = f'SELECT "QuoteRef" FROM quote_summary{cond}'
+        with self._connect() as conn:
+            df_summary = pd.read_sql_query(
+                f'SELECT * FROM quote_summary{cond} ORDER BY "QuoteDate", "LoggedAt"', conn, params=params
+            )
+            df_options = pd.read_sql_query(
+                f'SELECT * FROM quote_options WHERE "QuoteRef" IN ({refs_sql}) ORDER BY "QuoteRef", "Option"',
+                conn, params=params,
+            )
+            df_details = pd.read_sql_query(
+                f'SELECT * FROM quote_details WHERE "QuoteRef" IN ({refs_sql}) ORDER BY "QuoteRef", "Option", rowid',
+                conn, params=params,
+            )
+
+        df_summary = df_summary[SUMMARY_COLUMNS]
+        df_summary["SOC"] = df_summary["SOC"].astype("boolean")
+        df_options["IsRecommended"] = df_options["IsRecommended"].astype("boolean")
+        return df_summary, df_options, df_details
+
+    def export_excel(
+        self,
+        filepath: Path | str,
+        quote_ref: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        customer: Optional[str] = None,
+    ) -> str:
+        """
+        Xuất workbook SUMMARY / OPTIONS / DETAILS như file log cũ.
+        1 quote: layout y hệt file cũ; nhiều quote: OPTIONS / DETAILS có thêm
+        cột QuoteRef ở đầu để phân biệt.
+        """
+        df_summary, df_options, df_details = self.read_quotes(quote_ref, date_from, date_to, customer)
+        if quote_ref:
+            df_options = df_options[OPTION_COLUMNS]
+            df_details = df_details[DETAIL_COLUMNS]
+
+        os.makedirs(Path(filepath).parent, exist_ok=True)
+        with pd.ExcelWriter(filepath, engine="xlsxwriter") as writer:
+            df_summary.to_excel(writer, sheet_name="SUMMARY", index=False)
+            df_options.to_excel(writer, sheet_name="OPTIONS", index=False)
+            df_details.to_excel(writer, sheet_name="DETAILS", index=False)
+
+            wb = writer.book
+            ws = writer.sheets["SUMMARY"]
+            fmt_bold = wb.add_format({"bold": True})
+            ws.set_column("A:A", 18, fmt_bold)
+            ws.set_column("B:Z", 30)
+
+        return str(filepath)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "failed_pending": len(self.failed_items),
+            "duplicates": self.duplicates,
+            "last_duplicate": self.last_duplicate,
+            "last_error": self.last_error,
+        }
+
+    # ---------- internal ----------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _ensure_schema(self) -> None:
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="quote-log-writer", daemon=True)
+                self._writer.start()
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    self._queue.task_done()
+                    return
+                batch = [item]
+                stop = False
+                # Gom thêm quote đang chờ (tối đa batch_size / interval) rồi ghi 1 lần
+                while len(batch) < self.batch_size:
+                    try:
+                        nxt = self._queue.get(timeout=self.interval)
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        stop = True
+                        self._queue.task_done()
+                        break
+                    batch.append(nxt)
+                try:
+                    self._commit(conn, batch)
+                except Exception as e:
+                    # Cả transaction đã rollback -> ghi lại từng quote, không bỏ cả batch
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    for item in batch:
+                        self._write_one(conn, item)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[tuple]) -> None:
+        """Ghi batch trong 1 transaction; counter chỉ cập nhật khi commit xong."""
+        duplicates = self._write_batch(conn, batch)
+        self.written += len(batch)
+        self.duplicates += len(duplicates)
+        if duplicates:
+            self.last_duplicate = duplicates[-1]
+
+    def _write_one(self, conn: sqlite3.Connection, item: tuple) -> None:
+        for attempt in range(WRITE_RETRIES):
+            try:
+                self._commit(conn, [item])
+                return
+            except sqlite3.OperationalError as e:  # database is locked / busy -> chờ rồi thử lại
+                self.last_error = f"{type(e).__name__}: {e}"
+                time.sleep(RETRY_DELAY_SECONDS * (attempt + 1))
+            except Exception as e:                  # giá trị hỏng... -> thử lại cũng vậy
+                self.last_error = f"{type(e).__name__}: {e}"
+                break
+        self._keep_failed(item)
+
+    def _keep_failed(self, item: tuple) -> None:
+        self.failed += 1
+        with self._lock:
+            self.failed_items.append(item)
+        summary, options, details, logged_at = item
+        record = {"LoggedAt": logged_at, "error": self.last_error, "summary": summary, "options": options, "details": details}
+        try:
+            with open(self.failed_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            pass
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple]) -> List[str]:
+        """INSERT cả batch trong 1 transaction. Trả về các ref bị đổi do trùng ("Q1 -> Q1-2")."""
+        summary_cols = SUMMARY_COLUMNS[:2] + ["LoggedAt"] + SUMMARY_COLUMNS[2:]
+        sql_summary = _insert_sql("quote_summary", summary_cols, "INSERT OR IGNORE")
+        sql_option = _insert_sql("quote_options", ["QuoteRef"] + OPTION_COLUMNS)
+        sql_detail = _insert_sql("quote_details", ["QuoteRef"] + DETAIL_COLUMNS)
+
+        duplicates = []
+        with conn:
+            for summary, options, details, logged_at in batch:
+                ref = summary["QuoteRef"]
+                row = dict(summary, LoggedAt=logged_at)
+                cur = conn.execute(sql_summary, [_value(row.get(c)) for c in summary_cols])
+                if cur.rowcount == 0:
+                    # Ref đã có trong log (append-only) -> lưu dưới ref có hậu tố, không bỏ bản ghi
+                    ref = self._free_ref(conn, ref)
+                    row["QuoteRef"] = ref
+                    conn.execute(sql_summary, [_value(row.get(c)) for c in summary_cols])
+                    duplicates.append(f"{summary['QuoteRef']} -> {ref}")
+                conn.executemany(sql_option, [[ref] + [_value(o.get(c)) for c in OPTION_COLUMNS] for o in options])
+                conn.executemany(sql_detail, [[ref] + [_value(d.get(c)) for c in DETAIL_COLUMNS] for d in details])
+        return duplicates
+
+    @staticmethod
+    def _free_ref(conn: sqlite3.Connection, ref: str) -> str:
+        n = 2
+        while conn.execute('SELECT 1 FROM quote_summary WHERE "QuoteRef" = ?', (f"{ref}-{n}",)).fetchone():
+            n += 1
+        return f"{ref}-{n}"
+
+
+# ================= REGISTRY (1 store / file / process) =================
+
+_STORES: Dict[str, QuoteLogStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_quote_log(db_path: Path | str = QUOTE_LOG_DB) -> QuoteLogStore:
+    key = str(Path(db_path).resolve())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = QuoteLogStore(db_path)
+            _STORES[key] = store
+        return store
+
+
+@atexit.register
+def _flush_all() -> None:
+    # Thoát process: ghi nốt các quote còn trong hàng đợi
+    for store in list(_STORES.values()):
+        store.close()
@@ -0,0 +1,432 @@
+# ==================== QUOTE_SERVICE.PY ====================
+"""
+Service HTTP/JSON báo giá nội bộ (stdlib http.server).
+
+Master + MasterIndex nằm sẵn trong RAM (MasterProvider): CRM export,
+macro email, demo Engine... gọi HTTP là có giá trong vài ms, không phải
+tự load_master() và parse workbook 8 MB mỗi lần.
+
+- Mỗi request lấy snapshot Master hiện tại; Normalize publish file mới
+  (signature path + mtime + size đổi) -> provider reload ở background rồi
+  swap, request đang chạy vẫn dùng snapshot cũ.
+- Kết nối được xử lý bởi worker pool cố định (ThreadPoolExecutor), không
+  sinh thread không giới hạn như ThreadingHTTPServer.
+- Kết quả đi qua quote_cache (LRU theo version Master + Schedule); Schedule
+  cũng hot-reload qua schedule_provider.
+
+Endpoint:
+    GET  /health        version Master / Schedule, số dòng, lỗi reload gần nhất
+    GET  /stats         thống kê service + quote cache + trace theo bước
+    POST /quote         1 request  -> 1 kết quả
+    POST /quotes        {"requests": [...]} -> {"results": [...]} (1 batch)
+    POST /reload        ép kiểm tra file Master + Schedule ngay và chờ reload xong
+
+Body 1 request:
+    {"customer": "ACME", "pol": "HCM", "place_of_delivery": "CHICAGO",
+     "pod": null, "cargo_ready_date": "2026-06-01", "commodity_type": "FAK",
+     "is_soc": false, "containers": [{"type": "40HQ", "quantity": 2}],
+     "max_options": 5, "markup_map": {"ONE": 50}, "markup_rules": ["MARKUP-RULE: ..."],
+     "tier": "GOLD", "trace": false}
+    "trace": true -> mỗi kết quả có thêm "trace" (phễu lọc + thời gian từng bước)
+
+Chạy (từ thư mục App):
+    python -m common.quote_service --port 8765 --workers 8
+
+Script khác gọi: remote_quotes([{...}, ...]) hoặc POST JSON bằng bất kỳ HTTP client nào.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .master_provider import MasterProvider, get_master_provider
+from .schedule_provider import ScheduleProvider, get_schedule_provider
+from .models import (
+    MASTER_FILE,
+    ContainerPlanItem,
+    CustomerInfo,
+    EngineOptions,
+    QuoteRequest,
+    ShipmentInfo,
+)
+from .pricing_rules import PricingRules
+from .quote_cache import QUOTE_CACHE, QuoteCache, cached_generate_quotes
+from .quote_trace import TRACE_STATS
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+
+# Giới hạn body (bytes) và số request trong 1 batch
+MAX_BODY_BYTES = 5 * 1024 * 1024
+MAX_BATCH_SIZE = 2000
+
+# Kết nối keep-alive rảnh quá bao lâu (giây) thì đóng, trả worker về pool
+KEEPALIVE_IDLE_SECONDS = 2
+
+
+class BadRequest(ValueError):
+    pass
+
+
+# ================= JSON <-> QuoteRequest =================
+
+def request_from_payload(data: Dict[str, Any]) -> QuoteRequest:
+    """Dict JSON -> QuoteRequest của cost_engine. Thiếu trường bắt buộc -> BadRequest."""
+    if not isinstance(data, dict):
+        raise BadRequest("Request phải là JSON object.")
+    for key in ("pol", "place_of_delivery", "containers"):
+        if not data.get(key):
+            raise BadRequest(f"Thiếu trường bắt buộc: {key}")
+
+    try:
+        containers = [
+            ContainerPlanItem(type=str(c["type"]).upper().strip(), quantity=int(c.get("quantity", 1)))
+            for c in data["containers"]
+        ]
+    except (TypeError, KeyError, ValueError, AttributeError):
+        raise BadRequest('containers phải là list [{"type": "40HQ", "quantity": 1}, ...]')
+    if any(c.quantity < 1 for c in containers):
+        raise BadRequest("containers: quantity phải >= 1.")
+
+    try:
+        max_options = int(data.get("max_options", 5))
+    except (TypeError, ValueError):
+        raise BadRequest("max_options phải là số nguyên.")
+    if max_options < 1:
+        raise BadRequest("max_options phải >= 1.")
+
+    markup = data.get("markup_map") or {}
+    if not isinstance(markup, dict):
+        raise BadRequest('markup_map phải là object {"ONE": 50, ...}')
+    try:
+        markup_map = {str(k).upper(): float(v) for k, v in markup.items()}
+    except (TypeError, ValueError):
+        raise BadRequest("markup_map: giá trị markup phải là số.")
+    if not all(math.isfinite(v) for v in markup_map.values()):
+        raise BadRequest("markup_map: giá trị markup phải là số hữu hạn.")
+
+    opts = EngineOptions(
+        preferred_carriers=data.get("preferred_carriers"),
+        excluded_carriers=data.get("excluded_carriers"),
+        max_options_per_quote=max_options,
+        currency=data.get("currency", "USD"),
+        trace=bool(data.get("trace", False)),
+    )
+    opts.markup_map = markup_map
+    if data.get("markup_rules"):
+        if not isinstance(data["markup_rules"], list):
+            raise BadRequest('markup_rules phải là list ["MARKUP-RULE: ...", ...]')
+        try:
+            opts.pricing_rules = PricingRules.from_lines(data["markup_rules"], strict=True)
+        except ValueError as e:
+            raise BadRequest(f"markup_rules: {e}")
+
+    return QuoteRequest(
+        customer=CustomerInfo(
+            name=str(data.get("customer") or "API"),
+            contact_person=data.get("contact_person"),
+            email=data.get("email"),
+            sales_person=data.get("sales_person"),
+            tier=data.get("tier"),
+        ),
+        shipment=ShipmentInfo(
+            pol=str(data["pol"]).upper().strip(),
+            pod=data.get("pod") or None,
+            place_of_delivery=str(data["place_of_delivery"]),
+            cargo_ready_date=data.get("cargo_ready_date"),
+            incoterm=data.get("incoterm"),
+            commodity_type=data.get("commodity_type") or "ANY",
+            is_soc=bool(data.get("is_soc", False)),
+        ),
+        containers=containers,
+        engine_options=opts,
+    )
+
+
+def to_jsonable(value: Any) -> Any:
+    """Kết quả engine -> kiểu JSON thuần (NaN -> null, numpy / Timestamp -> số / ISO)."""
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, bool)):
+        return value
+    return str(value)
+
+
+# ================= SERVICE =================
+
+class QuoteService:
+    """Phần xử lý (không dính HTTP) để test / nhúng vào tool khác."""
+
+    def __init__(
+        self,
+        provider: MasterProvider,
+        cache: QuoteCache = QUOTE_CACHE,
+        schedules: Optional[ScheduleProvider] = None,
+    ):
+        self.provider = provider
+        self.schedules = schedules or get_schedule_provider()
+        self.cache = cache
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "quotes": 0, "errors": 0}
+        self.busy_seconds = 0.0
+
+    def quote_many(self, payloads: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        requests = [request_from_payload(p) for p in payloads]
+        snap = self.provider.get()
+        t0 = time.perf_counter()
+        results = cached_generate_quotes(snap.frame, requests, self.cache)
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            self.counters["quotes"] += len(requests)
+            self.busy_seconds += elapsed
+        return snap.version, results
+
+    def health(self) -> Dict[str, Any]:
+        snap = self.provider.get()
+        return {
+            "status": "ok",
+            "master_version": snap.version,
+            "master_file": str(self.provider.path),
+            "master_rows": int(len(snap.frame)),
+            "loaded_at": datetime.fromtimestamp(snap.loaded_at).isoformat(timespec="seconds"),
+            "reload_count": self.provider.reload_count,
+            "last_reload_error": self.provider.last_error,
+            "schedule_version": self.schedules.version,
+            "schedule_reload_count": self.schedules.reload_count,
+            "schedule_last_error": self.schedules.last_error,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            busy = self.busy_seconds
+        return {
+            **counters,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "mean_quote_ms": (busy * 1000 / counters["quotes"]) if counters["quotes"] else None,
+            "master_version": self.provider.version,
+            "cache": self.cache.stats(),
+            "trace": TRACE_STATS.frame().to_dict("records"),
+        }
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+
+class QuoteRequestHandler(BaseHTTPRequestHandler):
+    server: "QuoteHTTPServer"
+    protocol_version = "HTTP/1.1"
+    # Kết nối keep-alive rảnh quá lâu -> đóng, trả worker về pool
+    timeout = KEEPALIVE_IDLE_SECONDS
+
+    # ---------- routing ----------
+    def do_GET(self) -> None:
+        self._dispatch({
+            "/health": lambda: self.server.service.health(),
+            "/stats": lambda: self.server.service.stats(),
+        })
+
+    def do_POST(self) -> None:
+        self._dispatch({
+            "/quote": self._quote,
+            "/quotes": self._quotes,
+            "/reload": self._reload,
+        })
+
+    def _dispatch(self, routes: Dict[str, Any]) -> None:
+        service = self.server.service
+        service.count("requests")
+        route = routes.get(self.path.split("?", 1)[0].rstrip("/") or "/")
+        if route is None:
+            self._send(HTTPStatus.NOT_FOUND, {"error": "NOT_FOUND", "message": f"Không có endpoint {self.path}"})
+            return
+        try:
+            self._send(HTTPStatus.OK, route())
+        except BadRequest as e:
+            service.count("errors")
+            self._send(HTTPStatus.BAD_REQUEST, {"error": "BAD_REQUEST", "message": str(e)})
+        except FileNotFoundError as e:
+            service.count("errors")
+            self._send(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "NO_MASTER", "message": str(e)})
+        except Exception as e:
+            service.count("errors")
+            self.log_error("quote failed: %r", e)
+            self._send(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "INTERNAL", "message": f"{type(e).__name__}: {e}"})
+
+    # ---------- endpoints ----------
+    def _quote(self) -> Dict[str, Any]:
+        version, results = self.server.service.quote_many([self._body()])
+        return {"master_version": version, **results[0]}
+
+    def _quotes(self) -> Dict[str, Any]:
+        body = self._body()
+        payloads = body.get("requests") if isinstance(body, dict) else body
+        if not isinstance(payloads, list):
+            raise BadRequest('Body phải là {"requests": [...]} hoặc 1 list request.')
+        if len(payloads) > MAX_BATCH_SIZE:
+            raise BadRequest(f"Tối đa {MAX_BATCH_SIZE} request / batch.")
+        version, results = self.server.service.quote_many(payloads)
+        return {"master_version": version, "results": results}
+
+    def _reload(self) -> Dict[str, Any]:
+        self.server.service.provider.refresh(wait=True)
+        self.server.service.schedules.refresh(wait=True)
+        return self.server.service.health()
+
+    # ---------- I/O ----------
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            raise BadRequest("Body rỗng.")
+        if length > MAX_BODY_BYTES:
+            raise BadRequest(f"Body quá lớn (> {MAX_BODY_BYTES} bytes).")
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise BadRequest(f"JSON không hợp lệ: {e}")
+
+    def _send(self, status: HTTPStatus, payload: Dict[str, Any]) -> None:
+        data = json.dumps(to_jsonable(payload), ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if self.server.saturated():
+            # Đã có kết nối khác chờ worker -> không giữ keep-alive chiếm worker
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class QuoteHTTPServer(HTTPServer):
+    """HTTPServer xử lý mỗi kết nối trên 1 worker của pool cố định."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: QuoteService, workers: int = DEFAULT_WORKERS, quiet: bool = False):
+        super().__init__(address, QuoteRequestHandler)
+        self.service = service
+        self.quiet = quiet
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quote-worker")
+        self._connections = 0  # kết nối đang giữ worker + đang chờ worker
+        self._conn_lock = threading.Lock()
+
+    def saturated(self) -> bool:
+        """True nếu số kết nối vượt số worker (có kết nối đang xếp hàng)."""
+        with self._conn_lock:
+            return self._connections > self.workers
+
+    def process_request(self, request, client_address) -> None:
+        with self._conn_lock:
+            self._connections += 1
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._conn_lock:
+                self._connections -= 1
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def create_server(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    master_path: Path | str = MASTER_FILE,
+    workers: int = DEFAULT_WORKERS,
+    quiet: bool = False,
+) -> QuoteHTTPServer:
+    """Tạo server và load Master ngay (request đầu tiên không phải chờ)."""
+    provider = get_master_provider(master_path)
+    provider.get()
+    return QuoteHTTPServer((host, port), QuoteService(provider), workers=workers, quiet=quiet)
+
+
+# ================= CLIENT =================
+
+def remote_quotes(
+    payloads: List[Dict[str, Any]],
+    base_url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+    timeout: float = 30.0,
+) -> List[Dict[str, Any]]:
+    """Gọi POST /quotes của service đang chạy (cho script CRM / macro, chỉ cần stdlib)."""
+    import urllib.request
+
+    body = json.dumps({"requests": payloads}, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(
+        base_url.rstrip("/") + "/quotes",
+        data=body,
+        method="POST",
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))["results"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Service HTTP/JSON báo giá (Master giữ sẵn trong RAM).")
+    ap.add_argument("--host", default=DEFAULT_HOST)
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--master", default=str(MASTER_FILE), help="Đường dẫn Master_FullPricing.xlsx")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    ap.add_argument("--quiet", action="store_true", help="Không log từng request")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    server = create_server(args.host, args.port, args.master, args.workers, args.quiet)
+    health = server.service.health()
+    print(
+        f"Quote service http://{args.host}:{args.port}  "
+        f"Master {health['master_rows']:,} dòng (version {health['master_version']}, "
+        f"load {time.perf_counter() - t0:.1f}s), {args.workers} workers"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
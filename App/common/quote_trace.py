@@ -0,0 +1,157 @@
+# ==================== QUOTE_TRACE.PY ====================
+"""
+Trace từng bước của quote (phễu lọc + thời gian), dùng cho cả
+Engine.generate_quote và common.cost_engine.generate_quote.
+
+- Bật bằng EngineOptions.trace = True. Mỗi bước ghi: tên bước, số dòng
+  vào / ra, thời gian (micro giây) kể từ bước trước.
+- Kết quả quote (kể cả kết quả lỗi) có thêm key "trace" = list các bước
+  -> biết bước nào chậm và bước nào làm quote ra 0 option.
+- Mọi trace được cộng dồn vào TRACE_STATS (histogram thời gian theo bước,
+  đếm số lần mỗi bước là nơi loại hết dòng) để xem trên app.
+- Tắt trace: engine dùng NULL_TRACE, mọi lời gọi là no-op.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Thứ tự bước chuẩn (cost_engine + Engine; engine nào không có bước nào thì bỏ qua)
+STAGES = (
+    "pol",
+    "place",
+    "pod",
+    "validity",
+    "commodity_soc",
+    "carrier",
+    "rate_availability",
+    "costing",
+    "ranking",
+    "schedule_join",
+    "build_result",
+)
+
+# Cận trên các bucket histogram (micro giây); bucket cuối là > 50 ms
+HISTOGRAM_EDGES_US = (10, 50, 100, 500, 1_000, 5_000, 10_000, 50_000)
+
+
+class QuoteTrace:
+    def __init__(self, engine: str):
+        self.engine = engine
+        self.stages: List[Dict[str, Any]] = []
+        self._t = time.perf_counter_ns()
+
+    def __bool__(self) -> bool:
+        return True
+
+    def reset_clock(self) -> None:
+        self._t = time.perf_counter_ns()
+
+    def stage(self, name: str, rows_in: int, rows_out: int, elapsed_us: Optional[float] = None, **extra: Any) -> None:
+        """Ghi 1 bước; thời gian mặc định = từ bước trước (hoặc reset_clock) tới giờ."""
+        now = time.perf_counter_ns()
+        if elapsed_us is None:
+            elapsed_us = (now - self._t) / 1000
+        entry = {"stage": name, "rows_in": int(rows_in), "rows_out": int(rows_out), "us": round(float(elapsed_us), 1)}
+        entry.update(extra)
+        self.stages.append(entry)
+        self._t = time.perf_counter_ns()
+
+    def attach(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Gắn trace vào kết quả và cộng vào TRACE_STATS."""
+        result["trace"] = self.stages
+        TRACE_STATS.add(self.engine, self.stages, "error" not in result)
+        return result
+
+
+class _NullTrace:
+    """Trace tắt: không đo, không ghi."""
+
+    def __bool__(self) -> bool:
+        return False
+
+    def reset_clock(self) -> None:
+        pass
+
+    def stage(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def attach(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return result
+
+
+NULL_TRACE = _NullTrace()
+
+
+def start_trace(engine: str, options: Any):
+    """QuoteTrace nếu options.trace bật, ngược lại NULL_TRACE."""
+    return QuoteTrace(engine) if getattr(options, "trace", False) else NULL_TRACE
+
+
+class TraceStats:
+    """Cộng dồn trace của nhiều request: histogram thời gian + nơi phễu về 0."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.quotes: Dict[str, int] = {}
+            self.ok: Dict[str, int] = {}
+            # (engine, stage) -> [count, tổng us, max us, số lần làm rows về 0, buckets...]
+            self._stage: Dict[tuple, List[float]] = {}
+
+    def add(self, engine: str, stages: List[Dict[str, Any]], ok: bool) -> None:
+        zero_at = next((s["stage"] for s in stages if s["rows_out"] == 0), None)
+        with self._lock:
+            self.quotes[engine] = self.quotes.get(engine, 0) + 1
+            self.ok[engine] = self.ok.get(engine, 0) + int(ok)
+            for s in stages:
+                acc = self._stage.get((engine, s["stage"]))
+                if acc is None:
+                    acc = [0, 0.0, 0.0, 0] + [0] * (len(HISTOGRAM_EDGES_US) + 1)
+                    self._stage[(engine, s["stage"])] = acc
+                us = s["us"]
+                acc[0] += 1
+                acc[1] += us
+                acc[2] = max(acc[2], us)
+                acc[3] += int(s["stage"] == zero_at)
+                acc[4 + int(np.searchsorted(HISTOGRAM_EDGES_US, us))] += 1
+
+    def frame(self, engine: Optional[str] = None) -> pd.DataFrame:
+        """1 dòng / (engine, bước): count, mean/max us, zero_out, cột histogram."""
+        labels = [f"<={e}us" for e in HISTOGRAM_EDGES_US] + [f">{HISTOGRAM_EDGES_US[-1]}us"]
+        order = {name: i for i, name in enumerate(STAGES)}
+        with self._lock:
+            items = sorted(
+                ((k, list(v)) for k, v in self._stage.items() if engine is None or k[0] == engine),
+                key=lambda kv: (kv[0][0], order.get(kv[0][1], len(order))),
+            )
+        rows = []
+        for (eng, stage), acc in items:
+            row = {
+                "engine": eng,
+                "stage": stage,
+                "count": int(acc[0]),
+                "mean_us": acc[1] / acc[0] if acc[0] else 0.0,
+                "max_us": acc[2],
+                "zero_out": int(acc[3]),
+            }
+            row.update(zip(labels, (int(v) for v in acc[4:])))
+            rows.append(row)
+        return pd.DataFrame(rows, columns=["engine", "stage", "count", "mean_us", "max_us", "zero_out"] + labels)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"quotes": dict(self.quotes), "ok": dict(self.ok)}
+
+
+# Thống kê dùng chung cho cả process (app, service, CLI)
+TRACE_STATS = TraceStats()
@@ -0,0 +1,321 @@
+# ==================== RATE_CUBE.PY ====================
+"""
+Rate cube: giá rẻ nhất theo từng ô (POL × Place × POD × Carrier × container).
+
+Sales hay cần cả lưới ("mọi hãng, mọi điểm inland US, 20/40/40HQ từ HCM"),
+trước đây phải generate_quote từng Place. Cube build 1 lần cho mỗi
+(version Master, ngày hiệu lực, REEFER, SOC):
+
+- Lane = 1 tổ hợp (POL, PlaceOfDelivery, POD, Carrier) có trong Master.
+- Mỗi ô (lane, container) giữ giá thấp nhất còn hiệu lực + row id nguồn
+  (vị trí dòng trong Master). Các container của cùng lane có thể đến từ
+  các dòng giá khác nhau. 20RF / 40RF lấy từ cột đã quy đổi lúc load Master.
+- Giá gốc chưa cộng markup.
+
+Tra 1 ô / top N hãng cho 1 lane chỉ là dict + vài phép numpy trên vài chục
+lane -> cỡ micro giây; slice()/grid() dùng cho xuất lưới.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .cost_engine import commodity_mask
+from .master_index import MasterIndex, get_master_index, top_n
+from .models import REEFER_COLUMN_RULES, cargo_timestamp
+
+
+CUBE_CONTAINERS = ("20GP", "40GP", "40HQ", "45HQ", "40NOR", "20RF", "40RF")
+
+# Tên container trên trang / Shipments -> tên cột trong Master
+CONTAINER_ALIASES = {"45": "45HQ"}
+
+# Số cube giữ trong bộ nhớ (mỗi cube ứng với 1 ngày / REEFER / SOC)
+RATE_CUBE_MAXSIZE = 8
+
+Names = Union[str, Iterable[str], None]
+
+
+def _as_list(value: Names) -> Optional[List[str]]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class RateCube:
+    def __init__(
+        self,
+        index: MasterIndex,
+        as_of: str,
+        reefer: bool = False,
+        soc: bool = False,
+        containers: Tuple[str, ...] = CUBE_CONTAINERS,
+    ):
+        self.index = index
+        self.version = index.version
+        self.as_of = as_of
+        self.reefer = reefer
+        self.soc = soc
+        self.containers = list(containers)
+        self._col = {c: j for j, c in enumerate(self.containers)}
+
+        # Dòng còn hiệu lực tại as_of + đúng FAK/REEFER/SOC
+        rows = index.filter_validity(index.all_rows, as_of)
+        rows = rows[commodity_mask(index, rows, reefer, soc)]
+        rates = index.rate_matrix(rows, self.containers, REEFER_COLUMN_RULES)
+
+        # Lane id theo (POL, Place, POD, Carrier); np.unique sort theo đúng thứ tự đó
+        stacked = np.stack([
+            index.pol.codes[rows],
+            index.place.codes[rows],
+            index.pod.codes[rows],
+            index.carrier.codes[rows],
+        ], axis=1)
+        if rows.size:
+            keys, lane_of = np.unique(stacked, axis=0, return_inverse=True)
+            lane_of = lane_of.reshape(-1)
+        else:
+            keys, lane_of = np.empty((0, 4), dtype=np.int32), np.empty(0, dtype=np.intp)
+
+        self.n_lanes = len(keys)
+        self.lane_pol, self.lane_place, self.lane_pod, self.lane_carrier = (
+            keys[:, k].astype(np.int32) for k in range(4)
+        )
+
+        # Ô = giá nhỏ nhất của lane; hoà giá lấy row id nhỏ hơn
+        self.rates = np.full((self.n_lanes, len(self.containers)), np.nan)
+        self.source_row = np.full((self.n_lanes, len(self.containers)), -1, dtype=np.intp)
+        for j in range(len(self.containers)):
+            ok = np.flatnonzero(~np.isnan(rates[:, j]))
+            if ok.size == 0:
+                continue
+            lanes = lane_of[ok]
+            order = np.lexsort((rows[ok], rates[ok, j], lanes))
+            first = np.ones(order.size, dtype=bool)
+            first[1:] = lanes[order][1:] != lanes[order][:-1]
+            pick = ok[order[first]]
+            self.rates[lane_of[pick], j] = rates[pick, j]
+            self.source_row[lane_of[pick], j] = rows[pick]
+
+        # Tra nhanh: lane theo key đầy đủ, và các lane theo (POL, Place)
+        self._lane_id: Dict[tuple, int] = dict(zip(map(tuple, keys.tolist()), range(self.n_lanes)))
+        self._by_pol_place: Dict[tuple, np.ndarray] = {}
+        if self.n_lanes:
+            pp = keys[:, :2]
+            starts = np.flatnonzero(np.r_[True, (pp[1:] != pp[:-1]).any(axis=1)])
+            ends = np.r_[starts[1:], self.n_lanes]
+            for s, e in zip(starts.tolist(), ends.tolist()):
+                self._by_pol_place[(int(pp[s, 0]), int(pp[s, 1]))] = np.arange(s, e)
+
+    # ---------- tra cứu ----------
+    def rate(self, pol: str, place: str, pod: str, carrier: str, container: str) -> Tuple[float, int]:
+        """(giá, row id nguồn) của 1 ô; (nan, -1) nếu không có."""
+        j = self._col.get(CONTAINER_ALIASES.get(container, container))
+        key = self._codes(pol, place, pod, carrier)
+        lane = self._lane_id.get(key) if key is not None else None
+        if j is None or lane is None:
+            return float("nan"), -1
+        return float(self.rates[lane, j]), int(self.source_row[lane, j])
+
+    def lanes(
+        self,
+        pol: Names = None,
+        place: Names = None,
+        pod: Names = None,
+        carrier: Names = None,
+    ) -> np.ndarray:
+        """
+        Lane id thoả filter. pol / carrier: so khớp đúng; place / pod: chứa
+        chuỗi (giống generate_quote). Mỗi tham số nhận 1 giá trị hoặc list.
+        """
+        ix = self.index
+        pols, places = _as_list(pol), _as_list(place)
+
+        if pols is not None and places is not None:
+            # Đường nhanh: ghép các nhóm lane (POL, Place) có sẵn
+            pol_codes = [ix.pol._code_of.get(str(p).upper().strip()) for p in pols]
+            place_codes = np.flatnonzero(np.logical_or.reduce([ix.place.codes_containing(p) for p in places]))
+            parts = [
+                self._by_pol_place[(pc, int(lc))]
+                for pc in pol_codes if pc is not None
+                for lc in place_codes
+                if (pc, int(lc)) in self._by_pol_place
+            ]
+            lanes = np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+            pols = places = None
+        else:
+            lanes = np.arange(self.n_lanes)
+
+        mask = np.ones(lanes.size, dtype=bool)
+        if pols is not None:
+            wanted = {str(p).upper().strip() for p in pols}
+            mask &= np.isin(self.lane_pol[lanes], [c for v, c in ix.pol._code_of.items() if v in wanted])
+        if places is not None:
+            mask &= np.logical_or.reduce([ix.place.codes_containing(p) for p in places])[self.lane_place[lanes]]
+        pods = _as_list(pod)
+        if pods is not None:
+            mask &= np.logical_or.reduce([ix.pod.codes_containing(p) for p in pods])[self.lane_pod[lanes]]
+        carriers = _as_list(carrier)
+        if carriers is not None:
+            wanted = {str(c).upper().strip() for c in carriers}
+            mask &= np.isin(self.lane_carrier[lanes], [c for v, c in ix.carrier._code_of.items() if v in wanted])
+        return np.sort(lanes[mask])
+
+    def cheapest(
+        self,
+        pol: str,
+        place: str,
+        container: str,
+        n: int = 5,
+        pod: Names = None,
+        per_carrier: bool = True,
+    ) -> pd.DataFrame:
+        """
+        N ô rẻ nhất cho 1 lane (POL + Place [+ POD]) theo 1 loại container.
+        per_carrier=True: mỗi hãng chỉ lấy ô rẻ nhất (như generate_quote).
+        """
+        lanes = self.cheapest_lanes(pol, place, container, n, pod, per_carrier)
+        return self._frame(lanes, self._known([container]))
+
+    def cheapest_lanes(
+        self,
+        pol: str,
+        place: str,
+        container: str,
+        n: int = 5,
+        pod: Names = None,
+        per_carrier: bool = True,
+    ) -> np.ndarray:
+        """Như cheapest() nhưng trả lane id (rẻ -> đắt), không dựng DataFrame."""
+        j = self._col.get(CONTAINER_ALIASES.get(container, container))
+        if j is None:
+            return np.empty(0, dtype=np.intp)
+        lanes = self.lanes(pol=pol, place=place, pod=pod)
+        lanes = lanes[~np.isnan(self.rates[lanes, j])]
+        if per_carrier and lanes.size:
+            carriers = self.lane_carrier[lanes]
+            order = np.lexsort((lanes, self.rates[lanes, j], carriers))
+            first = np.ones(order.size, dtype=bool)
+            first[1:] = carriers[order][1:] != carriers[order][:-1]
+            lanes = lanes[order[first]]
+        return lanes[top_n(self.rates[lanes, j], n)]
+
+    def slice(
+        self,
+        pol: Names = None,
+        place: Names = None,
+        pod: Names = None,
+        carrier: Names = None,
+        containers: Optional[List[str]] = None,
+        with_rows: bool = False,
+    ) -> pd.DataFrame:
+        """
+        1 dòng / lane, 1 cột / container (bỏ lane không có giá nào).
+        Container cube không có (kể cả sau CONTAINER_ALIASES) bị bỏ qua.
+        """
+        containers = self._known(containers) if containers else self.containers
+        if not containers:
+            return pd.DataFrame()
+        lanes = self.lanes(pol, place, pod, carrier)
+        cols = [self._col[c] for c in containers]
+        lanes = lanes[~np.isnan(self.rates[np.ix_(lanes, cols)]).all(axis=1)]
+        return self._frame(lanes, containers, with_rows)
+
+    def grid(
+        self,
+        container: str,
+        pol: Names = None,
+        place: Names = None,
+        pod: Names = None,
+        carrier: Names = None,
+    ) -> pd.DataFrame:
+        """
+        Lưới PlaceOfDelivery × Carrier (giá thấp nhất qua các POD) cho 1 container.
+        Container không có trong cube -> lưới rỗng.
+        """
+        known = self._known([container])
+        if not known:
+            return pd.DataFrame()
+        df = self.slice(pol, place, pod, carrier, containers=known)
+        if df.empty:
+            return pd.DataFrame()
+        return df.pivot_table(index="PlaceOfDelivery", columns="Carrier", values=known[0], aggfunc="min")
+
+    # ---------- internal ----------
+    def _known(self, containers: List[str]) -> List[str]:
+        """Tên cột cube của các container (qua CONTAINER_ALIASES), bỏ tên không có."""
+        out = []
+        for c in containers:
+            c = CONTAINER_ALIASES.get(c, c)
+            if c in self._col and c not in out:
+                out.append(c)
+        return out
+
+    def _codes(self, pol: str, place: str, pod: str, carrier: str) -> Optional[tuple]:
+        ix = self.index
+        codes = []
+        for vocab, value in ((ix.pol, pol), (ix.place, place), (ix.pod, pod), (ix.carrier, carrier)):
+            code = vocab._code_of.get(str(value if value is not None else "").upper().strip())
+            if code is None:
+                return None
+            codes.append(code)
+        return tuple(codes)
+
+    def _frame(self, lanes: np.ndarray, containers: List[str], with_rows: bool = True) -> pd.DataFrame:
+        ix = self.index
+        data = {
+            "POL": ix.pol.values[self.lane_pol[lanes]],
+            "PlaceOfDelivery": ix.place.values[self.lane_place[lanes]],
+            "POD": ix.pod.values[self.lane_pod[lanes]],
+            "Carrier": ix.carrier.values[self.lane_carrier[lanes]],
+        }
+        for c in containers:
+            data[c] = self.rates[lanes, self._col[c]]
+        if with_rows:
+            for c in containers:
+                data[f"{c}_row"] = self.source_row[lanes, self._col[c]]
+        return pd.DataFrame(data)
+
+
+# ================= CACHE CUBE THEO VERSION MASTER =================
+
+_CUBES: "OrderedDict[tuple, RateCube]" = OrderedDict()
+_CUBES_LOCK = threading.Lock()
+
+
+def get_rate_cube(
+    master_df: pd.DataFrame,
+    as_of: Optional[str] = None,
+    reefer: bool = False,
+    soc: bool = False,
+) -> RateCube:
+    """
+    Cube dùng chung cho mọi session. Build lại khi Master đổi version
+    (cube của version cũ bị bỏ) hoặc khi hỏi ngày / REEFER / SOC khác.
+    """
+    index = get_master_index(master_df)
+    day = cargo_timestamp(as_of).date().isoformat()
+    key = (index.version, day, bool(reefer), bool(soc))
+
+    with _CUBES_LOCK:
+        cube = _CUBES.get(key)
+        if cube is not None:
+            _CUBES.move_to_end(key)
+            return cube
+
+    cube = RateCube(index, day, reefer=reefer, soc=soc)
+
+    with _CUBES_LOCK:
+        for old in [k for k in _CUBES if k[0] != index.version]:
+            del _CUBES[old]
+        _CUBES[key] = cube
+        while len(_CUBES) > RATE_CUBE_MAXSIZE:
+            _CUBES.popitem(last=False)
+    return cube
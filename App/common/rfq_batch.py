@@ -0,0 +1,446 @@
+# ==================== RFQ_BATCH.PY ====================
+"""
+Xử lý RFQ hàng loạt từ command line (thay cho quote từng lane trên UI).
+
+- Đọc file RFQ (CSV hoặc XLSX) theo kiểu streaming, từng dòng -> QuoteRequest.
+- Quote theo chunk song song (thread pool) trên 1 Master đã load; số chunk
+  đang chạy có giới hạn -> bộ nhớ không tăng theo kích thước file.
+- Ghi kết quả tuần tự ra CSV hoặc XLSX (xlsxwriter constant_memory),
+  đúng thứ tự dòng RFQ, mỗi option 1 dòng.
+- Markup, preferred / excluded carrier dùng chung 1 EngineOptions cho cả file.
+
+Cột RFQ (không phân biệt hoa thường, có alias):
+    POL, PlaceOfDelivery (Place / Destination / DEL), POD, CargoReadyDate (CRD),
+    Commodity, SOC, Customer,
+    số lượng theo cột container: 20GP, 40GP, 40HQ, 45HQ, 40NOR, 20RF, 40RF
+    hoặc 1 cột Containers dạng "2 x 40HQ, 1 x 20GP".
+
+Chạy (từ thư mục App):
+    python -m common.rfq_batch RFQ.xlsx -o RFQ_quoted.xlsx --markup ONE=50 --exclude ZIM
+    python -m common.rfq_batch RFQ.csv -o out.csv --workers 4 --chunk-size 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .cost_engine import generate_quotes
+from .master_provider import get_master_provider
+from .models import MASTER_FILE, EngineOptions
+from .pricing_rules import PricingRules
+from .quote_service import BadRequest, request_from_payload
+
+
+CONTAINER_TYPES = ("20GP", "40GP", "40HQ", "45HQ", "40NOR", "20RF", "40RF")
+
+DEFAULT_CHUNK_SIZE = 200
+# Phần numpy nhả GIL nên thread vẫn có lợi khi máy nhiều core
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_MAX_OPTIONS = 3
+
+# Tên cột RFQ (đã chuẩn hoá: UPPER, bỏ ký tự không phải chữ/số) -> field
+COLUMN_ALIASES = {
+    "POL": "pol",
+    "PORTOFLOADING": "pol",
+    "PLACEOFDELIVERY": "place_of_delivery",
+    "PLACE": "place_of_delivery",
+    "DESTINATION": "place_of_delivery",
+    "DEL": "place_of_delivery",
+    "POD": "pod",
+    "PORTOFDISCHARGE": "pod",
+    "CARGOREADYDATE": "cargo_ready_date",
+    "CRD": "cargo_ready_date",
+    "READYDATE": "cargo_ready_date",
+    "COMMODITY": "commodity_type",
+    "COMMODITYTYPE": "commodity_type",
+    "SOC": "is_soc",
+    "CUSTOMER": "customer",
+    "CONTAINERS": "containers",
+}
+
+OUTPUT_COLUMNS = [
+    "RFQRow", "POL", "PlaceOfDelivery", "POD", "Containers", "Rank", "Carrier", "QuotedPOD",
+    "QuotedPlace", "ContainerRates", "Total", "Currency", "Valid", "ETD", "TransitMin",
+    "TransitMax", "Status", "Message",
+]
+
+
+def _norm_header(value: Any) -> str:
+    return re.sub(r"[^A-Z0-9]", "", str(value or "").upper())
+
+
+# ================= ĐỌC RFQ (STREAMING) =================
+
+def iter_rfq_rows(path: Path | str, sheet: Optional[str] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(số dòng trong file, {header: giá trị}) từng dòng; bỏ dòng trống."""
+    path = Path(path)
+    if path.suffix.lower() in (".xlsx", ".xlsm"):
+        yield from _iter_xlsx(path, sheet)
+    else:
+        yield from _iter_csv(path)
+
+
+def _iter_csv(path: Path) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        for line_no, values in enumerate(reader, start=2):
+            if any(str(v).strip() for v in values):
+                yield line_no, dict(zip(header, values))
+
+
+def _iter_xlsx(path: Path, sheet: Optional[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        header: Optional[List[Any]] = None
+        for line_no, values in enumerate(ws.iter_rows(values_only=True), start=1):
+            if not any(v not in (None, "") for v in values):
+                continue
+            if header is None:
+                header = list(values)   # dòng không trống đầu tiên là header
+                continue
+            yield line_no, dict(zip(header, values))
+    finally:
+        wb.close()
+
+
+# ================= DÒNG RFQ -> QuoteRequest =================
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and np.isnan(value):
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def _truthy(value: Any) -> bool:
+    return _text(value).upper() in ("1", "Y", "YES", "TRUE", "X", "SOC")
+
+
+def _parse_containers(text: str) -> List[Dict[str, Any]]:
+    """'2 x 40HQ, 1x20GP' -> [{'type': '40HQ', 'quantity': 2}, ...]"""
+    return [
+        {"type": t, "quantity": int(q)}
+        for q, t in re.findall(r"(\d+)\s*[xX*]\s*([0-9A-Za-z]+)", text)
+    ]
+
+
+def row_to_payload(row: Dict[str, Any], default_customer: str = "RFQ") -> Dict[str, Any]:
+    """Dòng RFQ -> payload JSON như quote_service.request_from_payload nhận."""
+    fields: Dict[str, Any] = {}
+    containers: List[Dict[str, Any]] = []
+    for header, value in row.items():
+        key = _norm_header(header)
+        if key in CONTAINER_TYPES:
+            qty = _text(value)
+            if qty:
+                try:
+                    n = int(float(qty))
+                except ValueError:
+                    raise BadRequest(f"Số lượng {key} không hợp lệ: {qty}")
+                if n > 0:
+                    containers.append({"type": key, "quantity": n})
+        elif key in COLUMN_ALIASES:
+            fields[COLUMN_ALIASES[key]] = value
+
+    if fields.get("containers"):
+        containers.extend(_parse_containers(_text(fields["containers"])))
+
+    return {
+        "customer": _text(fields.get("customer")) or default_customer,
+        "pol": _text(fields.get("pol")),
+        "place_of_delivery": _text(fields.get("place_of_delivery")),
+        "pod": _text(fields.get("pod")) or None,
+        "cargo_ready_date": _text(fields.get("cargo_ready_date")) or None,
+        "commodity_type": _text(fields.get("commodity_type")) or "ANY",
+        "is_soc": _truthy(fields.get("is_soc")),
+        "containers": containers,
+    }
+
+
+# ================= KẾT QUẢ -> DÒNG OUTPUT =================
+
+def result_rows(row_no: int, payload: Dict[str, Any], result: Dict[str, Any]) -> List[List[Any]]:
+    base = [
+        row_no,
+        payload.get("pol", ""),
+        payload.get("place_of_delivery", ""),
+        payload.get("pod") or "",
+        ", ".join(f"{c['quantity']} x {c['type']}" for c in payload.get("containers", [])),
+    ]
+    if "error" in result:
+        return [base + [""] * 12 + [result["error"], result.get("message", "")]]
+
+    out = []
+    for opt in result["options"]:
+        rates = "; ".join(f"{k}={v:,.0f}" for k, v in opt["container_rates"].items())
+        out.append(base + [
+            opt["index"],
+            opt["carrier"],
+            opt["pod"],
+            opt["place_of_delivery"],
+            rates,
+            round(float(opt["total_ocean_amount"]), 2),
+            opt["currency"],
+            opt.get("valid_label") or "",
+            _text(opt.get("etd")),
+            _text(opt.get("transit_min")),
+            _text(opt.get("transit_max")),
+            "OK",
+            "",
+        ])
+    return out
+
+
+class _CsvSink:
+    def __init__(self, path: Path):
+        self._f = open(path, "w", newline="", encoding="utf-8-sig")
+        self._w = csv.writer(self._f)
+        self._w.writerow(OUTPUT_COLUMNS)
+
+    def write(self, row: List[Any]) -> None:
+        self._w.writerow(row)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _XlsxSink:
+    def __init__(self, path: Path):
+        import xlsxwriter
+
+        # constant_memory: mỗi dòng ghi xong là flush xuống file tạm
+        self._wb = xlsxwriter.Workbook(str(path), {"constant_memory": True})
+        self._ws = self._wb.add_worksheet("RFQ Quotes")
+        bold = self._wb.add_format({"bold": True, "bg_color": "#DDEBF7"})
+        self._money = self._wb.add_format({"num_format": "#,##0.00"})
+        self._ws.write_row(0, 0, OUTPUT_COLUMNS, bold)
+        self._ws.freeze_panes(1, 0)
+        self._total_col = OUTPUT_COLUMNS.index("Total")
+        self._row = 1
+
+    def write(self, row: List[Any]) -> None:
+        for col, value in enumerate(row):
+            if col == self._total_col and isinstance(value, float):
+                self._ws.write_number(self._row, col, value, self._money)
+            else:
+                self._ws.write(self._row, col, value)
+        self._row += 1
+
+    def close(self) -> None:
+        self._wb.close()
+
+
+def open_sink(path: Path | str):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return _XlsxSink(path) if path.suffix.lower() == ".xlsx" else _CsvSink(path)
+
+
+# ================= CHẠY =================
+
+class RfqStats:
+    def __init__(self):
+        self.rows = 0
+        self.quoted = 0
+        self.no_rate = 0
+        self.bad_rows = 0
+        self.options = 0
+        self.chunk_ms: List[float] = []
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        rate = self.rows / self.elapsed if self.elapsed else 0.0
+        line = (
+            f"{self.rows:,} dòng RFQ | OK {self.quoted:,} | không giá {self.no_rate:,} | "
+            f"lỗi dòng {self.bad_rows:,} | {self.options:,} option | "
+            f"{self.elapsed:.1f}s ({rate:,.0f} dòng/s)"
+        )
+        if self.chunk_ms:
+            p50, p95 = np.percentile(self.chunk_ms, [50, 95])
+            line += f" | chunk p50 {p50:.0f} ms, p95 {p95:.0f} ms"
+        return line
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _quote_chunk(master_df, chunk: List[Tuple[int, Dict[str, Any]]], opts: EngineOptions, tier: Optional[str]):
+    """Quote 1 chunk: dòng sai định dạng trả lỗi riêng, còn lại quote chung 1 batch."""
+    t0 = time.perf_counter()
+    payloads: List[Tuple[int, Dict[str, Any]]] = []
+    results: List[Optional[Dict[str, Any]]] = []
+    reqs, slots = [], []
+    for row_no, row in chunk:
+        payload: Dict[str, Any] = {}
+        try:
+            payload = row_to_payload(row)
+            req = request_from_payload(payload)
+        except BadRequest as e:
+            payloads.append((row_no, payload))
+            results.append({"error": "BAD_ROW", "message": str(e)})
+            continue
+        req.engine_options = opts
+        req.customer.tier = tier
+        payloads.append((row_no, payload))
+        results.append(None)
+        reqs.append(req)
+        slots.append(len(results) - 1)
+
+    if reqs:
+        for i, res in zip(slots, generate_quotes(master_df, reqs)):
+            results[i] = res
+    return payloads, results, (time.perf_counter() - t0) * 1000
+
+
+def process_rfq(
+    input_path: Path | str,
+    output_path: Path | str,
+    opts: EngineOptions,
+    master_df=None,
+    tier: Optional[str] = None,
+    sheet: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    progress_every: float = 5.0,
+) -> RfqStats:
+    """
+    Stream RFQ -> chunk -> thread pool -> ghi output theo đúng thứ tự.
+    Tối đa 2 x workers chunk nằm trong bộ nhớ cùng lúc.
+    """
+    if master_df is None:
+        master_df = get_master_provider(MASTER_FILE).get().frame
+
+    stats = RfqStats()
+    sink = open_sink(output_path)
+    last_report = time.perf_counter()
+    pending: deque = deque()
+
+    def drain_one() -> None:
+        nonlocal last_report
+        payloads, results, ms = pending.popleft().result()
+        stats.chunk_ms.append(ms)
+        for (row_no, payload), res in zip(payloads, results):
+            stats.rows += 1
+            if res.get("error") == "BAD_ROW":
+                stats.bad_rows += 1
+            elif "error" in res:
+                stats.no_rate += 1
+            else:
+                stats.quoted += 1
+                stats.options += len(res["options"])
+            for line in result_rows(row_no, payload, res):
+                sink.write(line)
+        if progress_every and time.perf_counter() - last_report >= progress_every:
+            last_report = time.perf_counter()
+            print(stats.summary(), file=sys.stderr)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rfq") as pool:
+            for chunk in _chunks(iter_rfq_rows(input_path, sheet), chunk_size):
+                pending.append(pool.submit(_quote_chunk, master_df, chunk, opts, tier))
+                while len(pending) >= 2 * workers:
+                    drain_one()
+            while pending:
+                drain_one()
+    finally:
+        sink.close()
+    return stats
+
+
+def _markup_arg(values: List[str]) -> Dict[str, float]:
+    out = {}
+    for v in values or []:
+        carrier, _, amount = v.partition("=")
+        out[carrier.strip().upper()] = float(amount)
+    return out
+
+
+def _list_arg(value: Optional[str]) -> Optional[List[str]]:
+    items = [v.strip().upper() for v in (value or "").split(",") if v.strip()]
+    return items or None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Quote hàng loạt file RFQ (CSV / XLSX) trên 1 Master đã load.")
+    ap.add_argument("input", help="File RFQ .csv / .xlsx")
+    ap.add_argument("-o", "--output", help="File kết quả .csv / .xlsx (mặc định <input>_quoted.xlsx)")
+    ap.add_argument("--sheet", help="Sheet RFQ (xlsx), mặc định sheet đầu")
+    ap.add_argument("--master", default=str(MASTER_FILE), help="Đường dẫn Master_FullPricing.xlsx")
+    ap.add_argument("--markup", action="append", metavar="CARRIER=USD", help="Markup theo hãng (lặp được)")
+    ap.add_argument("--rules", help="File text chứa các dòng DEFAULT-MARKUP / MARKUP-RULE")
+    ap.add_argument("--tier", help="Hạng khách cho rule markup")
+    ap.add_argument("--preferred", help="Chỉ lấy các hãng này (phân cách dấu phẩy)")
+    ap.add_argument("--exclude", help="Loại các hãng này (phân cách dấu phẩy)")
+    ap.add_argument("--max-options", type=int, default=DEFAULT_MAX_OPTIONS)
+    ap.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = ap.parse_args(argv)
+
+    output = args.output or str(Path(args.input).with_name(Path(args.input).stem + "_quoted.xlsx"))
+
+    opts = EngineOptions(
+        preferred_carriers=_list_arg(args.preferred),
+        excluded_carriers=_list_arg(args.exclude),
+        max_options_per_quote=args.max_options,
+    )
+    opts.markup_map = _markup_arg(args.markup)
+    if args.rules:
+        with open(args.rules, encoding="utf-8") as f:
+            try:
+                opts.pricing_rules = PricingRules.from_lines(f, strict=True)
+            except ValueError as e:
+                ap.error(f"--rules {args.rules}: {e}")
+
+    t0 = time.perf_counter()
+    master_df = get_master_provider(args.master).get().frame
+    print(f"Master {len(master_df):,} dòng ({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+    stats = process_rfq(
+        args.input,
+        output,
+        opts,
+        master_df=master_df,
+        tier=args.tier,
+        sheet=args.sheet,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+    )
+    print(stats.summary(), file=sys.stderr)
+    print(f"Kết quả: {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+# ==================== SAILING_TABLE.PY ====================
+"""
+Bảng sailing cho trang Schedules, build 1 lần cho mỗi version Schedule
+(schedule_provider build cùng snapshot, ở background thread).
+
+- 1 dòng / (carrier, service, POL tag, POD code, tuần) có tàu, ETD là
+  ngày tuyệt đối (sailing_etd), ETA ước tính theo vùng POD
+  (estimate_transit), xếp sẵn theo ETD.
+- Carrier / POL tag / vùng POD / tuần lưu thành mã số -> filter() chỉ là
+  vài phép so sánh numpy, trả về vị trí dòng; page() cắt đúng 1 trang.
+  Trang Streamlit chỉ gửi trang đang xem xuống browser.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .schedule_engine import classify_region, estimate_transit, sailing_etd
+
+
+REGIONS = ("WEST", "EAST", "GULF", "OTHER")
+
+# Cột hiển thị (thứ tự trên trang)
+SAILING_COLUMNS = [
+    "ETD", "ETA", "CARRIER", "SERVICE", "POL", "POD", "REGION",
+    "WEEK", "VESSEL", "TRANSIT",
+]
+
+
+class SailingTable:
+    def __init__(self, index: pd.DataFrame, week_years: Dict[str, Optional[int]]):
+        etd = sailing_etd(index, week_years)
+        ok = etd.notna().to_numpy()
+        sub = index.loc[ok]
+
+        # Tuần theo thứ tự cột trong file (chỉ tuần gán được năm) -> số thứ tự cho filter khoảng tuần
+        self.weeks: List[str] = [label for label, year in week_years.items() if year is not None]
+        week_seq = {label: i for i, label in enumerate(self.weeks)}
+
+        pods = sub["pod_code"].astype(str)
+        region_of = {p: classify_region(p) for p in pods.unique()}
+        transit_of = {p: estimate_transit(p) for p in region_of}
+        tmin = pods.map(lambda p: transit_of[p][0])
+        tmax = pods.map(lambda p: transit_of[p][1])
+        etd_ts = pd.to_datetime(pd.Series(etd[ok].tolist(), index=sub.index))
+
+        frame = pd.DataFrame({
+            "ETD": etd_ts,
+            "ETA": etd_ts + pd.to_timedelta(((tmin + tmax) // 2).astype(np.int64), unit="D"),
+            "CARRIER": sub["carrier"].astype(str),
+            "SERVICE": sub["service_name"].astype(str),
+            "POL": sub["pol_tag"].astype(str),
+            "POD": pods,
+            "REGION": pods.map(region_of),
+            "WEEK": sub["week_label"].astype(str),
+            "VESSEL": sub["vessel"].astype(str),
+            "TRANSIT": tmin.astype(str) + "-" + tmax.astype(str) + "d",
+        })
+        frame["_seq"] = frame["WEEK"].map(week_seq).astype(np.int64)
+        frame = frame.sort_values(["ETD", "CARRIER", "SERVICE", "POD"], kind="stable").reset_index(drop=True)
+
+        self.frame = frame[SAILING_COLUMNS]
+        self.carriers: List[str] = sorted(frame["CARRIER"].unique().tolist())
+        self.pol_tags: List[str] = sorted(frame["POL"].unique().tolist())
+        self.regions: List[str] = [r for r in REGIONS if r in set(frame["REGION"])]
+
+        self._carrier = frame["CARRIER"].map({c: i for i, c in enumerate(self.carriers)}).to_numpy(np.int64)
+        self._pol = frame["POL"].map({t: i for i, t in enumerate(self.pol_tags)}).to_numpy(np.int64)
+        self._region = frame["REGION"].map({r: i for i, r in enumerate(REGIONS)}).to_numpy(np.int64)
+        self._seq = frame["_seq"].to_numpy(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def filter(
+        self,
+        carriers: Optional[Iterable[str]] = None,
+        pol_tags: Optional[Iterable[str]] = None,
+        regions: Optional[Iterable[str]] = None,
+        week_from: Optional[str] = None,
+        week_to: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Vị trí các dòng khớp filter (đã theo thứ tự ETD). Tham số None / rỗng
+        = không lọc; tuần tính theo thứ tự cột, gồm cả 2 đầu.
+        """
+        mask = np.ones(len(self.frame), dtype=bool)
+        for values, names, codes in (
+            (carriers, self.carriers, self._carrier),
+            (pol_tags, self.pol_tags, self._pol),
+            (regions, list(REGIONS), self._region),
+        ):
+            if values:
+                wanted = [names.index(v) for v in values if v in names]
+                mask &= np.isin(codes, wanted)
+        if week_from in self.weeks:
+            mask &= self._seq >= self.weeks.index(week_from)
+        if week_to in self.weeks:
+            mask &= self._seq <= self.weeks.index(week_to)
+        return np.flatnonzero(mask)
+
+    def page(self, positions: np.ndarray, page: int, page_size: int) -> pd.DataFrame:
+        """Trang thứ `page` (từ 1) của các dòng `positions`."""
+        start = max(0, (page - 1) * page_size)
+        out = self.frame.iloc[positions[start:start + page_size]].copy()
+        out["ETD"] = out["ETD"].dt.date
+        out["ETA"] = out["ETA"].dt.date
+        return out.reset_index(drop=True)
+
+
+def n_pages(n_rows: int, page_size: int) -> int:
+    return max(1, -(-n_rows // page_size))
@@ -1,6 +1,7 @@
 # ==================== SCHEDULE_ENGINE.PY ====================
 from __future__ import annotations
 
+from bisect import bisect_left
 from dataclasses import dataclass
 from functools import lru_cache
 from pathlib import Path
@@ -8,6 +9,7 @@ from typing import Optional, Dict, Any, List
 from datetime import date, datetime, timedelta
 import re
 
+import numpy as np
 import pandas as pd
 
 from .models import DATA_DIR
@@ -204,88 +206,161 @@ def _extract_pod_candidates(pod_raw: str) -> List[str]:
 
 # ======= LOAD & CHUẨN HÓA SCHEDULE =======
 
-@lru_cache(maxsize=1)
 def load_raw_schedule(path: Path | str = SCHEDULE_FILE) -> pd.DataFrame:
+    """Đọc Schedule.xlsx (không cache – dùng qua schedule_provider)."""
     path = Path(path)
     if not path.exists():
         raise FileNotFoundError(f"Không tìm thấy file schedule: {path}")
     df = pd.read_excel(path, sheet_name=0)
     df.columns = [str(c).strip() for c in df.columns]
+    # Năm của cột tuần lấy từ ngày trong tên cột (xem raw_week_years);
+    # ngày sửa file chỉ là mốc cuối cùng (đổi khi checkout / copy file)
+    df.attrs["file_mtime"] = date.fromtimestamp(path.stat().st_mtime)
     return df
 
 
-@lru_cache(maxsize=1)
-def build_schedule_index() -> pd.DataFrame:
+SCHEDULE_INDEX_COLUMNS = [
+    "carrier",
+    "service_name",
+    "pol_tag",
+    "weekday",
+    "pod_code",
+    "week_no",
+    "week_label",
+    "vessel",
+]
+
+_WEEK_NO = re.compile(r"W(\d+)")
+_WEEK_START = re.compile(r"\(\s*(\d{1,2})\s*([A-Z]{3})")
+_MONTHS = {m: i for i, m in enumerate(
+    ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"), start=1
+)}
+
+
+def _cell_text(col: pd.Series) -> pd.Series:
+    """Ô -> chuỗi; ô trống (NaN / None) -> ''."""
+    return col.astype(object).where(col.notna(), "").astype(str)
+
+
+def week_numbers(week_cols: List[Any]) -> List[Optional[int]]:
+    """Week number từ tên cột 'W49 (07 DEC - 13 DEC)'; không đọc được -> None."""
+    out: List[Optional[int]] = []
+    for col in week_cols:
+        m = _WEEK_NO.match(str(col).strip().upper())
+        out.append(int(m.group(1)) if m else None)
+    return out
+
+
+def week_start_dates(week_cols: List[Any]) -> List[Optional[tuple]]:
+    """(ngày, tháng) đầu tuần từ tên cột 'W52 ( 21 DEC - 27 DEC)' / 'W02 (4JAN-10JAN)'; không đọc được -> None."""
+    out: List[Optional[tuple]] = []
+    for col in week_cols:
+        m = _WEEK_START.search(str(col).upper())
+        month = _MONTHS.get(m.group(2)) if m else None
+        out.append((int(m.group(1)), month) if month else None)
+    return out
+
+
+def _split_explode(col: pd.Series, sep: str) -> pd.Series:
+    """'ONE/YML/HMM' -> 3 dòng 'ONE', 'YML', 'HMM' (UPPER, strip, bỏ phần rỗng)."""
+    parts = col.str.upper().str.split(sep).explode().str.strip()
+    return parts[parts.fillna("") != ""]
+
+
+def schedule_index_from_frame(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Chuẩn hóa schedule thành dạng "dễ join":
+    Chuẩn hóa 1 bảng schedule thô (dạng Schedule.xlsx) thành dạng "dễ join":
       mỗi dòng = 1 (Carrier, Service, POL_tag, PODCode, WeekNo, WeekLabel, Vessel, Weekday)
+
+    Thứ tự dòng: dòng gốc -> cột tuần -> carrier -> POD (như bảng gốc).
+    Vector hoá: khối cột W.. trải thành dạng dài (melt, giữ thứ tự dòng ->
+    tuần), carrier / POD split + explode, mỗi chuỗi SERVICE khác nhau chỉ
+    parse 1 lần; ghép sailing x (carrier, POD) bằng np.repeat.
     """
-    df = load_raw_schedule().copy()
+    df = df.reset_index(drop=True)
 
-    # Tên cột có thể là 'CARRIER NAME', 'CARRIER', ... anh chỉnh nếu khác
-    carrier_col = "CARRIER NAME" if "CARRIER NAME" in df.columns else "CARRIER"
+    # Tên cột có thể là 'CARRIER NAME', 'CARRIER', 'GROUP' (vd 'ONE/YML/HMM') ... anh chỉnh nếu khác
+    carrier_col = next(
+        (c for c in ("CARRIER NAME", "CARRIER", "GROUP") if c in df.columns),
+        "CARRIER",
+    )
     service_col = "SERVICE"
     pod_col = "POD"
 
     week_cols: List[str] = [c for c in df.columns if str(c).upper().startswith("W")]
+    if not week_cols or any(c not in df.columns for c in (carrier_col, service_col, pod_col)):
+        return pd.DataFrame(columns=SCHEDULE_INDEX_COLUMNS)
+
+    carriers_raw = _cell_text(df[carrier_col])
+    services_raw = _cell_text(df[service_col])
+    pods_raw = _cell_text(df[pod_col])
+    keep = ((carriers_raw != "") & (services_raw != "") & (pods_raw != "")).to_numpy()
+
+    # (carrier, POD code) của từng dòng gốc, theo thứ tự carrier -> POD
+    carriers = _split_explode(carriers_raw[keep], "/").rename("carrier").rename_axis("_row").reset_index()
+    pods = _split_explode(pods_raw[keep], ";").rename("pod_code").rename_axis("_row").reset_index()
+    lanes = carriers.merge(pods, on="_row", how="inner", sort=False).sort_values("_row", kind="stable")
+    lane_row = lanes["_row"].to_numpy(dtype=np.int64)
+    n_lanes = np.bincount(lane_row, minlength=len(df))
+    lane_start = np.cumsum(n_lanes) - n_lanes
+
+    # Dạng dài của khối cột tuần: 1 phần tử / (dòng gốc, tuần), thứ tự dòng -> tuần
+    rows = np.flatnonzero(keep & (n_lanes > 0))
+    n_weeks = len(week_cols)
+    vessel = pd.Series(df[week_cols].to_numpy(dtype=object)[rows].ravel())
+    sail_row = np.repeat(rows, n_weeks)
+    sail_week = np.tile(np.arange(n_weeks), len(rows))
+
+    ok = vessel.notna().to_numpy()
+    vessel = vessel[ok].astype(str).str.strip()
+    good = ((vessel != "") & ~vessel.str.upper().str.startswith("BLANK")).to_numpy()
+    vessel = vessel.to_numpy(dtype=object)[good]
+    sail_row = sail_row[ok][good]
+    sail_week = sail_week[ok][good]
+    if vessel.size == 0:
+        return pd.DataFrame(columns=SCHEDULE_INDEX_COLUMNS)
+
+    # Mỗi sailing x mọi (carrier, POD) của dòng gốc
+    reps = n_lanes[sail_row]
+    sail = np.repeat(np.arange(vessel.size), reps)
+    offset = np.arange(sail.size) - np.repeat(np.cumsum(reps) - reps, reps)
+    lane = lane_start[sail_row[sail]] + offset
+    out_row = sail_row[sail]
+
+    # Mỗi chuỗi SERVICE khác nhau chỉ parse 1 lần -> tra theo dòng gốc
+    parsed = {raw: parse_service_string(raw) for raw in services_raw[keep].unique()}
+    service = [parsed[raw] for raw in services_raw.to_numpy()[rows]]
+    pos = np.full(len(df), -1, dtype=np.int64)
+    pos[rows] = np.arange(len(rows))
+    at = pos[out_row]
+
+    week_of = sail_week[sail]
+    week_no = np.array([np.nan if w is None else w for w in week_numbers(week_cols)])[week_of]
+    if not np.isnan(week_no).any():
+        week_no = week_no.astype(np.int64)
+
+    return pd.DataFrame(
+        {
+            "carrier": lanes["carrier"].to_numpy(dtype=object)[lane],
+            "service_name": np.array([sv.service_name for sv in service], dtype=object)[at],
+            "pol_tag": np.array([sv.pol_tag for sv in service], dtype=object)[at],     # HCM / HPH / ANY
+            "weekday": np.array([sv.weekday for sv in service], dtype=object)[at],     # SUN / SAT / ...
+            "pod_code": lanes["pod_code"].to_numpy(dtype=object)[lane],
+            "week_no": week_no,
+            "week_label": np.array([str(c) for c in week_cols], dtype=object)[week_of],
+            "vessel": vessel[sail],
+        }
+    )
+
+
+def build_schedule_index(path: Path | str = SCHEDULE_FILE) -> pd.DataFrame:
+    """
+    Schedule.xlsx đã chuẩn hóa (xem schedule_index_from_frame) của snapshot
+    hiện tại; file đổi thì schedule_provider tự build lại ở background.
+    """
+    from .schedule_provider import get_schedule_snapshot
 
-    records: List[Dict[str, Any]] = []
-    for _, row in df.iterrows():
-        carriers_raw = str(row.get(carrier_col, "") or "")
-        service_raw = str(row.get(service_col, "") or "")
-        pod_raw = str(row.get(pod_col, "") or "")
-
-        if not service_raw or not pod_raw or not carriers_raw:
-            continue
-
-        service_info = parse_service_string(service_raw)
-
-        carriers = [c.strip().upper() for c in carriers_raw.split("/") if c.strip()]
-        pod_codes = [p.strip().upper() for p in pod_raw.split(";") if p.strip()]
-
-        for week_col in week_cols:
-            vessel = row.get(week_col, None)
-            if vessel is None or (isinstance(vessel, float) and pd.isna(vessel)):
-                continue
-            vessel_str = str(vessel).strip()
-            if not vessel_str or vessel_str.upper().startswith("BLANK"):
-                continue
-
-            # Week number từ 'W49 (07 DEC - 13 DEC)'
-            m = re.match(r"W(\d+)", str(week_col).strip().upper())
-            week_no = int(m.group(1)) if m else None
-
-            for carrier in carriers:
-                for pod_code in pod_codes:
-                    records.append(
-                        {
-                            "carrier": carrier,
-                            "service_name": service_info.service_name,
-                            "pol_tag": service_info.pol_tag,   # HCM / HPH / ANY
-                            "weekday": service_info.weekday,   # SUN / SAT / ...
-                            "pod_code": pod_code,
-                            "week_no": week_no,
-                            "week_label": str(week_col),
-                            "vessel": vessel_str,
-                        }
-                    )
-
-    if not records:
-        return pd.DataFrame(
-            columns=[
-                "carrier",
-                "service_name",
-                "pol_tag",
-                "weekday",
-                "pod_code",
-                "week_no",
-                "week_label",
-                "vessel",
-            ]
-        )
-
-    idx = pd.DataFrame(records)
-    return idx
+    return get_schedule_snapshot(path).index
 
 
 # ======= UTIL: ISO WEEK -> DATE =======
@@ -300,93 +375,289 @@ def iso_to_gregorian(year: int, week: int, day: int) -> date:
     return fourth_jan + delta
 
 
-# ======= PUBLIC API: LẤY SCHEDULE CHO 1 OPTION =======
+def week_column_years(week_nos: List[Optional[int]], anchor: date) -> List[Optional[int]]:
+    """
+    Năm ISO của từng cột tuần (theo thứ tự cột, vd W52, W1, W02...).
+    Cột đầu lấy năm (năm trước / năm nay / năm sau của `anchor`) sao cho
+    tuần đó gần `anchor` nhất; sau đó mỗi lần số tuần giảm (W52 -> W1) là
+    sang năm mới.
+    """
+    years: List[Optional[int]] = []
+    year: Optional[int] = None
+    prev = 0
+    for week in week_nos:
+        if week is None:
+            years.append(None)
+            continue
+        if year is None:
+            year = min(
+                (anchor.year - 1, anchor.year, anchor.year + 1),
+                key=lambda y: abs((iso_to_gregorian(y, week, 1) - anchor).days),
+            )
+        elif week < prev:
+            year += 1
+        prev = week
+        years.append(year)
+    return years
+
+
+def _label_offset(year: int, week: int, start: tuple) -> Optional[int]:
+    """Ngày đầu tuần ghi trên cột trừ thứ 2 của tuần ISO (year, week), tính bằng ngày."""
+    monday = iso_to_gregorian(year, week, 1)
+    day, month = start
+    offsets = []
+    for y in (monday.year - 1, monday.year, monday.year + 1):
+        try:
+            offsets.append((date(y, month, day) - monday).days)
+        except ValueError:   # 29 FEB năm thường, 31 APR...
+            continue
+    return min(offsets, key=abs, default=None)
 
-def get_schedule_for(
-    carrier: str,
-    pol: str,
-    pod_code: str,
-    cargo_ready_iso: Optional[str] = None,
-) -> Dict[str, Any]:
+
+def week_label_anchor(
+    week_nos: List[Optional[int]], starts: List[Optional[tuple]], near: date
+) -> Optional[date]:
+    """
+    Mốc cho week_column_years lấy từ ngày đầu tuần ghi trên tên cột (week_start_dates).
+    Thử năm của cột tuần đầu trong ±6 năm quanh `near`: năm đúng là năm mà mọi cột
+    có ghi ngày cùng bắt đầu đúng thứ 2 của tuần ISO, hoặc cùng sớm hơn 1 ngày (bảng
+    tính tuần từ chủ nhật). Lịch lặp lại nên có thể nhiều năm khớp -> gần `near` nhất.
+    Không cột nào ghi ngày / không năm nào khớp -> None.
+    """
+    first = next((w for w in week_nos if w is not None), None)
+    if first is None:
+        return None
+    best: Optional[tuple] = None
+    for year in range(near.year - 6, near.year + 7):
+        anchor = iso_to_gregorian(year, first, 1)
+        offsets = [
+            _label_offset(y, w, s)
+            for y, w, s in zip(week_column_years(week_nos, anchor), week_nos, starts)
+            if y is not None and s is not None
+        ]
+        if not offsets:
+            return None
+        if len(set(offsets)) == 1 and offsets[0] in (-1, 0):
+            dist = abs((anchor - near).days)
+            if best is None or dist < best[0]:
+                best = (dist, anchor)
+    return best[1] if best else None
+
+
+# ======= SAILING INDEX: (carrier, POD code, POL tag) -> ETD tuyệt đối =======
+
+def sailing_etd(idx: pd.DataFrame, week_years: Dict[str, Optional[int]]) -> pd.Series:
+    """
+    ETD (date tuyệt đối) cho từng dòng schedule index, từ năm của cột tuần
+    (week_column_years) + week_no + weekday; tuần không gán được năm -> None.
+    Mỗi (năm, tuần, thứ) khác nhau chỉ tính 1 lần.
+    """
+    years = idx["week_label"].map(week_years)
+    ok = (idx["week_no"].notna() & years.notna()).to_numpy()
+    weekday = idx["weekday"].fillna("SUN").astype(str).str.upper()
+    keys = list(zip(
+        years[ok].astype(np.int64).tolist(),
+        idx["week_no"][ok].astype(np.int64).tolist(),
+        weekday[ok].tolist(),
+    ))
+    etd_of = {k: iso_to_gregorian(k[0], k[1], DAY_MAP.get(k[2], 6) + 1) for k in set(keys)}
+    out = np.full(len(idx), None, dtype=object)
+    out[ok] = [etd_of[k] for k in keys]
+    return pd.Series(out, index=idx.index, dtype=object)
+
+
+class SailingIndex:
+    """
+    (carrier, pod_code, pol_tag) -> sailing xếp theo ETD (ngày tuyệt đối,
+    đã gán năm cho từng cột tuần). next_sailing() dùng bisect tìm sailing
+    đầu tiên có ETD >= cargo ready date: O(log n) / key và đúng qua giao năm
+    (cargo tuần 52 -> W1 của năm sau, không quay về W1 cùng năm).
     """
-    Trả về schedule cho 1 tuyến cụ thể (carrier + POL + POD) dựa trên bảng Schedule.
 
-    - Nếu có cargo_ready_date:
-        chọn tuần đầu tiên có week_no >= week(cargo_ready_date)
-    - Nếu không:
-        dùng tuần hiện tại (theo ngày hôm nay)
+    FIELDS = ("carrier", "service_name", "pol_tag", "weekday", "week_no", "week_label", "vessel")
+
+    def __init__(self, idx: pd.DataFrame, week_years: Dict[str, Optional[int]]):
+        etd = sailing_etd(idx, week_years)
+        ok = etd.notna().to_numpy()
+        sub = idx.loc[ok]
+        self._cols = {c: sub[c].to_numpy(dtype=object) for c in self.FIELDS}
+        self._cols["week_no"] = sub["week_no"].astype(np.int64).to_numpy()
+        self._cols["weekday"] = sub["weekday"].fillna("SUN").astype(str).str.upper().to_numpy(dtype=object)
+        self._etd = etd[ok].tolist()
+        etd_ord = np.array([d.toordinal() for d in self._etd], dtype=np.int64)
+
+        # Xếp theo (ETD, thứ tự dòng trong bảng) -> list ETD của mỗi key đã sort sẵn
+        self._by_key: Dict[tuple, tuple] = {}
+        carrier, pod, tag = self._cols["carrier"], sub["pod_code"].to_numpy(dtype=object), self._cols["pol_tag"]
+        for i in np.lexsort((np.arange(len(etd_ord)), etd_ord)).tolist():
+            entry = self._by_key.get((carrier[i], pod[i], tag[i]))
+            if entry is None:
+                entry = self._by_key[(carrier[i], pod[i], tag[i])] = ([], [])
+            entry[0].append(int(etd_ord[i]))
+            entry[1].append(i)
+
+    def __len__(self) -> int:
+        return len(self._etd)
+
+    def next_sailing(
+        self,
+        carrier: str,
+        pod_codes: tuple,
+        pol_tags: tuple,
+        day: date,
+    ) -> Optional[Dict[str, Any]]:
+        """Sailing đầu tiên có ETD >= day trên mọi (POD code, POL tag) ứng viên; không có -> None."""
+        target = day.toordinal()
+        best = None
+        for pod_code in pod_codes:
+            for tag in pol_tags:
+                entry = self._by_key.get((carrier, pod_code, tag))
+                if entry is None:
+                    continue
+                k = bisect_left(entry[0], target)
+                if k < len(entry[0]) and (best is None or (entry[0][k], entry[1][k]) < best):
+                    best = (entry[0][k], entry[1][k])
+        if best is None:
+            return None
+        i = best[1]
+        hit = {c: self._cols[c][i] for c in self.FIELDS}
+        hit["week_no"] = int(hit["week_no"])
+        hit["etd"] = self._etd[i]
+        return hit
+
+
+def raw_week_years(raw: pd.DataFrame, published: Optional[date] = None) -> Dict[str, Optional[int]]:
     """
-    carrier_up = (carrier or "").upper().strip()
-    pol_up = (pol or "").upper().strip()
-    pod_up = (pod_code or "").upper().strip()
+    Năm của từng cột tuần. Mốc gán năm (week_column_years), theo thứ tự ưu tiên:
+      1. ngày đầu tuần ghi trong tên cột ('W52 ( 21 DEC - 27 DEC)');
+      2. ngày phát hành `published` (tham số / raw.attrs["published"]);
+      3. ngày sửa file (raw.attrs["file_mtime"]), không có thì hôm nay.
+    2 / 3 chỉ dùng để chọn giữa các năm cùng khớp với (1) (lịch lặp lại sau 6-11 năm).
+    """
+    published = published or raw.attrs.get("published") or raw.attrs.get("file_mtime") or date.today()
+    week_cols = [c for c in raw.columns if str(c).upper().startswith("W")]
+    week_nos = week_numbers(week_cols)
+    anchor = week_label_anchor(week_nos, week_start_dates(week_cols), published) or published
+    return dict(zip(map(str, week_cols), week_column_years(week_nos, anchor)))
 
-    if not carrier_up or not pod_up:
-        return {}
 
-    idx = build_schedule_index()
-    if idx.empty:
-        return {}
+def sailing_index_from_frame(raw: pd.DataFrame, published: Optional[date] = None) -> SailingIndex:
+    """SailingIndex từ 1 bảng schedule thô (dạng Schedule.xlsx)."""
+    return SailingIndex(schedule_index_from_frame(raw), raw_week_years(raw, published))
 
-    # POD trong Master có thể là 'USSAV/USCHS', 'USSAV/CHS', 'USEC', ...
-    pod_candidates = _extract_pod_candidates(pod_up)
 
-    df = idx[
-        (idx["carrier"] == carrier_up) &
-        (idx["pod_code"].isin(pod_candidates))
-    ]
-    if df.empty:
-        return {}
+def build_sailing_index(path: Path | str = SCHEDULE_FILE) -> SailingIndex:
+    """Sailing index của snapshot Schedule hiện tại (xem schedule_provider)."""
+    from .schedule_provider import get_schedule_snapshot
 
-    # Lọc theo POL_tag: ANY hoặc trùng POL (HCM/HPH)
-    df = df[(df["pol_tag"] == "ANY") | (df["pol_tag"] == pol_up)]
-    if df.empty:
-        return {}
+    return get_schedule_snapshot(path).sailings
+
+
+# ======= PUBLIC API: LẤY SCHEDULE CHO NHIỀU OPTION 1 LẦN =======
+
+SCHEDULE_FIELDS = [
+    "carrier", "service", "pol_tag", "weekday", "pod_code", "week_no",
+    "week_label", "vessel", "etd", "eta", "transit_min", "transit_max",
+]
+
+
+@lru_cache(maxsize=4096)
+def _pod_candidates(pod_up: str) -> tuple:
+    return tuple(_extract_pod_candidates(pod_up))
 
-    # Xác định ngày mốc
+
+def _cargo_day(cargo_ready_iso: Optional[str]) -> date:
+    # Không nhập / sai định dạng cargo_ready_date -> lấy hôm nay
     if cargo_ready_iso:
         try:
-            cargo_day = date.fromisoformat(cargo_ready_iso[:10])
+            return date.fromisoformat(cargo_ready_iso[:10])
         except Exception:
-            cargo_day = date.today()
-    else:
-        # Nếu không nhập cargo_ready_date -> lấy hôm nay
-        cargo_day = date.today()
+            pass
+    return date.today()
 
-    cargo_week = cargo_day.isocalendar().week
-    year = cargo_day.year
 
-    # Tìm tuần phù hợp: week_no >= cargo_week, nếu không có thì lấy tuần nhỏ nhất
-    df_valid = df[df["week_no"].notna()]
-    if df_valid.empty:
-        return {}
+def get_schedules_for(
+    options: List[Dict[str, Any]] | pd.DataFrame,
+    pol: str,
+    cargo_ready_iso: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Schedule cho nhiều option cùng POL + cargo ready date.
+
+    options: list dict (hoặc DataFrame) có "carrier" và "pod".
+    Trả về DataFrame cùng thứ tự / số dòng với options, cột = SCHEDULE_FIELDS
+    (service, vessel, etd, eta, ...); option không có sailing -> None.
+    Luật chọn sailing giống get_schedule_for; mỗi cặp (carrier, POD) khác
+    nhau tra sailing index 1 lần.
+    """
+    opts = options if isinstance(options, pd.DataFrame) else pd.DataFrame(list(options), columns=["carrier", "pod"])
+    n = len(opts)
+    out = pd.DataFrame({c: [None] * n for c in SCHEDULE_FIELDS}, dtype=object)
+    if n == 0:
+        return out
+
+    carriers = opts["carrier"].fillna("").astype(str).str.upper().str.strip().to_numpy()
+    pods = opts["pod"].fillna("").astype(str).str.upper().str.strip().to_numpy()
+    pol_up = (pol or "").upper().strip()
+
+    sailings = build_sailing_index()
+    if len(sailings) == 0:
+        return out
 
-    df_future = df_valid[df_valid["week_no"] >= cargo_week]
-    if df_future.empty:
-        row = df_valid.sort_values("week_no").iloc[0]
-    else:
-        row = df_future.sort_values("week_no").iloc[0]
-
-    week_no = int(row["week_no"])
-    weekday = str(row["weekday"] or "SUN").upper()
-    day_index = DAY_MAP.get(weekday, 6)  # 0..6
-
-    # ISO weekday: Monday=1 .. Sunday=7
-    etd_date = iso_to_gregorian(year, week_no, day_index + 1)
-
-    tmin, tmax = estimate_transit(pod_up)
-    eta_date = etd_date + timedelta(days=int((tmin + tmax) / 2)) if tmin and tmax else None
-
-    return {
-        "carrier": row["carrier"],
-        "service": row["service_name"],
-        "pol_tag": row["pol_tag"],
-        "weekday": weekday,
-        "pod_code": pod_up,
-        "week_no": week_no,
-        "week_label": row["week_label"],
-        "vessel": row["vessel"],
-        "etd": etd_date,
-        "eta": eta_date,
-        "transit_min": tmin,
-        "transit_max": tmax,
-    }
+    # Sailing của POL này: service chạy mọi POL (ANY) hoặc đúng tag HCM / HPH
+    pol_tags = ("ANY", pol_up) if pol_up and pol_up != "ANY" else ("ANY",)
+    cargo_day = _cargo_day(cargo_ready_iso)
+
+    found: Dict[tuple, Dict[str, Any]] = {}
+    for carrier, pod_up in dict.fromkeys(zip(carriers, pods)):
+        if not carrier or not pod_up:
+            continue
+        hit = sailings.next_sailing(carrier, _pod_candidates(pod_up), pol_tags, cargo_day)
+        if hit is None:
+            continue
+        etd_date = hit["etd"]
+        tmin, tmax = estimate_transit(pod_up)
+        found[(carrier, pod_up)] = {
+            "carrier": hit["carrier"],
+            "service": hit["service_name"],
+            "pol_tag": hit["pol_tag"],
+            "weekday": hit["weekday"],
+            "pod_code": pod_up,
+            "week_no": hit["week_no"],
+            "week_label": hit["week_label"],
+            "vessel": hit["vessel"],
+            "etd": etd_date,
+            "eta": etd_date + timedelta(days=int((tmin + tmax) / 2)) if tmin and tmax else None,
+            "transit_min": tmin,
+            "transit_max": tmax,
+        }
+
+    rows = [found.get(key) for key in zip(carriers, pods)]
+    hit_mask = [r is not None for r in rows]
+    if any(hit_mask):
+        out.loc[hit_mask, SCHEDULE_FIELDS] = pd.DataFrame(
+            [r for r in rows if r is not None], columns=SCHEDULE_FIELDS, dtype=object
+        ).to_numpy()
+    return out
+
+
+# ======= PUBLIC API: LẤY SCHEDULE CHO 1 OPTION =======
+
+def get_schedule_for(
+    carrier: str,
+    pol: str,
+    pod_code: str,
+    cargo_ready_iso: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Trả về schedule cho 1 tuyến cụ thể (carrier + POL + POD) dựa trên bảng Schedule.
+
+    - Chọn sailing đầu tiên có ETD >= cargo_ready_date (không có thì hôm nay),
+      ETD là ngày tuyệt đối nên đúng cả khi qua năm mới.
+    - Không còn sailing nào sau ngày đó trong bảng -> {}
+    """
+    res = get_schedules_for([{"carrier": carrier, "pod": pod_code}], pol, cargo_ready_iso)
+    row = res.iloc[0]
+    if row["week_no"] is None:
+        return {}
+    return row.to_dict()
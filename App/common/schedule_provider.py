@@ -0,0 +1,164 @@
+# ==================== SCHEDULE_PROVIDER.PY ====================
+"""
+Schedule dùng chung cho cả process (mọi session Streamlit, service, CLI).
+
+Trước đây load_raw_schedule / build_schedule_index nằm trong
+lru_cache(maxsize=1): server đã đọc Schedule.xlsx thì lịch tàu tuần mới
+chỉ thấy được sau khi restart.
+
+- Snapshot = bảng thô + schedule index + sailing index + bảng sailing cho
+  trang Schedules (sailing_table) của 1 version file
+  (version = hash của path + mtime + size, như MasterProvider).
+- get() stat file tối đa 1 lần / STAT_INTERVAL_SECONDS; file đổi -> build
+  lại ở background thread rồi swap snapshot (gán 1 biến). Người đọc luôn
+  nhận snapshot cũ ngay, không chờ build.
+- File đang ghi dở / đọc lỗi -> giữ snapshot cũ, lần check sau thử lại.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+from .master_provider import STAT_INTERVAL_SECONDS, file_signature, signature_version
+from .sailing_table import SailingTable
+from .schedule_engine import (
+    SCHEDULE_FILE,
+    SailingIndex,
+    load_raw_schedule,
+    raw_week_years,
+    schedule_index_from_frame,
+)
+
+
+@dataclass(frozen=True)
+class ScheduleSnapshot:
+    version: str
+    signature: tuple
+    raw: pd.DataFrame
+    index: pd.DataFrame
+    sailings: SailingIndex
+    table: SailingTable
+    loaded_at: float
+
+
+def build_schedule_snapshot(path: Path | str, sig: tuple) -> ScheduleSnapshot:
+    raw = load_raw_schedule(path)
+    index = schedule_index_from_frame(raw)
+    week_years = raw_week_years(raw)
+    return ScheduleSnapshot(
+        version=signature_version(sig),
+        signature=sig,
+        raw=raw,
+        index=index,
+        sailings=SailingIndex(index, week_years),
+        table=SailingTable(index, week_years),
+        loaded_at=time.time(),
+    )
+
+
+class ScheduleProvider:
+    def __init__(self, path: Path | str = SCHEDULE_FILE, stat_interval: float = STAT_INTERVAL_SECONDS):
+        self.path = Path(path)
+        self.stat_interval = stat_interval
+        self.last_error: Optional[str] = None
+        self.reload_count = 0
+
+        self._snapshot: Optional[ScheduleSnapshot] = None
+        self._lock = threading.Lock()
+        self._reloading: Optional[threading.Thread] = None
+        self._last_stat = 0.0
+
+    # ---------- public ----------
+    def get(self) -> ScheduleSnapshot:
+        """
+        Snapshot hiện tại. Chỉ lần đầu (chưa có snapshot) mới phải chờ load;
+        sau đó file đổi thì build lại ở background, người đọc không bị block.
+        """
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._load(file_signature(self.path))
+                snap = self._snapshot
+            return snap  # type: ignore[return-value]
+
+        now = time.monotonic()
+        if now - self._last_stat >= self.stat_interval:
+            self._last_stat = now
+            sig = file_signature(self.path)
+            if sig is not None and sig != snap.signature:
+                self._start_background_reload()
+        return snap
+
+    def refresh(self, wait: bool = False) -> None:
+        """Ép kiểm tra file ngay (vd ngay sau khi upload Schedule mới)."""
+        self._last_stat = 0.0
+        if self._snapshot is None:
+            self.get()
+            return
+        self.get()
+        thread = self._reloading
+        if wait and thread is not None:
+            thread.join()
+
+    @property
+    def version(self) -> Optional[str]:
+        snap = self._snapshot
+        return snap.version if snap else None
+
+    # ---------- internal ----------
+    def _load(self, sig: Optional[tuple]) -> None:
+        if sig is None:
+            raise FileNotFoundError(f"Không tìm thấy file schedule: {self.path}")
+        # File bị ghi đè trong lúc đang đọc -> lần get() sau sẽ thấy signature khác và build lại
+        self._snapshot = build_schedule_snapshot(self.path, sig)
+        self.reload_count += 1
+        self.last_error = None
+
+    def _start_background_reload(self) -> None:
+        with self._lock:
+            if self._reloading is not None and self._reloading.is_alive():
+                return
+            thread = threading.Thread(target=self._background_reload, name="schedule-reload", daemon=True)
+            self._reloading = thread
+            thread.start()
+
+    def _background_reload(self) -> None:
+        try:
+            self._load(file_signature(self.path))
+        except Exception as e:  # file đang ghi dở, sheet lỗi...
+            self.last_error = f"{type(e).__name__}: {e}"
+
+
+# ================= REGISTRY (1 provider / file / process) =================
+
+_PROVIDERS: Dict[str, ScheduleProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_schedule_provider(path: Path | str = SCHEDULE_FILE) -> ScheduleProvider:
+    key = str(Path(path).resolve())
+    with _PROVIDERS_LOCK:
+        provider = _PROVIDERS.get(key)
+        if provider is None:
+            provider = ScheduleProvider(path)
+            _PROVIDERS[key] = provider
+        return provider
+
+
+def get_schedule_snapshot(path: Path | str = SCHEDULE_FILE) -> ScheduleSnapshot:
+    return get_schedule_provider(path).get()
+
+
+def schedule_version(path: Path | str = SCHEDULE_FILE) -> str:
+    """Version Schedule hiện tại ("none" nếu chưa có file) – để ghép vào key cache quote."""
+    try:
+        return get_schedule_snapshot(path).version
+    except FileNotFoundError:
+        return "none"
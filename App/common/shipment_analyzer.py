@@ -1,13 +1,24 @@
 
 import pandas as pd
-from pathlib import Path
+
+from .shipment_store import SHIPMENTS_FILE, ChangeSet, get_shipment_store
+from .shipment_writer import get_shipment_writer
 
 # Cấu hình chung
-DATA_PATH = Path(__file__).parent.parent / "DATA" / "Shipments.xlsx"
+DATA_PATH = SHIPMENTS_FILE
+
+# Chờ tối đa bao lâu cho các thay đổi đang trong hàng đợi trước khi đọc sheet (giây)
+APPLY_WAIT_SECONDS = 2.0
+
+# Sửa các cột này thì tính lại Volume / Profit của dòng
+DERIVED_INPUTS = {"Container Type", "Quantity", "Selling Rate", "Buying Rate"}
 
-# Hàm đọc dữ liệu từ file Excel theo sheet name
+# Hàm đọc dữ liệu theo sheet name (từ shipment store, không đọc lại workbook)
+# Index = row id trong store (dùng cho editor_change_set)
 def load_shipments(sheet_name):
-    df = pd.read_excel(DATA_PATH, sheet_name=sheet_name)
+    # Thay đổi vừa lưu của sheet này phải được ghi vào store trước (không chờ ghi workbook)
+    get_shipment_writer().wait_applied(sheet_name, timeout=APPLY_WAIT_SECONDS)
+    df = get_shipment_store().load_sheet(sheet_name)
 
     # Chuẩn hóa tên cột
     df.columns = df.columns.map(str).str.strip()
@@ -22,11 +33,63 @@ def load_shipments(sheet_name):
 
     return df
 
-# Hàm lưu dữ liệu lại vào file (ghi đè sheet)
+# Hàm lưu dữ liệu lại vào file (ghi đè cả sheet, chờ ghi xong)
 def save_shipments(sheet_name, df):
-    # Ghi đè lên đúng sheet
-    with pd.ExcelWriter(DATA_PATH, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
+    # Ghi vào store rồi export đúng sheet đó ra workbook
+    get_shipment_store().save_sheet(sheet_name, df)
+
+# Hàm tạo ChangeSet từ state của st.data_editor (st.session_state[key]):
+# chỉ các dòng sửa / thêm / xoá. df là đúng DataFrame đã đưa vào editor.
+def editor_change_set(sheet_name, df, editor_state, author=""):
+    ids = df.index.tolist()
+
+    def typed(col, value):
+        # Editor trả ngày dạng chuỗi ISO -> đưa về Timestamp như cột gốc
+        if value is not None and pd.api.types.is_datetime64_any_dtype(df[col]):
+            return pd.to_datetime(value, errors="coerce")
+        return value
+
+    edited = {}
+    for pos, values in editor_state.get("edited_rows", {}).items():
+        rid = ids[int(pos)]
+        changes = {c: typed(c, v) for c, v in values.items() if c in df.columns}
+        if changes.keys() & DERIVED_INPUTS:
+            row = df.loc[rid].to_dict()
+            row.update(changes)
+            changes["Volume"] = calc_volume(row)
+            changes["Profit"] = calc_profit(row)
+        if changes:
+            edited[rid] = changes
+
+    added = []
+    for values in editor_state.get("added_rows", []):
+        row = {c: typed(c, v) for c, v in values.items() if c in df.columns}
+        if not row:
+            continue
+        full = {c: row.get(c) for c in df.columns}
+        row["Volume"] = calc_volume(full)
+        row["Profit"] = calc_profit(full)
+        added.append(row)
+
+    deleted = [ids[int(pos)] for pos in editor_state.get("deleted_rows", [])]
+
+    base = df.attrs.get("row_versions", {})
+    return ChangeSet(
+        sheet=sheet_name,
+        edited=edited,
+        added=added,
+        deleted=deleted,
+        base_versions={rid: base[rid] for rid in list(edited) + deleted if rid in base},
+        author=author,
+    )
+
+# Hàm lưu ChangeSet kiểu write-behind: trả về ticket ngay, ghi ở background
+def submit_shipment_changes(changes):
+    return get_shipment_writer().submit(changes)
+
+# Hàm lấy kết quả của 1 lần lưu (None nếu chưa ghi xong)
+def shipment_save_result(ticket):
+    return get_shipment_writer().result(ticket)
 
 # Hàm tính volume theo Container Type
 def calc_volume(row):
@@ -52,9 +115,6 @@ def calculate_all_columns(df):
     df["Profit"] = df.apply(calc_profit, axis=1)
     return df
 
-from openpyxl import load_workbook
-
 def get_visible_sheets():
-    wb = load_workbook(DATA_PATH, read_only=True)
-    return [sheet.title for sheet in wb.worksheets if sheet.sheet_state == 'visible']
+    return get_shipment_store().sheets(visible_only=True)
 
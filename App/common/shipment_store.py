@@ -0,0 +1,808 @@
+# ==================== SHIPMENT_STORE.PY ====================
+"""
+Shipments.xlsx trong 1 file SQLite (DATA/shipments.db) cho mọi trang đọc.
+
+Trước đây data_loader.load_all_sheets, shipment_analyzer.load_shipments,
+weekly_report.load_shipments_for_week và load_data() của dashboard mỗi lần
+gọi lại đọc (và parse ngày) toàn bộ các sheet tháng của workbook.
+
+- Bảng shipments: cột có kiểu (TEXT / NUMERIC), ngày lưu ISO
+  ("yyyy-mm-dd" hoặc "yyyy-mm-dd hh:mm:ss") đã parse dayfirst 1 lần lúc
+  import, thêm iso_year / iso_week của ETD. Index trên ETD, tuần ISO,
+  Customer, Status -> các reader chỉ còn là 1 câu SELECT.
+- Bảng shipment_sheets giữ thứ tự sheet, sheet ẩn / hiện và thứ tự cột
+  -> export_workbook() dựng lại đúng layout workbook.
+- Workbook vẫn là nguồn chính: sync() stat file tối đa 1 lần /
+  STAT_INTERVAL_SECONDS, signature khác lần import trước -> chỉ đọc zip
+  directory: CRC / size của từng xl/worksheets/sheetN.xml là fingerprint
+  của sheet, chỉ parse lại các sheet có fingerprint đổi (lưu tháng 12 không
+  bắt parse lại cả năm); sheet khác chỉ cập nhật thứ tự / ẩn hiện.
+  save_sheet() ghi vào DB rồi export sheet đó ra workbook, signature và
+  fingerprint mới được ghi nhận luôn nên không import lại chính file vừa ghi.
+- Mỗi sheet có version riêng (đổi khi dữ liệu sheet đó đổi) -> reader cache
+  được từng sheet (data_loader.load_all_sheets).
+- Mỗi dòng có id cố định + row_version: apply_changes() ghi 1 ChangeSet
+  (chỉ các dòng sửa / thêm / xoá) với optimistic check theo từng dòng, dòng
+  đã bị người khác sửa / xoá thì báo conflict thay vì ghi đè
+  (shipment_writer gom và ghi các ChangeSet ở background). id là
+  AUTOINCREMENT: dòng bị xoá / sheet parse lại không bao giờ trả id cũ cho
+  dòng mới, ChangeSet cũ trỏ vào id đó luôn thành conflict.
+- Sheet có thay đổi trong DB chưa ghi ra workbook (cờ unexported) không bị
+  parse lại từ workbook: sync_sheets() giữ dữ liệu DB, lần export sau ghi đè.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from .master_provider import STAT_INTERVAL_SECONDS, file_signature, signature_version
+
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "DATA"
+SHIPMENTS_FILE = DATA_DIR / "Shipments.xlsx"
+SHIPMENT_DB = DATA_DIR / "shipments.db"
+
+# Cột Excel -> (cột SQL, kiểu). "date" = ISO text, ô không parse được giữ nguyên chữ;
+# "num" = NUMERIC: số nguyên lưu INTEGER, số lẻ lưu REAL (đọc ra giống read_excel)
+SHIPMENT_COLUMNS: Dict[str, tuple] = {
+    "Customer":        ("customer", "text"),
+    "Customer Type":   ("customer_type", "text"),
+    "Routing":         ("routing", "text"),
+    "Bkg No":          ("bkg_no", "text"),
+    "Hbl No":          ("hbl_no", "text"),
+    "ETD":             ("etd", "date"),
+    "ETA":             ("eta", "date"),
+    "ATA":             ("ata", "date"),
+    "Container Type":  ("container_type", "text"),
+    "Quantity":        ("quantity", "num"),
+    "Volume":          ("volume", "num"),
+    "Status":          ("status", "text"),
+    "Selling Rate":    ("selling_rate", "num"),
+    "Buying Rate":     ("buying_rate", "num"),
+    "Profit":          ("profit", "num"),
+    "Si":              ("si", "date"),
+    "Cy":              ("cy", "date"),
+    "Carrier":         ("carrier", "text"),
+    "Hdl Fee Carrier": ("hdl_fee_carrier", "num"),
+    "Status_Calc":     ("status_calc", "text"),
+    "Month":           ("month", "text"),
+    "Etd_Original":    ("etd_original", "text"),
+    "Delay_Log":       ("delay_log", "text"),
+    "Progress ETA":    ("progress_eta", "num"),
+    "Sort_Order":      ("sort_order", "num"),
+}
+_SQL_TYPES = {"text": "TEXT", "date": "TEXT", "num": "NUMERIC"}
+
+_SCHEMA = (
+    """
+CREATE TABLE IF NOT EXISTS shipment_sheets (
+    sheet       TEXT PRIMARY KEY,
+    position    INTEGER NOT NULL,
+    visible     INTEGER NOT NULL,
+    columns     TEXT NOT NULL,
+    fingerprint TEXT,
+    version     TEXT,
+    unexported  INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS shipment_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS shipments (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet    TEXT NOT NULL,
+    row_no   INTEGER NOT NULL,
+"""
+    + "".join(f"    {sql} {_SQL_TYPES[kind]},\n" for sql, kind in SHIPMENT_COLUMNS.values())
+    + """    iso_year INTEGER,
+    iso_week INTEGER,
+    extra    TEXT,
+    row_version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS ix_shipments_sheet ON shipments (sheet, row_no);
+CREATE INDEX IF NOT EXISTS ix_shipments_etd ON shipments (etd);
+CREATE INDEX IF NOT EXISTS ix_shipments_week ON shipments (iso_year, iso_week, etd);
+CREATE INDEX IF NOT EXISTS ix_shipments_customer ON shipments (customer, etd);
+CREATE INDEX IF NOT EXISTS ix_shipments_status ON shipments (status);
+"""
+)
+
+_INSERT_COLUMNS = ["sheet", "row_no"] + [sql for sql, _ in SHIPMENT_COLUMNS.values()] + ["iso_year", "iso_week", "extra"]
+_INSERT_SQL = (
+    f"INSERT INTO shipments ({', '.join(_INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _INSERT_COLUMNS)})"
+)
+
+
+# Cột thêm sau bản đầu của schema (DB cũ được ALTER TABLE khi mở)
+_COLUMNS_ADDED = {
+    "shipment_sheets": {"fingerprint": "TEXT", "version": "TEXT", "unexported": "INTEGER NOT NULL DEFAULT 0"},
+    "shipments": {"row_version": "INTEGER NOT NULL DEFAULT 1"},
+}
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+# ================= FINGERPRINT TỪNG SHEET (ZIP DIRECTORY) =================
+
+@dataclass(frozen=True)
+class SheetPart:
+    name: str
+    member: str       # vd "xl/worksheets/sheet8.xml"
+    fingerprint: str  # "crc32:size" của member trong zip
+    visible: bool
+
+
+def workbook_sheet_parts(path: Path | str) -> List[SheetPart]:
+    """
+    Các sheet của workbook theo thứ tự, kèm fingerprint. Chỉ đọc central
+    directory của zip + workbook.xml / workbook.xml.rels, không parse sheet nào.
+    """
+    with zipfile.ZipFile(path) as zf:
+        infos = {info.filename: info for info in zf.infolist()}
+        book = ET.fromstring(zf.read("xl/workbook.xml"))
+        rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+
+    targets = {}
+    for rel in rels.iter(f"{_NS_PKG_REL}Relationship"):
+        target = rel.get("Target", "")
+        # Target tuyệt đối ("/xl/worksheets/...") hoặc tương đối so với xl/
+        targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+
+    parts = []
+    for sheet in book.iter(f"{_NS_MAIN}sheet"):
+        member = targets.get(sheet.get(f"{_NS_REL}id"), "")
+        info = infos.get(member)
+        fingerprint = f"{info.CRC:08x}:{info.file_size}" if info is not None else ""
+        parts.append(SheetPart(
+            name=sheet.get("name", ""),
+            member=member,
+            fingerprint=fingerprint,
+            visible=sheet.get("state", "visible") == "visible",
+        ))
+    return parts
+
+
+# ================= CHANGE SET (CHỈ CÁC DÒNG ĐỔI) =================
+
+@dataclass
+class ChangeSet:
+    sheet: str
+    edited: Dict[int, Dict[str, Any]] = field(default_factory=dict)  # row id -> {cột Excel: giá trị mới}
+    added: List[Dict[str, Any]] = field(default_factory=list)        # dòng mới {cột Excel: giá trị}
+    deleted: List[int] = field(default_factory=list)                 # row id
+    base_versions: Dict[int, int] = field(default_factory=dict)      # row id -> row_version lúc load
+    author: str = ""
+
+    @property
+    def empty(self) -> bool:
+        return not (self.edited or self.added or self.deleted)
+
+
+@dataclass
+class ChangeResult:
+    sheet: str
+    edited: int = 0
+    added: int = 0
+    deleted: int = 0
+    conflicts: List[int] = field(default_factory=list)  # row id bị người khác sửa / xoá trước
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.conflicts
+
+
+# ================= CHUYỂN GIÁ TRỊ Ô <-> SQLITE =================
+
+def _is_blank(v: Any) -> bool:
+    if v is None or v is pd.NaT:
+        return True
+    if isinstance(v, float) and v != v:
+        return True
+    return isinstance(v, str) and not v.strip()
+
+
+def _iso(ts: Any) -> str:
+    ts = pd.Timestamp(ts)
+    if ts == ts.normalize():
+        return ts.strftime("%Y-%m-%d")
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _date_cell(v: Any) -> Any:
+    """Ngày -> ISO text (chuỗi parse dayfirst như các reader cũ); không parse được -> giữ nguyên."""
+    if _is_blank(v):
+        return None
+    if isinstance(v, (datetime, date, pd.Timestamp)):
+        return _iso(v)
+    if isinstance(v, str):
+        ts = pd.to_datetime(v.strip(), dayfirst=True, errors="coerce")
+        return v if pd.isna(ts) else _iso(ts)
+    return _plain(v)
+
+
+def _number_cell(v: Any) -> Any:
+    if _is_blank(v):
+        return None
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return _plain(v)  # ô số chứa chữ -> giữ nguyên, SQLite cho phép
+    return int(f) if f.is_integer() else f
+
+
+def _plain(v: Any) -> Any:
+    # SQLite chỉ nhận kiểu cơ bản; numpy / Timestamp quy về Python
+    if _is_blank(v):
+        return None
+    if isinstance(v, (datetime, date, pd.Timestamp)):
+        return _iso(v)
+    if hasattr(v, "item"):
+        v = v.item()
+    if isinstance(v, (str, int, float)):
+        return v
+    return str(v)
+
+
+def _cell(v: Any, kind: str) -> Any:
+    if kind == "date":
+        return _date_cell(v)
+    if kind == "num":
+        return _number_cell(v)
+    return _plain(v)
+
+
+def _iso_week(etd: Any) -> tuple:
+    if not isinstance(etd, str):
+        return None, None
+    ts = pd.to_datetime(etd, format="ISO8601", errors="coerce")
+    if pd.isna(ts):
+        return None, None
+    iso = ts.isocalendar()
+    return int(iso[0]), int(iso[1])
+
+
+def _frame_dates(s: pd.Series) -> pd.Series:
+    """Cột ngày đọc từ DB -> datetime64; nếu có ô chữ thì trả object (ngày + chữ)."""
+    parsed = pd.to_datetime(s, format="ISO8601", errors="coerce")
+    text = parsed.isna() & s.notna()
+    if text.any():
+        return parsed.astype(object).where(~text, s)
+    return parsed
+
+
+def _frame_numbers(s: pd.Series) -> pd.Series:
+    """Cột số đọc từ DB (kể cả cột toàn trống) -> số; có ô chữ thì giữ nguyên."""
+    if s.dtype != object:
+        return s
+    num = pd.to_numeric(s, errors="coerce")
+    return s if (num.isna() & s.notna()).any() else num
+
+
+def _sheet_numbers(df: pd.DataFrame) -> pd.DataFrame:
+    """Cột số toàn số nguyên (không trống) -> int64, như read_excel từng sheet."""
+    for col, (_, kind) in SHIPMENT_COLUMNS.items():
+        if kind != "num" or col not in df.columns or df[col].dtype.kind != "f":
+            continue
+        s = df[col]
+        if len(s) and s.notna().all() and (s % 1 == 0).all():
+            df[col] = s.astype("int64")
+    return df
+
+
+def _rows_of(sheet: str, df: pd.DataFrame) -> tuple:
+    """DataFrame 1 sheet -> (danh sách cột, các dòng để INSERT)."""
+    columns = [str(c) for c in df.columns]
+    known = [c for c in columns if c in SHIPMENT_COLUMNS]
+    extra_cols = [c for c in columns if c not in SHIPMENT_COLUMNS]
+    records = df.to_dict("records") if len(df) else []
+
+    rows = []
+    for row_no, rec in enumerate(records):
+        rec = {str(k): v for k, v in rec.items()}
+        if all(_is_blank(rec.get(c)) for c in columns):
+            continue  # dòng trống cuối sheet
+        values = [_cell(rec.get(c), SHIPMENT_COLUMNS[c][1]) if c in known else None for c in SHIPMENT_COLUMNS]
+        etd = values[list(SHIPMENT_COLUMNS).index("ETD")]
+        extra = {c: _plain(rec.get(c)) for c in extra_cols if not _is_blank(rec.get(c))}
+        rows.append([sheet, row_no] + values + list(_iso_week(etd)) + [json.dumps(extra, ensure_ascii=False) if extra else None])
+    return columns, rows
+
+
+class ShipmentStore:
+    def __init__(
+        self,
+        db_path: Path | str = SHIPMENT_DB,
+        workbook: Path | str = SHIPMENTS_FILE,
+        stat_interval: float = STAT_INTERVAL_SECONDS,
+    ):
+        self.db_path = Path(db_path)
+        self.workbook = Path(workbook)
+        self.stat_interval = stat_interval
+        self.import_count = 0
+        self.last_sync: Dict[str, Any] = {}
+        self.last_error: Optional[str] = None
+
+        self._lock = threading.RLock()
+        self._last_stat = 0.0
+        self._ensure_schema()
+
+    # ---------- đồng bộ với workbook ----------
+    def sync(self, force: bool = False) -> bool:
+        """
+        Đồng bộ lại nếu workbook đổi so với lần import / export trước
+        (chỉ parse các sheet có fingerprint đổi, xem sync_sheets).
+        True nếu vừa đồng bộ. Không có workbook -> dùng dữ liệu đang có trong DB.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_stat < self.stat_interval:
+            return False
+        with self._lock:
+            self._last_stat = now
+            sig = file_signature(self.workbook)
+            if sig is None:
+                if not self.sheets(visible_only=False, sync=False):
+                    raise FileNotFoundError(f"Không tìm thấy file shipments: {self.workbook}")
+                return False
+            if not force and self._meta("workbook_version") == signature_version(sig):
+                return False
+            self.sync_sheets()
+            return True
+
+    def sync_sheets(self) -> List[str]:
+        """
+        Parse lại các sheet mới / có fingerprint khác lần đồng bộ trước, xoá
+        sheet không còn trong workbook, các sheet còn lại giữ nguyên dữ liệu
+        (chỉ cập nhật thứ tự / ẩn hiện). Trả về tên các sheet đã parse.
+        Sheet còn thay đổi chưa export (unexported) không bị parse lại / xoá:
+        dữ liệu DB được giữ, ghi đè workbook ở lần export sau.
+        """
+        with self._lock:
+            sig = file_signature(self.workbook)
+            # Fingerprint đọc TRƯỚC khi parse: file bị ghi đè giữa chừng -> lần sau vẫn thấy đổi
+            parts = workbook_sheet_parts(self.workbook)
+            with self._connect() as conn:
+                known = dict(conn.execute("SELECT sheet, fingerprint FROM shipment_sheets").fetchall())
+                held = {r[0] for r in conn.execute("SELECT sheet FROM shipment_sheets WHERE unexported = 1")}
+            changed = [
+                p.name for p in parts
+                if (not p.fingerprint or known.get(p.name) != p.fingerprint) and p.name not in held
+            ]
+            frames = pd.read_excel(self.workbook, sheet_name=changed, engine="openpyxl") if changed else {}
+
+            names = {p.name for p in parts}
+            with self._connect() as conn:
+                layout = conn.execute("SELECT sheet, position, visible FROM shipment_sheets").fetchall()
+                for sheet in known:
+                    if sheet in held:
+                        continue
+                    if sheet not in names or sheet in frames:
+                        conn.execute("DELETE FROM shipments WHERE sheet = ?", (sheet,))
+                        conn.execute("DELETE FROM shipment_sheets WHERE sheet = ?", (sheet,))
+                for position, part in enumerate(parts):
+                    if part.name in frames:
+                        self._insert_sheet(conn, part.name, frames[part.name], position, part.visible, part.fingerprint)
+                    else:
+                        conn.execute(
+                            "UPDATE shipment_sheets SET position = ?, visible = ? WHERE sheet = ?",
+                            (position, int(part.visible), part.name),
+                        )
+                new_layout = conn.execute("SELECT sheet, position, visible FROM shipment_sheets").fetchall()
+                if not frames and sorted(new_layout) != sorted(layout):
+                    self._set_meta(conn, "data_version", f"{time.time_ns():x}")
+                if sig is not None:
+                    self._set_meta(conn, "workbook_version", signature_version(sig))
+
+            self.import_count += 1
+            self.last_sync = {
+                "parsed": list(frames),
+                "reused": len(parts) - len(frames),
+                "held": sorted(held & {p.name for p in parts if known.get(p.name) != p.fingerprint}),
+            }
+            self.last_error = None
+            return list(frames)
+
+    def import_workbook(self, path: Path | str | None = None) -> int:
+        """Đọc workbook 1 lần, thay toàn bộ dữ liệu trong DB. Trả về số dòng."""
+        path = Path(path or self.workbook)
+        with self._lock:
+            sig = file_signature(path)
+            fingerprints = {p.name: p.fingerprint for p in workbook_sheet_parts(path)} if path == self.workbook else {}
+            xls = pd.ExcelFile(path, engine="openpyxl")
+            try:
+                states = {ws.title: ws.sheet_state for ws in xls.book.worksheets}
+                frames = {name: pd.read_excel(xls, sheet_name=name) for name in xls.sheet_names}
+            finally:
+                xls.close()
+
+            n = 0
+            with self._connect() as conn:
+                conn.execute("DELETE FROM shipments")
+                conn.execute("DELETE FROM shipment_sheets")
+                for position, (name, df) in enumerate(frames.items()):
+                    visible = states.get(name, "visible") == "visible"
+                    n += self._insert_sheet(conn, name, df, position, visible, fingerprints.get(name))
+                if sig is not None and path == self.workbook:
+                    self._set_meta(conn, "workbook_version", signature_version(sig))
+            self.import_count += 1
+            self.last_sync = {"parsed": list(frames), "reused": 0}
+            self.last_error = None
+            return n
+
+    def export_workbook(self, path: Path | str | None = None, sheets: Optional[Iterable[str]] = None) -> str:
+        """
+        Ghi dữ liệu DB ra workbook: sheets=None -> dựng lại cả file,
+        ngược lại chỉ thay các sheet đó (giữ nguyên vị trí) trong file đang có.
+        """
+        path = Path(path or self.workbook)
+        with self._lock:
+            names = self.sheets(visible_only=False, sync=False) if sheets is None else list(sheets)
+            partial = sheets is not None and path.exists()
+            os.makedirs(path.parent, exist_ok=True)
+
+            writer_kwargs = dict(mode="a", if_sheet_exists="replace") if partial else {}
+            with pd.ExcelWriter(path, engine="openpyxl", **writer_kwargs) as writer:
+                for name in names:
+                    self.load_sheet(name, sync=False).to_excel(writer, sheet_name=name, index=False)
+                if not partial:
+                    hidden = set(self.sheets(visible_only=False, sync=False)) - set(self.sheets(sync=False))
+                    for name in hidden & set(names):
+                        writer.book[name].sheet_state = "hidden"
+
+            sig = file_signature(path)
+            if sig is not None and path == self.workbook:
+                # openpyxl ghi lại cả file -> fingerprint mọi sheet đổi, dữ liệu thì vẫn là dữ liệu trong DB
+                parts = workbook_sheet_parts(path)
+                with self._connect() as conn:
+                    conn.executemany(
+                        "UPDATE shipment_sheets SET fingerprint = ? WHERE sheet = ?",
+                        [(p.fingerprint, p.name) for p in parts],
+                    )
+                    conn.executemany(
+                        "UPDATE shipment_sheets SET unexported = 0 WHERE sheet = ?", [(n,) for n in names]
+                    )
+                    self._set_meta(conn, "workbook_version", signature_version(sig))
+            return str(path)
+
+    # ---------- ghi ----------
+    def replace_sheet(self, sheet: str, df: pd.DataFrame) -> int:
+        """Thay toàn bộ dòng của 1 sheet (thêm sheet mới ở cuối nếu chưa có)."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT position, visible FROM shipment_sheets WHERE sheet = ?", (sheet,)).fetchone()
+            if row is None:
+                position = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM shipment_sheets").fetchone()[0]
+                visible = True
+            else:
+                position, visible = row
+            conn.execute("DELETE FROM shipments WHERE sheet = ?", (sheet,))
+            conn.execute("DELETE FROM shipment_sheets WHERE sheet = ?", (sheet,))
+            n = self._insert_sheet(conn, sheet, df, position, bool(visible))
+            conn.execute("UPDATE shipment_sheets SET unexported = 1 WHERE sheet = ?", (sheet,))
+            return n
+
+    def save_sheet(self, sheet: str, df: pd.DataFrame) -> int:
+        """replace_sheet() rồi export đúng sheet đó ra workbook."""
+        with self._lock:
+            n = self.replace_sheet(sheet, df)
+            self.export_workbook(sheets=[sheet])
+            return n
+
+    def apply_changes(self, changes: Iterable[ChangeSet]) -> List[ChangeResult]:
+        """
+        Ghi nhiều ChangeSet trong 1 transaction. Dòng sửa / xoá chỉ được ghi
+        nếu row_version vẫn bằng base_versions (không có thì bỏ qua check);
+        dòng không khớp -> conflict, các dòng khác của ChangeSet vẫn được ghi.
+        Không đụng tới workbook (export_workbook làm sau, xem shipment_writer).
+        """
+        results = []
+        with self._lock, self._connect() as conn:
+            for cs in changes:
+                res = ChangeResult(sheet=cs.sheet)
+                results.append(res)
+                layout = conn.execute("SELECT columns FROM shipment_sheets WHERE sheet = ?", (cs.sheet,)).fetchone()
+                if layout is None:
+                    res.error = f"Worksheet named '{cs.sheet}' not found"
+                    continue
+                columns = json.loads(layout[0])
+
+                for rid in list(cs.edited) + list(cs.deleted):
+                    row = conn.execute("SELECT sheet, row_version FROM shipments WHERE id = ?", (int(rid),)).fetchone()
+                    base = cs.base_versions.get(rid)
+                    if row is None or row[0] != cs.sheet or (base is not None and row[1] != base):
+                        res.conflicts.append(rid)
+                conflicts = set(res.conflicts)
+
+                for rid, values in cs.edited.items():
+                    if rid in conflicts or rid in cs.deleted:
+                        continue
+                    self._update_row(conn, int(rid), values)
+                    res.edited += 1
+                for rid in cs.deleted:
+                    if rid in conflicts:
+                        continue
+                    conn.execute("DELETE FROM shipments WHERE id = ?", (int(rid),))
+                    res.deleted += 1
+                if cs.added:
+                    new_cols = [str(c) for rec in cs.added for c in rec if str(c) not in columns]
+                    columns += list(dict.fromkeys(new_cols))
+                    start = conn.execute(
+                        "SELECT COALESCE(MAX(row_no) + 1, 0) FROM shipments WHERE sheet = ?", (cs.sheet,)
+                    ).fetchone()[0]
+                    _, rows = _rows_of(cs.sheet, pd.DataFrame(cs.added, columns=columns))
+                    for row in rows:
+                        row[1] += start
+                    conn.executemany(_INSERT_SQL, rows)
+                    res.added = len(rows)
+
+                if res.edited or res.added or res.deleted:
+                    version = f"{time.time_ns():x}"
+                    conn.execute(
+                        "UPDATE shipment_sheets SET columns = ?, version = ?, unexported = 1 WHERE sheet = ?",
+                        (json.dumps(columns, ensure_ascii=False), version, cs.sheet),
+                    )
+                    self._set_meta(conn, "data_version", version)
+        return results
+
+    # ---------- đọc ----------
+    def sheets(self, visible_only: bool = True, sync: bool = True) -> List[str]:
+        """Tên sheet theo thứ tự trong workbook."""
+        if sync:
+            self.sync()
+        cond = " WHERE visible = 1" if visible_only else ""
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute(f"SELECT sheet FROM shipment_sheets{cond} ORDER BY position")]
+
+    def query(
+        self,
+        sheets: Optional[Iterable[str]] = None,
+        etd_from: Optional[Any] = None,
+        etd_to: Optional[Any] = None,
+        iso_year: Optional[int] = None,
+        iso_week: Optional[int] = None,
+        customer: Optional[str] = None,
+        status: Optional[Iterable[str]] = None,
+        sync: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Các dòng khớp điều kiện, cột theo tên Excel (+ cột "Sheet"), xếp theo
+        thứ tự sheet rồi thứ tự dòng. etd_from / etd_to tính theo ngày, gồm cả 2 đầu.
+        """
+        if sync:
+            self.sync()
+        where, params = [], []
+        if sheets is not None:
+            names = list(sheets)
+            where.append(f"s.sheet IN ({', '.join('?' for _ in names)})" if names else "0")
+            params.extend(names)
+        if etd_from is not None:
+            where.append("s.etd >= ?")
+            params.append(_iso(pd.Timestamp(etd_from).normalize()))
+        if etd_to is not None:
+            where.append("s.etd < ?")
+            params.append(_iso(pd.Timestamp(etd_to).normalize() + timedelta(days=1)))
+        if iso_year is not None and iso_week is not None:
+            where.append("s.iso_year = ? AND s.iso_week = ?")
+            params.extend([int(iso_year), int(iso_week)])
+        if customer:
+            where.append("s.customer = ?")
+            params.append(customer)
+        if status is not None:
+            wanted = [str(x) for x in status]
+            where.append(f"s.status IN ({', '.join('?' for _ in wanted)})" if wanted else "0")
+            params.extend(wanted)
+        cond = (" WHERE " + " AND ".join(where)) if where else ""
+
+        sql = (
+            "SELECT s.* FROM shipments s JOIN shipment_sheets h ON h.sheet = s.sheet"
+            f"{cond} ORDER BY h.position, s.row_no"
+        )
+        with self._connect() as conn:
+            raw = pd.read_sql_query(sql, conn, params=params)
+        return self._to_frame(raw)
+
+    def load_sheet(self, sheet: str, sync: bool = True) -> pd.DataFrame:
+        """1 sheet tháng, đúng thứ tự cột trong workbook."""
+        if sync:
+            self.sync()
+        with self._connect() as conn:
+            row = conn.execute("SELECT columns FROM shipment_sheets WHERE sheet = ?", (sheet,)).fetchone()
+        if row is None:
+            raise ValueError(f"Worksheet named '{sheet}' not found")
+        df = self.query(sheets=[sheet], sync=False).reindex(columns=json.loads(row[0]))
+        # index = row id; row_version lúc load -> base cho optimistic check của ChangeSet
+        with self._connect() as conn:
+            df.attrs["row_versions"] = dict(
+                conn.execute("SELECT id, row_version FROM shipments WHERE sheet = ?", (sheet,)).fetchall()
+            )
+        df.attrs["sheet"] = sheet
+        return df
+
+    def load_all(self, sheets: Optional[Iterable[str]] = None, sync: bool = True) -> Dict[str, pd.DataFrame]:
+        """
+        {sheet: DataFrame} cho mọi sheet (kể cả sheet ẩn) như
+        read_excel(sheet_name=None), hoặc chỉ các sheet trong `sheets`.
+        """
+        if sync:
+            self.sync()
+        with self._connect() as conn:
+            layout = conn.execute("SELECT sheet, columns FROM shipment_sheets ORDER BY position").fetchall()
+        if sheets is not None:
+            wanted = set(sheets)
+            layout = [(sheet, columns) for sheet, columns in layout if sheet in wanted]
+        frame = self.query(sheets=[sheet for sheet, _ in layout] if sheets is not None else None, sync=False)
+        groups = dict(tuple(frame.groupby("Sheet", sort=False))) if len(frame) else {}
+        out = {}
+        for sheet, columns in layout:
+            df = groups.get(sheet, frame.iloc[0:0])
+            out[sheet] = _sheet_numbers(df.reindex(columns=json.loads(columns)).reset_index(drop=True))
+        return out
+
+    def unexported_sheets(self) -> List[str]:
+        """Sheet có thay đổi trong DB chưa ghi ra workbook."""
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute(
+                "SELECT sheet FROM shipment_sheets WHERE unexported = 1 ORDER BY position"
+            )]
+
+    def sheet_versions(self, sync: bool = True) -> Dict[str, str]:
+        """{sheet: version} theo thứ tự workbook; version đổi khi dữ liệu sheet đó đổi."""
+        if sync:
+            self.sync()
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT sheet, COALESCE(version, '') FROM shipment_sheets ORDER BY position"))
+
+    @property
+    def version(self) -> str:
+        """Thay đổi mỗi khi dữ liệu trong DB đổi (import / save) – để làm key cache."""
+        self.sync()
+        with self._connect() as conn:
+            return self._meta("data_version", conn) or "empty"
+
+    # ---------- internal ----------
+    def _to_frame(self, raw: pd.DataFrame) -> pd.DataFrame:
+        out = pd.DataFrame({"Sheet": raw["sheet"]})
+        for col, (sql, kind) in SHIPMENT_COLUMNS.items():
+            if kind == "date":
+                out[col] = _frame_dates(raw[sql])
+            elif kind == "num":
+                out[col] = _frame_numbers(raw[sql])
+            else:
+                out[col] = raw[sql]
+        if raw["extra"].notna().any():
+            extras = pd.DataFrame(
+                [json.loads(x) if isinstance(x, str) else {} for x in raw["extra"]], index=raw.index
+            )
+            for col in extras.columns:
+                out[col] = extras[col]
+        out.index = pd.Index(raw["id"].to_numpy(), name="row_id")
+        return out
+
+    def _update_row(self, conn: sqlite3.Connection, rid: int, values: Dict[str, Any]) -> None:
+        sets, params = [], []
+        extra_values = {}
+        for col, v in values.items():
+            col = str(col)
+            if col in SHIPMENT_COLUMNS:
+                sql, kind = SHIPMENT_COLUMNS[col]
+                cell = _cell(v, kind)
+                sets.append(f"{sql} = ?")
+                params.append(cell)
+                if col == "ETD":
+                    sets.append("iso_year = ?, iso_week = ?")
+                    params.extend(_iso_week(cell))
+            else:
+                extra_values[col] = _plain(v)
+        if extra_values:
+            old = conn.execute("SELECT extra FROM shipments WHERE id = ?", (rid,)).fetchone()[0]
+            extra = json.loads(old) if old else {}
+            extra.update(extra_values)
+            extra = {k: v for k, v in extra.items() if v is not None}
+            sets.append("extra = ?")
+            params.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        sets.append("row_version = row_version + 1")
+        conn.execute(f"UPDATE shipments SET {', '.join(sets)} WHERE id = ?", params + [rid])
+
+    def _insert_sheet(
+        self,
+        conn: sqlite3.Connection,
+        sheet: str,
+        df: pd.DataFrame,
+        position: int,
+        visible: bool,
+        fingerprint: Optional[str] = None,
+    ) -> int:
+        columns, rows = _rows_of(sheet, df)
+        version = f"{time.time_ns():x}"
+        conn.execute(
+            "INSERT INTO shipment_sheets (sheet, position, visible, columns, fingerprint, version) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (sheet, int(position), int(visible), json.dumps(columns, ensure_ascii=False), fingerprint, version),
+        )
+        conn.executemany(_INSERT_SQL, rows)
+        self._set_meta(conn, "data_version", version)
+        return len(rows)
+
+    def _meta(self, key: str, conn: Optional[sqlite3.Connection] = None) -> Optional[str]:
+        if conn is None:
+            with self._connect() as c:
+                return self._meta(key, c)
+        row = conn.execute("SELECT value FROM shipment_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: str) -> None:
+        conn.execute("INSERT OR REPLACE INTO shipment_meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @staticmethod
+    def _migrate_autoincrement(conn: sqlite3.Connection) -> None:
+        """DB cũ (id INTEGER PRIMARY KEY, SQLite dùng lại id đã xoá) -> dựng lại bảng, giữ nguyên id."""
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'shipments'").fetchone()[0]
+        if "AUTOINCREMENT" in sql.upper():
+            return
+        cols = ", ".join(r[1] for r in conn.execute("PRAGMA table_info(shipments)"))
+        indexes = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'shipments' AND sql IS NOT NULL"
+        )]
+        conn.executescript(
+            "BEGIN;\n"
+            + "".join(f"DROP INDEX {name};\n" for name in indexes)
+            + "ALTER TABLE shipments RENAME TO shipments_old;\n"
+            + _SCHEMA
+            + f"INSERT INTO shipments ({cols}) SELECT {cols} FROM shipments_old;\n"
+            + "DROP TABLE shipments_old;\n"
+            + "COMMIT;"
+        )
+
+    def _ensure_schema(self) -> None:
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+            for table, added in _COLUMNS_ADDED.items():
+                have = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+                for col, sql_type in added.items():
+                    if col not in have:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {sql_type}")
+            conn.commit()
+            self._migrate_autoincrement(conn)
+        finally:
+            conn.close()
+
+
+# ================= REGISTRY (1 store / file / process) =================
+
+_STORES: Dict[str, ShipmentStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_shipment_store(db_path: Path | str = SHIPMENT_DB, workbook: Path | str = SHIPMENTS_FILE) -> ShipmentStore:
+    key = str(Path(db_path).resolve())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = ShipmentStore(db_path, workbook)
+            _STORES[key] = store
+        return store
@@ -0,0 +1,259 @@
+# ==================== SHIPMENT_WRITER.PY ====================
+"""
+Lưu chỉnh sửa shipment kiểu write-behind.
+
+Trước đây mỗi lần bấm "Save Data", save_shipments() mở Shipments.xlsx ở
+chế độ append của openpyxl và ghi lại cả sheet tháng: chậm, và 2 sale
+cùng sửa 1 tháng thì người lưu sau ghi đè thay đổi của người lưu trước.
+
+- Trang chỉ gửi ChangeSet (dòng sửa / thêm / xoá của st.data_editor, xem
+  shipment_analyzer.editor_change_set); submit() bỏ vào hàng đợi rồi trả
+  về ngay 1 ticket.
+- 1 thread nền duy nhất / store: gom các ChangeSet đang chờ (tối đa
+  WRITE_BATCH_SIZE, chờ thêm WRITE_INTERVAL_SECONDS) rồi ghi vào shipment
+  store trong 1 transaction (ShipmentStore.apply_changes, optimistic check
+  theo row_version -> dòng bị người khác sửa trước thì báo conflict).
+- Workbook ghi sau EXPORT_DELAY_SECONDS kể từ lần apply đầu tiên chưa
+  export: nhiều lần lưu liên tiếp chỉ tốn 1 lần ghi mỗi sheet bị đổi.
+  Ghi workbook lỗi (file đang mở trong Excel...) -> giữ lại, lần sau thử lại.
+  Sheet còn thay đổi chưa export từ process trước (cờ unexported trong
+  store) được lên lịch export ngay khi tạo writer.
+"""
+
+from __future__ import annotations
+
+import atexit
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from .shipment_store import ChangeResult, ChangeSet, ShipmentStore, get_shipment_store
+
+
+# Gom tối đa bao nhiêu ChangeSet / transaction, và chờ gom thêm bao lâu (giây)
+WRITE_BATCH_SIZE = 100
+WRITE_INTERVAL_SECONDS = 0.2
+
+# Ghi workbook muộn nhất bao lâu sau lần apply đầu tiên chưa export (giây)
+EXPORT_DELAY_SECONDS = 2.0
+
+# Số kết quả (ticket -> ChangeResult) giữ lại cho trang hỏi
+RESULT_HISTORY = 500
+
+_STOP = object()
+
+
+class ShipmentWriter:
+    def __init__(
+        self,
+        store: ShipmentStore,
+        batch_size: int = WRITE_BATCH_SIZE,
+        interval: float = WRITE_INTERVAL_SECONDS,
+        export_delay: float = EXPORT_DELAY_SECONDS,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.interval = interval
+        self.export_delay = export_delay
+        self.applied = 0
+        self.conflicts = 0
+        self.exports = 0
+        self.last_error: Optional[str] = None
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._tickets = itertools.count(1)
+        self._results: "OrderedDict[int, ChangeResult]" = OrderedDict()
+        self._pending: Dict[int, str] = {}  # ticket -> sheet, chưa apply
+        self._dirty: Set[str] = set()       # sheet đã apply, chưa ghi workbook
+        self._export_at: Optional[float] = None
+        self._export_attempts = 0
+        self._cond = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+
+    # ---------- ghi ----------
+    def submit(self, changes: ChangeSet) -> Optional[int]:
+        """Đưa 1 ChangeSet vào hàng đợi (không block). Trả về ticket, None nếu không có gì đổi."""
+        if changes.empty:
+            return None
+        self._ensure_writer()
+        with self._cond:
+            ticket = next(self._tickets)
+            self._pending[ticket] = changes.sheet
+        self._queue.put((ticket, changes))
+        return ticket
+
+    def result(self, ticket: int) -> Optional[ChangeResult]:
+        """Kết quả của ticket; None nếu chưa apply (hoặc đã quá cũ)."""
+        with self._cond:
+            return self._results.get(ticket)
+
+    def wait_applied(self, sheet: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """
+        Chờ tới khi các ChangeSet đã submit (của `sheet`, hoặc tất cả) được
+        ghi vào store – không chờ ghi workbook. False nếu hết timeout.
+        """
+        def done() -> bool:
+            return not any(sheet is None or s == sheet for s in self._pending.values())
+
+        with self._cond:
+            return self._cond.wait_for(done, timeout)
+
+    def pending(self, sheet: Optional[str] = None) -> int:
+        with self._cond:
+            return sum(1 for s in self._pending.values() if sheet is None or s == sheet)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Apply mọi ChangeSet đang chờ và ghi ngay các sheet đã đổi ra workbook."""
+        if not self.wait_applied(timeout=timeout):
+            return False
+        with self._cond:
+            if not self._dirty:
+                return True
+            attempts = self._export_attempts
+            self._export_at = time.monotonic()
+            self._queue.put(None)  # đánh thức thread để export ngay
+            self._cond.wait_for(lambda: not self._dirty or self._export_attempts > attempts, timeout)
+            return not self._dirty
+
+    def close(self) -> None:
+        thread = self._writer
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+        self._writer = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "dirty_sheets": sorted(self._dirty),
+                "applied": self.applied,
+                "conflicts": self.conflicts,
+                "exports": self.exports,
+                "last_error": self.last_error,
+            }
+
+    def resume(self) -> None:
+        """Sheet còn thay đổi chưa export (vd process trước dừng giữa chừng) -> lên lịch ghi workbook."""
+        sheets = self.store.unexported_sheets()
+        if not sheets:
+            return
+        with self._cond:
+            self._dirty.update(sheets)
+            if self._export_at is None:
+                self._export_at = time.monotonic() + self.export_delay
+        self._ensure_writer()
+        self._queue.put(None)  # đánh thức thread để tính lại hạn export
+
+    # ---------- internal ----------
+    def _ensure_writer(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._cond:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="shipment-writer", daemon=True)
+                self._writer.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                wait = None if self._export_at is None else max(0.0, self._export_at - time.monotonic())
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None  # tới hạn ghi workbook
+
+            batch: List[tuple] = []
+            stop = item is _STOP
+            if isinstance(item, tuple):
+                batch.append(item)
+                # Gom thêm ChangeSet đang chờ (tối đa batch_size / interval) rồi ghi 1 lần
+                while len(batch) < self.batch_size:
+                    try:
+                        nxt = self._queue.get(timeout=self.interval)
+                    except queue.Empty:
+                        break
+                    if nxt is _STOP:
+                        stop = True
+                        break
+                    if isinstance(nxt, tuple):
+                        batch.append(nxt)
+
+            if batch:
+                self._apply(batch)
+            with self._cond:
+                due = self._export_at is not None and (stop or time.monotonic() >= self._export_at)
+            if due:
+                self._export()
+            if stop:
+                return
+
+    def _apply(self, batch: List[tuple]) -> None:
+        try:
+            results = self.store.apply_changes([cs for _, cs in batch])
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+            results = [ChangeResult(sheet=cs.sheet, error=err) for _, cs in batch]
+            self.last_error = err
+
+        with self._cond:
+            for (ticket, _), res in zip(batch, results):
+                self._pending.pop(ticket, None)
+                self._results[ticket] = res
+                self.applied += int(res.error is None)
+                self.conflicts += len(res.conflicts)
+                if res.edited or res.added or res.deleted:
+                    self._dirty.add(res.sheet)
+            while len(self._results) > RESULT_HISTORY:
+                self._results.popitem(last=False)
+            if self._dirty and self._export_at is None:
+                self._export_at = time.monotonic() + self.export_delay
+            self._cond.notify_all()
+
+    def _export(self) -> None:
+        with self._cond:
+            sheets = sorted(self._dirty)
+            self._dirty.clear()
+            self._export_at = None
+        if not sheets:
+            return
+        try:
+            self.store.export_workbook(sheets=sheets)
+            self.exports += 1
+            self.last_error = None
+        except Exception as e:  # workbook đang mở / bị khoá -> giữ lại, lần sau thử lại
+            self.last_error = f"{type(e).__name__}: {e}"
+            with self._cond:
+                self._dirty.update(sheets)
+                self._export_at = time.monotonic() + self.export_delay
+        with self._cond:
+            self._export_attempts += 1
+            self._cond.notify_all()
+
+
+# ================= REGISTRY (1 writer / store / process) =================
+
+_WRITERS: Dict[str, ShipmentWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def get_shipment_writer(store: Optional[ShipmentStore] = None) -> ShipmentWriter:
+    store = store or get_shipment_store()
+    key = str(store.db_path.resolve())
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(key)
+        if writer is None:
+            writer = ShipmentWriter(store)
+            writer.resume()
+            _WRITERS[key] = writer
+        return writer
+
+
+@atexit.register
+def _flush_all() -> None:
+    # Thoát process: ghi nốt các ChangeSet còn trong hàng đợi và export workbook
+    for writer in list(_WRITERS.values()):
+        writer.close()
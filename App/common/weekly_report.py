@@ -10,6 +10,8 @@ from openpyxl import load_workbook
 from openpyxl.workbook import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 
+from .shipment_store import SHIPMENTS_FILE, get_shipment_store
+
 
 # ====== CONFIG PATHS ======
 
@@ -18,8 +20,6 @@ DATA_DIR = BASE_DIR / "Data"
 REPORTS_DIR = BASE_DIR / "Output" / "Reports"
 REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-SHIPMENTS_FILE = DATA_DIR / "Shipments.xlsx"
-
 # Nếu sau này anh có sheet summary riêng thì gán tên vào đây,
 # còn hiện tại layout đang dùng sheet active cho cả I và II.
 SUMMARY_SHEET_NAME: Optional[str] = None
@@ -78,43 +78,27 @@ def get_current_iso_week_and_year() -> tuple[int, int]:
 # ====== LOAD SHIPMENTS THEO TUẦN ======
 
 def load_shipments_for_week(year: int, week: int) -> List[dict]:
-    if not SHIPMENTS_FILE.exists():
-        raise FileNotFoundError(f"Không tìm thấy file shipments: {SHIPMENTS_FILE}")
-
-    sheets = pd.read_excel(SHIPMENTS_FILE, sheet_name=None)
+    # Shipment store: ETD đã parse + index theo tuần ISO -> chỉ đọc đúng các dòng của tuần
+    df = get_shipment_store().query(iso_year=year, iso_week=week)
     records: list[dict] = []
 
-    for _, df in sheets.items():
-        if df is None or df.empty:
+    for row in df.to_dict("records"):
+        etd = pd.to_datetime(row["ETD"], errors="coerce")
+        if pd.isna(etd):
             continue
 
-        for col in ["Customer", "Routing", "ETD", "Volume", "Profit"]:
-            if col not in df.columns:
-                df[col] = None
-
-        df["ETD"] = pd.to_datetime(df["ETD"], dayfirst=True, errors="coerce")
-
-        for _, row in df.iterrows():
-            etd = row["ETD"]
-            if pd.isna(etd):
-                continue
-
-            iso_year, iso_week, _ = etd.isocalendar()
-            if iso_year != year or iso_week != week:
-                continue
-
-            volume = float(row["Volume"]) if pd.notna(row["Volume"]) else 0.0
-            profit = float(row["Profit"]) if pd.notna(row["Profit"]) else 0.0
-
-            records.append(
-                {
-                    "etd": etd.date(),
-                    "customer": str(row["Customer"]) if pd.notna(row["Customer"]) else "",
-                    "routing": str(row["Routing"]) if pd.notna(row["Routing"]) else "",
-                    "volume": volume,
-                    "profit": profit,
-                }
-            )
+        volume = pd.to_numeric(row["Volume"], errors="coerce")
+        profit = pd.to_numeric(row["Profit"], errors="coerce")
+
+        records.append(
+            {
+                "etd": etd.date(),
+                "customer": str(row["Customer"]) if pd.notna(row["Customer"]) else "",
+                "routing": str(row["Routing"]) if pd.notna(row["Routing"]) else "",
+                "volume": float(volume) if pd.notna(volume) else 0.0,
+                "profit": float(profit) if pd.notna(profit) else 0.0,
+            }
+        )
 
     records.sort(key=lambda r: r["etd"])
     return records
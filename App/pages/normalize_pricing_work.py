@@ -776,7 +776,9 @@ def combine_all(list_df, include_expired: bool = False, cutoff_date: date | None
     # MASTER PRICING: XOAY DỌC -> NGANG
     master_wide = make_horizontal_output(filtered_no_src)
 
-    with pd.ExcelWriter(master_file, engine="openpyxl") as writer:
+    # Ghi ra file tạm rồi os.replace -> người đọc (MasterProvider) không bao giờ thấy file ghi dở
+    staging_file = os.path.splitext(master_file)[0] + ".publishing.xlsx"
+    with pd.ExcelWriter(staging_file, engine="openpyxl") as writer:
         # Sheet Master (ngang)
         master_wide.to_excel(writer, index=False, sheet_name="Master")
         ws = writer.sheets["Master"]
@@ -807,6 +809,8 @@ def combine_all(list_df, include_expired: bool = False, cutoff_date: date | None
         else:
             print(f"[SCHEDULE] Không tìm thấy file Schedule.xlsx tại: {schedule_file} -> bỏ qua.")
 
+    os.replace(staging_file, master_file)
+
     print(f"\n[HOÀN TẤT] MASTER FILE: {master_file}")
     print(
         f"    -> Tổng số dòng Master_Long (sau filter Exp + PUC + chuẩn commodity): {len(filtered_no_src)}"
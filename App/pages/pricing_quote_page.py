@@ -12,14 +12,20 @@ import re
 from pathlib import Path
 import openpyxl
 
-from common.cost_engine import generate_quote
+from common.cost_engine import generate_quotes
+from common.generator import quote_pdf_filename, render_quote_pdf
+from common.master_index import get_master_index
+from common.master_provider import get_master_provider
+from common.pricing_rules import PricingRules
+from common.quote_cache import QUOTE_CACHE, cached_generate_quotes
+from common.quote_trace import TRACE_STATS
+from common.rate_cube import get_rate_cube
 from common.models import (
     CustomerInfo,
     ShipmentInfo,
     ContainerPlanItem,
     EngineOptions,
     QuoteRequest,
-    load_master,
     MASTER_FILE,   # thêm dòng này
 )
 from menu import top_menu
@@ -58,21 +64,45 @@ def _map_from_master(master_df: pd.DataFrame, key: dict, field: str):
     """
     Map 1 field từ master theo (POL, POD, PlaceOfDelivery, Carrier).
     Không thay đổi logic tính; chỉ lấy dữ liệu thô để hiển thị.
+    Tra bằng lane index (dict) thay vì quét cả Master.
     """
     try:
-        m = master_df[
-            (master_df["POL"].astype(str).str.upper() == str(key["pol"]).upper())
-            & (master_df["POD"].astype(str).str.upper() == str(key["pod"]).upper())
-            & (master_df["PlaceOfDelivery"].astype(str).str.upper() == str(key["place"]).upper())
-            & (master_df["Carrier"].astype(str).str.upper() == str(key["carrier"]).upper())
-        ]
-        if not m.empty and field in m.columns:
-            return m.iloc[0][field]
+        row_id = get_master_index(master_df).lane_row(
+            key["pol"], key["pod"], key["place"], key["carrier"]
+        )
+        if row_id is not None and field in master_df.columns:
+            return master_df.iloc[row_id][field]
     except Exception:
         pass
     return "-"
 
 
+def _valid_from_options(df_options: pd.DataFrame) -> list:
+    """
+    Cột VALID lấy thẳng từ effective_date / expiration_date mà engine trả về
+    cùng mỗi option (không phải map ngược lại Master).
+    """
+    if "effective_date" not in df_options.columns or "expiration_date" not in df_options.columns:
+        return ["-"] * len(df_options)
+    return [
+        _fmt_valid(eff, exp)
+        for eff, exp in zip(df_options["effective_date"], df_options["expiration_date"])
+    ]
+
+
+def _show_place_match(places: list, results: list) -> None:
+    """
+    Place không khớp chính xác: báo Place gần đúng engine đã dùng (place_match
+    == "fuzzy"); Place không có giá: hiện message của engine (kèm gợi ý nếu có).
+    """
+    for place, res in zip(places, results):
+        if res.get("summary", {}).get("place_match") == "fuzzy":
+            used = sorted({str(o.get("place_of_delivery")) for o in res.get("options", [])})
+            st.warning(f"⚠️ {place}: không khớp chính xác, đang dùng giá của {', '.join(used) or '-'}.")
+        elif res.get("error"):
+            st.info(f"{place}: {res.get('message', res['error'])}")
+
+
 def _tt_compact(min_tt, max_tt) -> str:
     """
     'min-maxd' chuẩn hóa hiển thị thời gian transit. Nếu thiếu, fallback '-'.
@@ -84,6 +114,7 @@ def _tt_compact(min_tt, max_tt) -> str:
     except Exception:
         return "-"
 
+
     VERSION_SHEET_PATTERN = re.compile(
         r"^(?P<day>\d{1,2})(?P<month>[A-Z]{3})NO(?P<num>\d+)$",
         re.IGNORECASE,
@@ -206,7 +237,7 @@ def get_latest_version_from_master(master_file: str | Path = MASTER_FILE) -> str
 # ========================== PIPELINE EXTRACTION ==========================
 @st.cache_data(ttl=3600)
 def extract_pipeline_data(doc_path: str) -> dict:
-    data = {"default_markup": {}, "carriers": []}
+    data = {"default_markup": {}, "carriers": [], "markup_rules": []}
     try:
         doc = Document(doc_path)
         for para in doc.paragraphs:
@@ -221,6 +252,8 @@ def extract_pipeline_data(doc_path: str) -> dict:
                 p = v.split("=")
                 if len(p) == 2:
                     data["default_markup"][p[0].strip().upper()] = float(p[1])
+            elif t.startswith("MARKUP-RULE:"):
+                data["markup_rules"].append(t)
     except Exception:
         pass
     return data
@@ -274,8 +307,8 @@ def render_quote_page():
     st.caption("Live Preview Cost + Ranking by Container Type")
     st.markdown("---")
 
-    # --- Load master ---
-    master_df = load_master()
+    # --- Load master (dùng chung cho mọi session, reload khi file đổi) ---
+    master_df = get_master_provider(MASTER_FILE).get().frame
     if master_df.empty:
         st.error("Không tìm thấy dữ liệu MasterFullPricing.")
         return
@@ -294,28 +327,29 @@ def render_quote_page():
     pol_list = sorted(master_df["POL"].dropna().astype(str).str.upper().unique().tolist())
     pol_selected = st.segmented_control("Select POL", options=pol_list, selection_mode="single")
 
-    place_list = sorted(
-        master_df.loc[master_df["POL"].astype(str).str.upper() == str(pol_selected).upper(), "PlaceOfDelivery"]
-        .dropna().astype(str).str.upper().unique().tolist()
+    # Danh sách Place / POD lấy từ MasterIndex (không scan Master mỗi lần rerun)
+    master_idx = get_master_index(master_df)
+    place_list = master_idx.places_for_pol(pol_selected) if pol_selected else []
+
+    # Ô search gần đúng (trigram): "chicago (il)", "montrael"... -> gợi ý lên đầu danh sách
+    place_query = st.text_input("🔎 Tìm Place of Delivery (gõ gần đúng)", key="place_search")
+    suggestions = (
+        [p for p, _ in master_idx.search_places(place_query, pol=pol_selected, limit=10)]
+        if place_query and pol_selected else []
     )
+    if place_query and pol_selected and not suggestions:
+        st.caption("Không tìm thấy Place nào gần giống.")
+
     # (1) Cho phép chọn NHIỀU Place Of Delivery (chỉ thay đổi UI)
     places_selected = st.multiselect(
         "Place of Delivery",
-        options=place_list,
-        default=place_list[:1] if place_list else [],
+        options=suggestions + [p for p in place_list if p not in suggestions],
+        default=suggestions[:1] or place_list[:1],
         key="multi_place_of_delivery",
     )
 
     # POD phụ thuộc vào các Place đã chọn (union)
-    if places_selected:
-        pod_list = sorted(
-            master_df.loc[
-                master_df["PlaceOfDelivery"].astype(str).str.upper().isin([p.upper() for p in places_selected]),
-                "POD",
-            ].dropna().astype(str).str.upper().unique().tolist()
-        )
-    else:
-        pod_list = []
+    pod_list = master_idx.pods_for_places(places_selected) if places_selected else []
     pod_selected = st.selectbox("POD (optional)", [""] + pod_list if pod_list else [""])
 
     col1, col2 = st.columns(2)
@@ -337,6 +371,8 @@ def render_quote_page():
         key="multi_containers"
     )
     st.caption(f"Selected Containers: {', '.join(container_selected) if container_selected else '-'}")
+    # Ngày hàng sẵn sàng: dùng chung cho preview, rate grid và báo giá chính thức
+    cargo_ready_date = st.date_input("Cargo Ready Date", date.today(), key="cargo_ready_date")
     st.markdown("---")
 
     # ========== 💲 LIVE PRICING PREVIEW ==========
@@ -350,27 +386,51 @@ def render_quote_page():
 
     opts = EngineOptions(currency="USD", max_options_per_quote=10)
     opts.markup_map = pipeline_data.get("default_markup", {})
+    # Rule markup theo lane / container / tier / khoảng ngày (MARKUP-RULE trong Pipeline.docx)
+    opts.pricing_rules = PricingRules.from_lines(pipeline_data.get("markup_rules", []))
+    # Trace: đo từng bước engine -> chạy thẳng engine, không lấy kết quả cũ trong cache
+    opts.trace = st.checkbox("⏱ Trace quote (phễu lọc + thời gian từng bước)", key="quote_trace")
 
-    # Gom preview cho N place_of_delivery (không thay đổi thuật toán tính)
-    preview_frames = []
+    # Gom preview cho N place_of_delivery: 1 lần gọi batch cho tất cả place
+    preview_reqs = []
     for place in places_selected:
         shipment = ShipmentInfo(
             pol=pol_selected,
             place_of_delivery=place,
             pod=pod_selected,
-            cargo_ready_date=date.today().isoformat(),
+            cargo_ready_date=cargo_ready_date.isoformat(),
             commodity_type="REEFER" if fak_reefer else "FAK",
             is_soc=soc,
         )
         containers = [ContainerPlanItem(type=c, quantity=1) for c in container_selected]
 
-        preview_req = QuoteRequest(
+        preview_reqs.append(QuoteRequest(
             customer=cust,
             shipment=shipment,
             containers=containers,
             engine_options=opts,
-        )
-        res = generate_quote(master_df, preview_req)
+        ))
+
+    quote_fn = generate_quotes if opts.trace else cached_generate_quotes
+    preview_results = quote_fn(master_df, preview_reqs)
+
+    if opts.trace:
+        with st.expander("⏱ Quote trace", expanded=True):
+            for place, res in zip(places_selected, preview_results):
+                st.markdown(f"**{place}** – {res.get('error', 'OK')}")
+                st.dataframe(pd.DataFrame(res.get("trace", [])), use_container_width=True)
+            stats = TRACE_STATS.frame("cost_engine")
+            if not stats.empty:
+                st.markdown(f"**Tổng hợp {TRACE_STATS.summary()['quotes'].get('cost_engine', 0)} quote đã trace**")
+                st.bar_chart(stats.set_index("stage")["mean_us"])
+                st.dataframe(stats.drop(columns="engine"), use_container_width=True)
+            if st.button("Reset thống kê trace", key="trace_reset"):
+                TRACE_STATS.reset()
+
+    _show_place_match(places_selected, preview_results)
+
+    preview_frames = []
+    for place, res in zip(places_selected, preview_results):
         if "options" in res:
             df_part = pd.DataFrame(res["options"])
             if not df_part.empty:
@@ -407,19 +467,8 @@ def render_quote_page():
         "TRANSIT TIME": df_preview.apply(lambda r: _tt_compact(r.get("transit_min"), r.get("transit_max")), axis=1),
     })
 
-    # Map VALID từ master theo khóa (POL,POD,Place,Carrier)
-    valid_list = []
-    for _, r in df_preview.iterrows():
-        key = {
-            "pol": r.get("pol", ""),
-            "pod": r.get("pod", ""),
-            "place": r.get("place_of_delivery", ""),
-            "carrier": r.get("carrier", ""),
-        }
-        eff = _map_from_master(master_df, key, "EffectiveDate")
-        exp = _map_from_master(master_df, key, "ExpirationDate")
-        valid_list.append(_fmt_valid(eff, exp))
-    display_data["VALID"] = valid_list
+    # VALID lấy theo dòng giá engine đã chọn cho từng option
+    display_data["VALID"] = _valid_from_options(df_preview)
 
     # Mapping bổ sung giữ nguyên (không ảnh hưởng tính)
     if "RoutingNote" in df_preview.columns:
@@ -458,6 +507,29 @@ def render_quote_page():
     st.markdown(f"**📈 Top 10 best rates ranked by `{container_rank}` container**")
     st.dataframe(display_data, use_container_width=True)
 
+    cache_stats = QUOTE_CACHE.stats()
+    st.caption(
+        f"Quote cache: {cache_stats['hits']} hit / {cache_stats['misses']} miss "
+        f"({cache_stats['hit_rate']:.0%}) · {cache_stats['size']}/{cache_stats['maxsize']} entries"
+    )
+
+    # ========== 📊 RATE GRID (rate cube) ==========
+    with st.expander("📊 Rate Grid – Place × Carrier (giá gốc, chưa markup)", expanded=False):
+        grid_container = st.selectbox("Container", container_selected, key="grid_container")
+        cube = get_rate_cube(master_df, as_of=cargo_ready_date.isoformat(), reefer=fak_reefer, soc=soc)
+        grid = cube.grid(grid_container, pol=pol_selected, place=places_selected)
+        if grid.empty:
+            st.info("Không có giá cho lưới hiện tại.")
+        else:
+            st.dataframe(grid, use_container_width=True)
+            st.download_button(
+                "⬇️ Download grid (CSV)",
+                data=grid.to_csv().encode("utf-8-sig"),
+                file_name=f"RateGrid_{pol_selected}_{grid_container}.csv",
+                mime="text/csv",
+                key="grid_download",
+            )
+
     # ========== 📈 MARKUP SETTINGS ==========
     st.markdown("---")
     with st.expander("📈 Carrier Markup Settings (Optional)", expanded=False):
@@ -478,15 +550,15 @@ def render_quote_page():
         customer_name = st.text_input("Customer Name", "Demo Customer")
         email = st.text_input("Email", "")
     with colB:
-        cargo_ready_date = st.date_input("Cargo Ready Date", date.today())
+        customer_tier = st.text_input("Customer Tier (optional)", "")
 
     if st.button("Generate Quote", use_container_width=True):
         st.info("Đang tạo báo giá chính thức...")
         try:
             opts.markup_map = markup_map
-            cust = CustomerInfo(name=customer_name, email=email)
+            cust = CustomerInfo(name=customer_name, email=email, tier=customer_tier.strip() or None)
 
-            final_frames = []
+            final_reqs = []
             for place in places_selected:
                 shipment = ShipmentInfo(
                     pol=pol_selected,
@@ -498,13 +570,17 @@ def render_quote_page():
                 )
                 containers = [ContainerPlanItem(type=c, quantity=1) for c in container_selected]
 
-                req = QuoteRequest(
+                final_reqs.append(QuoteRequest(
                     customer=cust,
                     shipment=shipment,
                     containers=containers,
                     engine_options=opts,
-                )
-                result = generate_quote(master_df, req)
+                ))
+
+            final_results = cached_generate_quotes(master_df, final_reqs)
+            _show_place_match(places_selected, final_results)
+            final_frames = []
+            for place, result in zip(places_selected, final_results):
                 if "options" in result:
                     df_part = pd.DataFrame(result["options"])
                     if not df_part.empty:
@@ -530,18 +606,7 @@ def render_quote_page():
                 "TRANSIT TIME": df_result.apply(lambda r: _tt_compact(r.get("transit_min"), r.get("transit_max")), axis=1),
             })
 
-            valid_list_final = []
-            for _, r in df_result.iterrows():
-                key = {
-                    "pol": r.get("pol", ""),
-                    "pod": r.get("pod", ""),
-                    "place": r.get("place_of_delivery", ""),
-                    "carrier": r.get("carrier", ""),
-                }
-                eff = _map_from_master(master_df, key, "EffectiveDate")
-                exp = _map_from_master(master_df, key, "ExpirationDate")
-                valid_list_final.append(_fmt_valid(eff, exp))
-            df_display["VALID"] = valid_list_final
+            df_display["VALID"] = _valid_from_options(df_result)
 
             # Thêm Routing/Commodity như trước (nếu có)
             if "RoutingNote" in df_result.columns:
@@ -577,6 +642,17 @@ def render_quote_page():
             st.markdown("### 📦 Final Quotation Preview (Ranked)")
             st.dataframe(df_display, use_container_width=True)
 
+            # PDF render trong bộ nhớ, tải thẳng (không ghi Quotes_Client_PDF)
+            for place, result in zip(places_selected, final_results):
+                if result.get("options"):
+                    st.download_button(
+                        f"📄 Download PDF – {place}",
+                        data=render_quote_pdf(result),
+                        file_name=quote_pdf_filename(result),
+                        mime="application/pdf",
+                        key=f"quote_pdf_{place}",
+                    )
+
         except Exception as e:
             st.error(f"Lỗi khi tạo báo giá: {e}")
 
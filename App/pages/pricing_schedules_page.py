@@ -1,13 +1,88 @@
 import streamlit as st
+from datetime import datetime
+
+from common.sailing_table import n_pages
+from common.schedule_provider import get_schedule_provider
+
+
+PAGE_SIZES = (25, 50, 100, 200)
+
+
+def _filtered_positions(snap, filters: tuple):
+    """
+    Vị trí các sailing khớp filter, nhớ trong session theo (version Schedule,
+    filter) -> bấm đổi trang chỉ cắt lại trang, không lọc lại.
+    """
+    key = (snap.version, filters)
+    cached = st.session_state.get("sched_filter_cache")
+    if cached is None or cached[0] != key:
+        carriers, pol_tags, regions, week_from, week_to = filters
+        positions = snap.table.filter(carriers, pol_tags, regions, week_from, week_to)
+        cached = (key, positions)
+        st.session_state["sched_filter_cache"] = cached
+        # Filter đổi -> quay về trang 1
+        st.session_state["sched_page"] = 1
+    return cached[1]
+
 
 def render_schedules_page():
-    """Schedules placeholder."""
+    """Lịch tàu: filter carrier / POL / vùng POD / tuần, phân trang phía server."""
     st.markdown(
         "<div class='section-title'>Schedules – Lịch tàu / lịch giao nhận</div>",
         unsafe_allow_html=True,
     )
     st.markdown(
-        "<div class='section-sub'>Dùng để show lịch tàu theo carrier / tuyến, cut-off, ETD/ETA...</div>",
+        "<div class='section-sub'>Lịch tàu theo carrier / tuyến, ETD thực tế và ETA ước tính theo vùng POD.</div>",
         unsafe_allow_html=True,
     )
-    st.info("Tab này hiện để trống cho anh phát triển thêm sau.")
+
+    provider = get_schedule_provider()
+    try:
+        snap = provider.get()
+    except FileNotFoundError as e:
+        st.warning(str(e))
+        return
+    if provider.last_error:
+        st.warning(f"Đọc Schedule mới bị lỗi, đang dùng bản trước: {provider.last_error}")
+
+    table = snap.table
+    if len(table) == 0:
+        st.info("Schedule hiện tại không có sailing nào.")
+        return
+
+    # ---------- FILTER ----------
+    c1, c2, c3 = st.columns([2, 1, 1])
+    carriers = c1.multiselect("Carrier", table.carriers, key="sched_carriers")
+    pol_tags = c2.multiselect("POL tag", table.pol_tags, key="sched_pol_tags",
+                              help="ANY = service chạy mọi POL; HCM / HPH = service riêng cảng đó.")
+    regions = c3.multiselect("Vùng POD", table.regions, key="sched_regions")
+
+    if len(table.weeks) > 1:
+        week_from, week_to = st.select_slider(
+            "Tuần", options=table.weeks, value=(table.weeks[0], table.weeks[-1]), key="sched_weeks",
+        )
+    else:
+        week_from = week_to = table.weeks[0]
+
+    filters = (tuple(carriers), tuple(pol_tags), tuple(regions), week_from, week_to)
+    positions = _filtered_positions(snap, filters)
+
+    # ---------- PHÂN TRANG ----------
+    p1, p2, p3 = st.columns([1, 1, 3])
+    page_size = p1.selectbox("Số dòng / trang", PAGE_SIZES, index=1, key="sched_page_size")
+    pages = n_pages(len(positions), page_size)
+    if st.session_state.get("sched_page", 1) > pages:
+        st.session_state["sched_page"] = pages
+    page = int(p2.number_input("Trang", min_value=1, max_value=pages, step=1, key="sched_page"))
+    p3.caption(
+        f"{len(positions):,} / {len(table):,} sailing · trang {page}/{pages} · "
+        f"Schedule version {snap.version} "
+        f"(load {datetime.fromtimestamp(snap.loaded_at).strftime('%d-%m %H:%M')})"
+    )
+
+    if len(positions) == 0:
+        st.info("Không có sailing nào khớp filter.")
+        return
+
+    # Chỉ gửi đúng 1 trang xuống browser
+    st.dataframe(table.page(positions, page, page_size), use_container_width=True, hide_index=True)
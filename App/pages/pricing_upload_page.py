@@ -1,7 +1,9 @@
 import streamlit as st
 from pathlib import Path
 
-from common.helpers import DATA_DIR, RAW_DIR, MASTER_FILE, safe_rerun
+from common.helpers import RAW_DIR, MASTER_FILE, safe_rerun
+from common.master_provider import get_master_provider
+from common.quote_cache import QUOTE_CACHE
 from .normalize_pricing_work import normalize_all_from_streamlit
 
 
@@ -52,9 +54,11 @@ def render_upload_and_normalize():
                 ):
                     normalize_all_from_streamlit(
                         raw_dir_override=RAW_DIR,
-                        data_dir_override=DATA_DIR,
+                        data_dir_override=MASTER_FILE.parent,
                     )
                 st.session_state["pricing_version"] += 1
+                QUOTE_CACHE.invalidate()
+                get_master_provider(MASTER_FILE).refresh()
                 st.success("✅ Đã Normalize & cập nhật Master Pricing thành công.")
 
                 safe_rerun()
@@ -28,7 +28,7 @@ import plotly.graph_objects as go
 import plotly.io as pio
 import streamlit as st
 
-from common.data_loader import load_all_sheets
+from common.data_loader import load_all_sheets, shipment_data_version
 from common.kpi_calculator import compute_kpis as compute_kpis_external
 from common.plot_utils import (
     line_chart_volume_profit,
@@ -78,7 +78,8 @@ def configure_plotly_theme():
 # Data layer (cache)
 # =========================
 @st.cache_data(show_spinner=False)
-def load_data() -> pd.DataFrame:
+def load_data(version: str) -> pd.DataFrame:
+    # version chỉ làm key cache: dữ liệu shipment đổi (import / save) -> load lại
     data_sheets = load_all_sheets()
     return pd.concat(data_sheets.values(), ignore_index=True)
 
@@ -512,7 +513,7 @@ def render_dashboard_page():
     configure_plotly_theme()
 
     try:
-        df_all = load_data()
+        df_all = load_data(shipment_data_version())
     except Exception:
         df_all = generate_sample_data()
 
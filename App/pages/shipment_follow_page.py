@@ -20,6 +20,21 @@ def render_follow_shipment_page():
         horizontal=True
     )
 
+    # Kết quả các lần lưu trước (lưu chạy nền, xem common/shipment_writer.py)
+    tickets = st.session_state.setdefault("shipment_save_tickets", [])
+    for ticket in list(tickets):
+        result = sa.shipment_save_result(ticket)
+        if result is None:
+            continue
+        tickets.remove(ticket)
+        if result.error:
+            st.error(f"❌ Lưu {result.sheet} thất bại: {result.error}")
+        elif result.conflicts:
+            st.warning(
+                f"⚠️ {result.sheet}: {len(result.conflicts)} dòng đã bị người khác sửa / xoá trước, "
+                f"thay đổi của bạn trên các dòng này chưa được lưu: {result.conflicts}"
+            )
+
     df = sa.load_shipments(selected_month)
 
     KPI_VOLUME = 80
@@ -46,6 +61,7 @@ def render_follow_shipment_page():
     new_etd = st.date_input("📅 Chọn ngày ETD mới", value=datetime.today())
 
     if st.button("📤 Delay Selected"):
+        delayed = {}
         for idx in delay_options:
             current_etd = df.at[idx, "ETD"]
             if pd.isna(df.at[idx, "ETD_Original"]):
@@ -56,6 +72,15 @@ def render_follow_shipment_page():
             else:
                 df.at[idx, "Delay_Log"] += f" | {log}"
             df.at[idx, "ETD"] = pd.to_datetime(new_etd)
+            delayed[idx] = {col: df.at[idx, col] for col in ("ETD", "ETD_Original", "Delay_Log")}
+
+        # Chỉ gửi các dòng vừa delay (ghi nền)
+        base = df.attrs.get("row_versions", {})
+        tickets.append(sa.submit_shipment_changes(sa.ChangeSet(
+            sheet=selected_month,
+            edited=delayed,
+            base_versions={idx: base[idx] for idx in delayed if idx in base},
+        )))
 
     df = sa.calculate_all_columns(df)
 
@@ -86,8 +111,11 @@ def render_follow_shipment_page():
 
     df.sort_values(by=["Sort_Order", "ETD"], inplace=True)
 
-    edited_df = st.data_editor(
+    # Key đổi sau mỗi lần lưu -> editor mới, không áp lại thay đổi đã gửi lên dữ liệu mới
+    editor_key = f"shipment_editor_{selected_month}_{st.session_state.get('shipment_editor_nonce', 0)}"
+    st.data_editor(
         df,
+        key=editor_key,
         num_rows="dynamic",
         use_container_width=True,
         column_config={
@@ -108,8 +136,19 @@ def render_follow_shipment_page():
 
     with col_save:
         if st.button("💾 Save Data"):
-            sa.save_shipments(selected_month, edited_df)
-            st.success("✅ Đã lưu dữ liệu vào file thành công!")
+            # Chỉ lưu các dòng sửa / thêm / xoá; ghi store + workbook ở background
+            changes = sa.editor_change_set(
+                selected_month, df, st.session_state.get(editor_key, {}), author=user_name
+            )
+            if changes.empty:
+                st.info("Không có thay đổi nào để lưu.")
+            else:
+                tickets.append(sa.submit_shipment_changes(changes))
+                st.session_state["shipment_editor_nonce"] = st.session_state.get("shipment_editor_nonce", 0) + 1
+                st.success(
+                    f"✅ Đã ghi nhận {len(changes.edited)} dòng sửa, {len(changes.added)} dòng thêm, "
+                    f"{len(changes.deleted)} dòng xoá – đang lưu vào file."
+                )
 
     with col_weekly:
         if st.button("📅 Generate Weekly Report"):
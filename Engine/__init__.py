@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from pathlib import Path
 
 # === AUTO-RESOLVED PROJECT ROOT ===
@@ -18,24 +20,45 @@ COUNTER_FILE = DATA_DIR / "quote_counters.csv"
 
 LOGO_FILE = ASSETS_DIR / "logo_pudong.png"
 
-from __future__ import annotations
+# Engine dùng chung index Master với App (App/common)
+APP_DIR = BASE_DIR / "App"
 
 import os
 import re
+import sys
 from dataclasses import dataclass
 from datetime import date
 from typing import List, Dict, Any, Optional
 
+import numpy as np
 import pandas as pd
 
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+from common.master_index import get_master_index, top_n
+from common.models import ReeferRule, derive_reefer_columns
+from common.quote_counter import next_quote_counter
+from common.quote_log import get_quote_log
+from common.quote_trace import start_trace
+
 # ===================== CONFIG =====================
 
 BASE_DIR = r"C:\Users\Nelson\OneDrive\Desktop\2. Areas\PricingSystem"
 MASTER_FILE = os.path.join(BASE_DIR, "Master_FullPricing.xlsx")
-QUOTE_COUNTER_FILE = os.path.join(BASE_DIR, "quote_counters.csv")
+QUOTE_COUNTER_FILE = os.path.join(BASE_DIR, "quote_counters.csv")   # lịch sử cũ, chỉ để import
+QUOTE_COUNTER_DB = os.path.join(BASE_DIR, "quote_counters.db")
 
 # thư mục lưu log nội bộ
 LOG_DIR = os.path.join(BASE_DIR, "Quotes_Log")
+QUOTE_LOG_DB = os.path.join(LOG_DIR, "quote_log.db")
+
+# Đơn giá reefer: ô RF trống thì lấy lần lượt các cột dry tương ứng
+# (điền lúc load Master, và áp lại lúc quote cho Master nạp từ nguồn khác)
+ENGINE_REEFER_RULES = (
+    ReeferRule("20RF", ("20GP",), only_missing=True),
+    ReeferRule("40RF", ("40HQ", "40GP"), only_missing=True),
+)
 
 
 # ===================== DATA MODELS =====================
@@ -75,6 +98,7 @@ class EngineOptions:
     sort_by: str = "total_amount"
     include_premium_option: bool = False
     currency: str = "USD"
+    trace: bool = False   # True -> kết quả có thêm "trace" (xem common.quote_trace)
 
 
 @dataclass
@@ -98,7 +122,7 @@ def load_master(master_path: str = MASTER_FILE) -> pd.DataFrame:
 
     df = pd.read_excel(master_path, sheet_name="Master")
     df.columns = [str(c).strip() for c in df.columns]
-    return df
+    return derive_reefer_columns(df, ENGINE_REEFER_RULES)
 
 
 # ===================== CORE ENGINE =====================
@@ -109,7 +133,13 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
     - Filter Master theo POL, PlaceOfDelivery, POD (optional), Commodity, SOC, Carrier...
     - Tính tổng theo container plan
     - Nếu không chọn preferred carriers -> lấy TOP 5 carrier rẻ nhất (1 option/carrier)
+    - engine_options.trace = True -> kết quả có thêm "trace" (phễu lọc + thời gian từng bước)
     """
+    tr = start_trace("Engine", req.engine_options)
+    return tr.attach(_generate_quote(master_df, req, tr))
+
+
+def _generate_quote(master_df: pd.DataFrame, req: QuoteRequest, tr) -> Dict[str, Any]:
     shipment = req.shipment
     options_cfg = req.engine_options
 
@@ -125,60 +155,61 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
     if options_cfg.excluded_carriers is None:
         options_cfg.excluded_carriers = []
 
-    df = master_df.copy()
+    index = get_master_index(master_df)
 
     # ---- Lọc theo POL ----
-    pol_upper = shipment.pol.upper().strip()
-    df["POL_upper"] = df["POL"].astype(str).str.upper().str.strip()
-    df = df[df["POL_upper"] == pol_upper]
-    if df.empty:
+    rows = index.rows_for_pol(shipment.pol)
+    tr.stage("pol", index.n_rows, rows.size)
+    if rows.size == 0:
         return {
             "error": "NO_RATE_FOUND",
             "message": f"Không tìm thấy dòng giá nào với POL = {shipment.pol}.",
         }
 
-    # ---- Lọc theo PlaceOfDelivery (contains) ----
-    place_key = shipment.place_of_delivery.upper().strip()
-    df["Place_upper"] = df["PlaceOfDelivery"].astype(str).str.upper()
-    df = df[df["Place_upper"].str.contains(place_key, na=False)]
-    if df.empty:
+    # ---- Lọc theo PlaceOfDelivery (contains, không khớp thì gần đúng cùng bang) ----
+    n_in, rows_in = rows.size, rows
+    rows = index.filter_place(rows, shipment.place_of_delivery)
+    tr.stage("place", n_in, rows.size)
+    if rows.size == 0:
+        hint = index.place.suggestion_text(shipment.place_of_delivery, index.codes_at(index.place, rows_in))
         return {
             "error": "NO_RATE_FOUND",
-            "message": f"Không tìm thấy dòng giá nào có PlaceOfDelivery chứa: {shipment.place_of_delivery}.",
+            "message": f"Không tìm thấy dòng giá nào có PlaceOfDelivery chứa: {shipment.place_of_delivery}.{hint}",
         }
 
     # ---- Lọc theo POD (optional) ----
     if shipment.pod:
-        pod_key = shipment.pod.upper().strip()
-        df["POD_upper"] = df["POD"].astype(str).str.upper()
-        df = df[df["POD_upper"].str.contains(pod_key, na=False)]
-        if df.empty:
+        n_in, rows_in = rows.size, rows
+        rows = index.filter_pod(rows, shipment.pod)
+        tr.stage("pod", n_in, rows.size)
+        if rows.size == 0:
+            hint = index.pod.suggestion_text(shipment.pod, index.codes_at(index.pod, rows_in))
             return {
                 "error": "NO_RATE_FOUND",
-                "message": f"Không tìm thấy dòng giá nào PlaceOfDelivery='{shipment.place_of_delivery}' có POD chứa: {shipment.pod}.",
+                "message": f"Không tìm thấy dòng giá nào PlaceOfDelivery='{shipment.place_of_delivery}' có POD chứa: {shipment.pod}.{hint}",
             }
 
     # ---- Lọc theo CommodityType ----
+    n_in = rows.size
     commodity = shipment.commodity_type
     if commodity and commodity.upper() != "ANY":
-        df["Commodity_upper"] = df["CommodityType"].astype(str).str.upper()
-        com_up = commodity.upper()
+        com_up = commodity.upper().strip()
+        vocab = index.commodity
 
         if com_up == "FAK":
-            df = df[
-                df["Commodity_upper"].str.contains("FAK", na=False)
-                & ~df["Commodity_upper"].str.contains("REEFER", na=False)
-            ]
+            code_mask = vocab.codes_matching("fak", lambda v: "FAK" in v and "REEFER" not in v)
         elif com_up == "REEFER":
-            df = df[df["Commodity_upper"].str.contains("REEFER", na=False)]
+            code_mask = vocab.codes_matching("reefer", lambda v: "REEFER" in v)
         elif com_up == "FIX RATE":
-            df = df[df["Commodity_upper"].str.contains("FIX RATE", na=False)]
+            code_mask = vocab.codes_matching("fix_rate", lambda v: "FIX RATE" in v)
         elif com_up == "SHORT TERM GDSM":
-            df = df[df["Commodity_upper"].str.contains("SHORT TERM GDSM", na=False)]
+            code_mask = vocab.codes_matching("short_term_gdsm", lambda v: "SHORT TERM GDSM" in v)
         else:
-            df = df[df["Commodity_upper"] == com_up]
+            code_mask = vocab.values == com_up
+        rows = vocab.select(rows, code_mask)
 
-        if df.empty:
+        if rows.size == 0:
+            tr.stage("commodity_soc", n_in, 0)
             return {
                 "error": "NO_RATE_FOUND",
                 "message": f"Không có dòng giá nào với CommodityType = {commodity} khớp các filter còn lại.",
@@ -186,106 +217,80 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
 
     # ---- Lọc SOC: is_soc=True = loại SOC ----
     if shipment.is_soc:
-        df["Routing_upper"] = df["RoutingNote"].astype(str).str.upper()
-        df = df[~df["Routing_upper"].str.contains("SOC", na=False)]
-        if df.empty:
-            return {
-                "error": "NO_RATE_FOUND",
-                "message": "Không còn dòng giá nào sau khi loại SOC.",
-            }
+        rows = rows[~index.soc_routing[rows]]
+    tr.stage("commodity_soc", n_in, rows.size)
+    if rows.size == 0:
+        return {
+            "error": "NO_RATE_FOUND",
+            "message": "Không còn dòng giá nào sau khi loại SOC.",
+        }
 
     # ---- Lọc preferred / excluded carriers ----
-    df["Carrier_upper"] = df["Carrier"].astype(str).str.upper().str.strip()
-
+    n_in = rows.size
     if options_cfg.preferred_carriers:
-        pref = [c.upper().strip() for c in options_cfg.preferred_carriers]
-        df = df[df["Carrier_upper"].isin(pref)]
-        if df.empty:
+        rows = index.filter_carriers(rows, options_cfg.preferred_carriers)
+        if rows.size == 0:
             return {
                 "error": "NO_RATE_FOUND",
                 "message": f"Không có dòng giá nào thuộc các hãng: {options_cfg.preferred_carriers}.",
             }
 
     if options_cfg.excluded_carriers:
-        excl = [c.upper().strip() for c in options_cfg.excluded_carriers]
-        df = df[~df["Carrier_upper"].isin(excl)]
-        if df.empty:
+        rows = index.filter_carriers(rows, options_cfg.excluded_carriers, exclude=True)
+        if rows.size == 0:
             return {
                 "error": "NO_RATE_FOUND",
                 "message": "Tất cả các dòng giá đều thuộc các hãng bị exclude.",
             }
+    if options_cfg.preferred_carriers or options_cfg.excluded_carriers:
+        tr.stage("carrier", n_in, rows.size)
 
-    # ---- Hàm lấy đơn giá thực tế ----
-    def get_effective_rate(row: pd.Series, cont_type: str):
-        # Reefer mapping
-        if cont_type == "20RF":
-            for col in ["20RF", "20GP"]:
-                if col in row.index and not pd.isna(row[col]):
-                    return row[col]
-            return None
-        if cont_type == "40RF":
-            for col in ["40RF", "40HQ", "40GP"]:
-                if col in row.index and not pd.isna(row[col]):
-                    return row[col]
-            return None
-        return row.get(cont_type, None)
-
-    def has_all_rates(row: pd.Series) -> bool:
-        for item in req.containers:
-            rate = get_effective_rate(row, item.type)
-            if rate is None or pd.isna(rate):
-                return False
-        return True
+    # ---- Ma trận đơn giá thực tế (reefer fallback = coalesce cột) ----
+    rates = index.rate_matrix(rows, [item.type for item in req.containers], ENGINE_REEFER_RULES)
+    qty = np.array([item.quantity for item in req.containers], dtype=np.float64)
 
-    df_valid = df[df.apply(has_all_rates, axis=1)].copy()
-    if df_valid.empty:
+    has_all_rates = ~np.isnan(rates).any(axis=1)
+    n_valid = int(has_all_rates.sum())
+    tr.stage("rate_availability", rows.size, n_valid)
+    if n_valid == 0:
         return {
             "error": "NO_VALID_RATE_FOR_PLAN",
             "message": "Không có dòng giá nào có đủ giá cho tất cả loại container trong plan.",
         }
 
     # ---- Tính tổng ----
-    def compute_total(row: pd.Series) -> float:
-        total = 0.0
-        for item in req.containers:
-            rate = get_effective_rate(row, item.type)
-            if rate is None or pd.isna(rate):
-                return float("inf")
-            total += float(rate) * item.quantity
-        return total
-
-    df_valid["TotalAmount"] = df_valid.apply(compute_total, axis=1)
+    totals = np.where(has_all_rates, rates @ qty, np.inf)
+    tr.stage("costing", n_valid, n_valid)
 
     # ---- Chọn options ----
     if not options_cfg.preferred_carriers:
-        df_valid_sorted = df_valid.sort_values(by="TotalAmount", ascending=True)
-        idx_min = df_valid_sorted.groupby("Carrier_upper")["TotalAmount"].idxmin()
-        df_per_carrier = df_valid.loc[idx_min].copy()
-        df_sorted = df_per_carrier.sort_values(by="TotalAmount", ascending=True)
-        df_top = df_sorted.head(5).reset_index(drop=True)
+        best = index.cheapest_per_carrier(rows, totals)
+        top = best[top_n(totals[best], 5)]
     else:
-        df_sorted = df_valid.sort_values(by="TotalAmount", ascending=True)
         max_n = max(1, options_cfg.max_options_per_quote)
-        df_top = df_sorted.head(max_n).reset_index(drop=True)
+        valid_pos = np.flatnonzero(has_all_rates)
+        top = valid_pos[top_n(totals[valid_pos], max_n)]
+    tr.stage("ranking", n_valid, top.size)
 
-    if df_top.empty:
+    if top.size == 0:
         return {
             "error": "NO_RATE_FOUND",
             "message": "Không có option nào sau khi chọn TOP.",
         }
 
+    df_top = master_df.iloc[rows[top]]
+
     # ---- Build output JSON ----
     containers_summary = ", ".join(
         f"{item.quantity} x {item.type}" for item in req.containers
     )
 
     options_out = []
-    for option_index, (_, row) in enumerate(df_top.iterrows(), start=1):
+    for option_index, (pos, (_, row)) in enumerate(zip(top, df_top.iterrows()), start=1):
         # container_rates
-        container_rates: Dict[str, float] = {}
-        for item in req.containers:
-            rate = get_effective_rate(row, item.type)
-            container_rates[item.type] = float(rate)
+        container_rates: Dict[str, float] = {
+            item.type: float(rates[pos, j]) for j, item in enumerate(req.containers)
+        }
 
         # breakdown
         container_plan = []
@@ -315,11 +320,12 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
             "commodity_type": None
             if pd.isna(row.get("CommodityType", None))
             else str(row.get("CommodityType", "")),
+            "source_row": int(rows[pos]),
             "valid_from": str(row.get("EffectiveDate", "")),
             "valid_to": str(row.get("ExpirationDate", "")),
             "container_rates": container_rates,
             "container_plan": container_plan,
-            "total_ocean_amount": float(row["TotalAmount"]),
+            "total_ocean_amount": float(totals[pos]),
             "currency": options_cfg.currency,
             "notes": build_notes(row),
         }
@@ -341,6 +347,7 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
         "pol": shipment.pol,
         "pod": shipment.pod,
         "place_of_delivery": shipment.place_of_delivery,
+        "place_match": index.place.lookup_mode(shipment.place_of_delivery),   # exact | fuzzy
 
         # Kế hoạch container
         "containers_summary": containers_summary,
@@ -354,10 +361,11 @@ def generate_quote(master_df: pd.DataFrame, req: QuoteRequest) -> Dict[str, Any]
     }
 
     debug_info = {
-        "rows_after_filters": int(len(df)),
-        "rows_with_full_rates": int(len(df_valid)),
+        "rows_after_filters": int(rows.size),
+        "rows_with_full_rates": n_valid,
         "rows_returned": int(len(df_top)),
     }
+    tr.stage("build_result", len(options_out), len(options_out))
 
     return {
         "quote_ref_no": quote_ref_no,
@@ -393,39 +401,13 @@ def build_quote_ref(req: QuoteRequest) -> str:
     today = date.today()
     date_code = today.strftime("%d%b").upper()  # 27NOV
 
-    # Load file counter nếu có
-    if os.path.exists(QUOTE_COUNTER_FILE):
-        df_ct = pd.read_csv(
-            QUOTE_COUNTER_FILE,
-            dtype={"CustomerKey": str, "DateCode": str, "Counter": int},
-        )
-    else:
-        df_ct = pd.DataFrame(columns=["CustomerKey", "DateCode", "Counter"])
-
-    mask = (df_ct["CustomerKey"] == customer_key) & (df_ct["DateCode"] == date_code)
-    if mask.any():
-        current = int(df_ct.loc[mask, "Counter"].iloc[0])
-        new_counter = current + 1
-        df_ct.loc[mask, "Counter"] = new_counter
-    else:
-        new_counter = 1
-        df_ct = pd.concat(
-            [
-                df_ct,
-                pd.DataFrame(
-                    [
-                        {
-                            "CustomerKey": customer_key,
-                            "DateCode": date_code,
-                            "Counter": new_counter,
-                        }
-                    ]
-                ),
-            ],
-            ignore_index=True,
-        )
-
-    df_ct.to_csv(QUOTE_COUNTER_FILE, index=False)
+    # Cấp số atomic trong SQLite (WAL); lần đầu tự import quote_counters.csv cũ
+    new_counter = next_quote_counter(
+        customer_key,
+        date_code,
+        db_path=QUOTE_COUNTER_DB,
+        legacy_csv=QUOTE_COUNTER_FILE,
+    )
     return f"{customer_key}-{date_code}-{new_counter}"
 
 
@@ -562,33 +544,42 @@ def quote_result_to_dfs(result: Dict[str, Any]):
 def save_quote_internal(result: Dict[str, Any]) -> str:
     """
     Lưu log nội bộ mỗi lần generate (SUMMARY + OPTIONS + DETAILS).
+    Chỉ đưa vào hàng đợi của quote log (SQLite), thread nền sẽ ghi theo batch.
+    Cần file Excel thì gọi export_quote_internal().
     """
-    os.makedirs(LOG_DIR, exist_ok=True)
-
-    summary = result["summary"]
-    quote_ref = result["quote_ref_no"]
-    customer = summary["customer_name"]
-    safe_customer = "".join(
-        c for c in customer if c.isalnum() or c in " _-"
-    ).strip()
-
-    filename = f"{quote_ref} - {safe_customer}.xlsx"
-    filepath = os.path.join(LOG_DIR, filename)
-
     df_summary, df_options, df_plan = quote_result_to_dfs(result)
+    log = get_quote_log(QUOTE_LOG_DB)
+    log.append(
+        df_summary.to_dict("records")[0],
+        df_options.to_dict("records"),
+        df_plan.to_dict("records"),
+    )
+    return str(log.db_path)
 
-    with pd.ExcelWriter(filepath, engine="xlsxwriter") as writer:
-        df_summary.to_excel(writer, sheet_name="SUMMARY", index=False)
-        df_options.to_excel(writer, sheet_name="OPTIONS", index=False)
-        df_plan.to_excel(writer, sheet_name="DETAILS", index=False)
 
-        wb = writer.book
-        ws = writer.sheets["SUMMARY"]
-        fmt_bold = wb.add_format({"bold": True})
-        ws.set_column("A:A", 18, fmt_bold)
-        ws.set_column("B:Z", 30)
+def export_quote_internal(
+    quote_ref: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> str:
+    """
+    Dựng lại file log Excel (layout cũ) từ quote log:
+    - 1 quote:   Quotes_Log/<REF> - <Customer>.xlsx
+    - khoảng ngày: Quotes_Log/QUOTES <from> - <to>.xlsx
+    """
+    log = get_quote_log(QUOTE_LOG_DB)
+    if quote_ref:
+        df_summary, _, _ = log.read_quotes(quote_ref=quote_ref)
+        customer = df_summary["Customer"].iloc[0] if not df_summary.empty else ""
+        safe_customer = "".join(
+            c for c in str(customer) if c.isalnum() or c in " _-"
+        ).strip()
+        filename = f"{quote_ref} - {safe_customer}.xlsx"
+    else:
+        filename = f"QUOTES {date_from or 'ALL'} - {date_to or 'ALL'}.xlsx"
 
-    return filepath
+    filepath = os.path.join(LOG_DIR, filename)
+    return log.export_excel(filepath, quote_ref=quote_ref, date_from=date_from, date_to=date_to)
 
 
 # ===================== DEMO (optional) =====================
@@ -0,0 +1,555 @@
+# ==================== BENCHMARK.PY ====================
+"""
+Đo latency quote engine.
+
+1. synthesize_master(n_rows): Master giả (10k / 100k / 1M dòng) với số
+   POL / Place / POD / Carrier / CommodityType gần giống Master thật.
+2. generate_workload() hoặc load_workload(): danh sách request dạng dict
+   (sinh ngẫu nhiên, file .jsonl, hoặc replay quote_log.db thật), rồi chạy
+   lần lượt qua Engine.generate_quote và common.cost_engine.generate_quote.
+3. Báo cáo p50 / p95 / p99, throughput, bộ nhớ cấp phát mỗi request
+   (tracemalloc, đo ở lượt chạy riêng để không làm lệch latency).
+4. --schedule: synthesize_schedule() = Schedule.xlsx giả 52 tuần cho mọi
+   carrier, đo thời gian build_schedule_index (schedule_index_from_frame),
+   build sailing index và latency tra next_sailing.
+
+Chạy từ thư mục gốc:
+    python -m Engine.benchmark --rows 10000 100000 1000000 --requests 2000
+    python -m Engine.benchmark --master Data/Master_FullPricing.xlsx --workload Output/Quotes_Log/quote_log.db
+    python -m Engine.benchmark --rows 100000 --json before.json
+    python -m Engine.benchmark --schedule --weeks 52
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import Engine as engine
+from common import cost_engine
+from common import models as app_models
+from common.master_index import get_master_index
+from common.schedule_engine import _pod_candidates, sailing_index_from_frame, schedule_index_from_frame
+
+
+# ================= MASTER GIẢ =================
+
+POLS = {"HPH": 0.31, "HCM": 0.28, "DAD": 0.19, "UIH": 0.16, "VUT": 0.06}
+
+CARRIERS = {
+    "ONE": 1142, "COSCO": 639, "CMA": 497, "HPL": 343, "YML": 309, "MSC": 308,
+    "EMC": 301, "ZIM": 210, "WHL": 94, "UWL": 8, "SEALEAD": 5, "KMTC": 2,
+}
+
+COMMODITIES = {
+    "FAK": 782, "FAK: TPE1 - FAK Straight": 621, "FIX RATE": 326, "FAK (Including Garment)": 316,
+    "RATE 1": 301, "GARMENT": 280, "FAK including garment": 204, "SHORT TERM GDSM": 161,
+    "FAK INCLUDING GARMENT": 101, "REEFER": 60, "GROUP A": 51, "REEFER FAK": 34,
+}
+
+BASE_PODS = [
+    "USLAX", "USLGB", "USLAX/LGB", "USOAK", "USSEA", "USTIW", "USNYC", "USORF", "USSAV",
+    "USCHS", "USHOU", "USMIA", "USJAX", "USBAL", "USBOS", "USMSY", "CAVAN", "CAPRR",
+    "CAHAL", "CAMTL",
+]
+
+BASE_PLACES = [
+    "LOS ANGELES, CA", "LONG BEACH, CA", "CHICAGO, IL", "NEW YORK, NY", "SAVANNAH, GA",
+    "HOUSTON, TX", "DALLAS, TX", "ATLANTA, GA", "MEMPHIS, TN", "COLUMBUS, OH",
+    "DETROIT, MI", "CINCINNATI, OH", "INDIANAPOLIS, IN", "LOUISVILLE, KY", "KANSAS CITY, MO",
+    "MINNEAPOLIS, MN", "DENVER, CO", "SALT LAKE CITY, UT", "SEATTLE, WA", "TACOMA, WA",
+    "OAKLAND, CA", "MIAMI, FL", "CHARLESTON, SC", "NORFOLK, VA", "BALTIMORE, MD",
+    "TORONTO, ON", "MONTREAL, QC", "VANCOUVER, BC", "CALGARY, AB", "WINNIPEG, MB",
+]
+
+# (mean, std, tỉ lệ ô trống) theo Master thật
+RATE_PROFILE = {
+    "20GP": (3715, 1159, 0.03),
+    "40GP": (4439, 1210, 0.02),
+    "40HQ": (4439, 1205, 0.01),
+    "45HQ": (5485, 1460, 0.41),
+    "40NOR": (2951, 828, 0.94),
+}
+
+# Kỳ giá theo quý; cargo ready date rơi vào 1 quý -> ~1/4 Master còn hiệu lực
+PERIODS = [
+    ("2026-01-01", "2026-03-31"),
+    ("2026-04-01", "2026-06-30"),
+    ("2026-07-01", "2026-09-30"),
+    ("2026-10-01", "2026-12-31"),
+]
+
+
+def _weights(values: Dict[str, float]) -> np.ndarray:
+    w = np.array(list(values.values()), dtype=np.float64)
+    return w / w.sum()
+
+
+def _names(base: List[str], n: int, fmt: str) -> np.ndarray:
+    extra = [fmt.format(i) for i in range(max(0, n - len(base)))]
+    return np.array((base + extra)[:n], dtype=object)
+
+
+def synthesize_master(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Master giả n_rows dòng, cùng cột với sheet 'Master'.
+    Place / POD tăng theo số dòng (Master thật ~50 dòng / Place) nhưng có trần;
+    độ phổ biến Place theo phân phối Zipf. Dòng REEFER có sẵn giá 20RF / 40RF.
+    """
+    rng = np.random.default_rng(seed)
+    n_places = int(min(3000, max(80, n_rows // 50)))
+    n_pods = int(min(400, max(45, n_rows // 2000)))
+
+    places = _names(BASE_PLACES, n_places, "INLAND POINT {:04d}, US")
+    pods = _names(BASE_PODS, n_pods, "USP{:03d}")
+    place_w = 1.0 / np.arange(1, n_places + 1) ** 0.8
+    place_w /= place_w.sum()
+
+    commodity = rng.choice(np.array(list(COMMODITIES), dtype=object), n_rows, p=_weights(COMMODITIES))
+    period = rng.integers(0, len(PERIODS), n_rows)
+
+    df = pd.DataFrame({
+        "POL": rng.choice(np.array(list(POLS), dtype=object), n_rows, p=_weights(POLS)),
+        "POD": pods[rng.integers(0, n_pods, n_rows)],
+        "PlaceOfDelivery": places[rng.choice(n_places, n_rows, p=place_w)],
+        "RoutingNote": np.where(rng.random(n_rows) < 0.2, "VIA RAIL", None),
+        "Carrier": rng.choice(np.array(list(CARRIERS), dtype=object), n_rows, p=_weights(CARRIERS)),
+        "EffectiveDate": np.array([p[0] for p in PERIODS], dtype=object)[period],
+        "ExpirationDate": np.array([p[1] for p in PERIODS], dtype=object)[period],
+        "ContractIdentifier": np.char.add("SEN", rng.integers(10000, 99999, n_rows).astype(str)).astype(object),
+        "CommodityType": commodity,
+        "RateType": "FAK",
+    })
+    for col, (mean, std, empty) in RATE_PROFILE.items():
+        rate = np.maximum(100.0, np.round(rng.normal(mean, std, n_rows)))
+        df[col] = np.where(rng.random(n_rows) < empty, np.nan, rate)
+
+    reefer = np.char.find(commodity.astype(str), "REEFER") >= 0
+    df["20RF"] = np.where(reefer, np.round(df["20GP"].to_numpy() * 1.6), np.nan)
+    df["40RF"] = np.where(reefer, np.round(df["40HQ"].to_numpy() * 1.5), np.nan)
+    return df
+
+
+# ================= WORKLOAD =================
+
+CONTAINER_MIX = [
+    (["40HQ"], 0.35),
+    (["20GP", "40HQ"], 0.25),
+    (["20GP"], 0.15),
+    (["40GP", "40HQ"], 0.15),
+    (["45HQ"], 0.10),
+]
+
+# Filter commodity của request theo họ commodity của lane được chọn
+COMMODITY_FAMILIES = ("REEFER", "FIX RATE", "SHORT TERM GDSM", "FAK", "GARMENT")
+
+
+def _commodity_family(value: str) -> str:
+    v = str(value or "").upper()
+    return next((f for f in COMMODITY_FAMILIES if f in v), "ANY")
+
+
+def generate_workload(master_df: pd.DataFrame, n: int, seed: int = 1, miss_rate: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    n request lấy lane từ chính Master (để phần lớn có giá): commodity theo
+    lane (một nửa để ANY), trộn container, SOC, preferred / excluded carrier;
+    ~miss_rate request cố ý không có giá.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(master_df), n)
+    lanes = master_df.iloc[picks][["POL", "POD", "PlaceOfDelivery", "CommodityType"]].to_dict("records")
+    carriers = sorted(master_df["Carrier"].dropna().astype(str).unique())
+    days = pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+
+    specs = []
+    for i, lane in enumerate(lanes):
+        family = _commodity_family(lane["CommodityType"])
+        commodity = family if family == "REEFER" or rng.random() < 0.5 else "ANY"
+        if commodity == "REEFER":
+            types = ["20RF", "40RF"][: int(rng.integers(1, 3))]
+        else:
+            types = CONTAINER_MIX[rng.choice(len(CONTAINER_MIX), p=[w for _, w in CONTAINER_MIX])][0]
+
+        place = str(lane["PlaceOfDelivery"])
+        if rng.random() < 0.5:
+            place = place.split(",")[0]   # sales hay chỉ gõ tên thành phố
+        if rng.random() < miss_rate:
+            place = f"NOWHERE {i}"
+
+        spec = {
+            "customer": f"BENCH {i % 50}",
+            "pol": str(lane["POL"]).strip(),
+            "pod": str(lane["POD"]) if rng.random() < 0.2 else None,
+            "place_of_delivery": place,
+            "cargo_ready_date": days[i].date().isoformat(),
+            "commodity_type": commodity,
+            "is_soc": bool(rng.random() < 0.1),
+            "containers": [{"type": t, "quantity": int(rng.integers(1, 6))} for t in types],
+            "preferred_carriers": list(rng.choice(carriers, 2, replace=False)) if rng.random() < 0.1 else None,
+            "excluded_carriers": list(rng.choice(carriers, 1)) if rng.random() < 0.1 else None,
+            "markup": {"ONE": 50.0},
+            "max_options": 5,
+        }
+        specs.append(spec)
+    return specs
+
+
+def _parse_containers(text: str) -> List[Dict[str, Any]]:
+    """'2 x 40HQ, 1 x 20GP' -> [{'type': '40HQ', 'quantity': 2}, ...]"""
+    out = []
+    for qty, ctype in re.findall(r"(\d+)\s*x\s*([0-9A-Z]+)", str(text or "").upper()):
+        out.append({"type": ctype, "quantity": int(qty)})
+    return out
+
+
+def load_workload(path: str) -> List[Dict[str, Any]]:
+    """
+    Workload ghi lại: file .jsonl (mỗi dòng 1 spec như generate_workload)
+    hoặc quote_log.db (replay bảng quote_summary, ngày quote làm cargo ready date).
+    """
+    if path.lower().endswith(".db"):
+        with sqlite3.connect(path) as conn:
+            df = pd.read_sql_query(
+                'SELECT "Customer", "POL", "POD", "PlaceOfDelivery", "Containers", "Commodity", "SOC", "QuoteDate" '
+                'FROM quote_summary ORDER BY "LoggedAt"',
+                conn,
+            )
+        specs = []
+        for r in df.to_dict("records"):
+            containers = _parse_containers(r["Containers"])
+            if not containers or not r["PlaceOfDelivery"]:
+                continue
+            specs.append({
+                "customer": r["Customer"] or "REPLAY",
+                "pol": r["POL"],
+                "pod": r["POD"] or None,
+                "place_of_delivery": r["PlaceOfDelivery"],
+                "cargo_ready_date": str(r["QuoteDate"])[:10],
+                "commodity_type": r["Commodity"] or "ANY",
+                "is_soc": str(r["SOC"]).strip().upper() in ("1", "TRUE", "YES"),
+                "containers": containers,
+            })
+        return specs
+
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_workload(specs: List[Dict[str, Any]], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for spec in specs:
+            f.write(json.dumps(spec, ensure_ascii=False) + "\n")
+
+
+def to_engine_request(spec: Dict[str, Any]) -> engine.QuoteRequest:
+    return engine.QuoteRequest(
+        customer=engine.CustomerInfo(name=spec["customer"]),
+        shipment=engine.ShipmentInfo(
+            pol=spec["pol"],
+            pod=spec.get("pod"),
+            place_of_delivery=spec["place_of_delivery"],
+            cargo_ready_date=spec.get("cargo_ready_date"),
+            commodity_type=spec.get("commodity_type", "ANY"),
+            is_soc=bool(spec.get("is_soc")),
+        ),
+        containers=[engine.ContainerPlanItem(c["type"], int(c["quantity"])) for c in spec["containers"]],
+        engine_options=engine.EngineOptions(
+            preferred_carriers=spec.get("preferred_carriers"),
+            excluded_carriers=spec.get("excluded_carriers"),
+            max_options_per_quote=spec.get("max_options", 5),
+        ),
+    )
+
+
+def to_app_request(spec: Dict[str, Any]) -> app_models.QuoteRequest:
+    opts = app_models.EngineOptions(
+        preferred_carriers=spec.get("preferred_carriers"),
+        excluded_carriers=spec.get("excluded_carriers"),
+        max_options_per_quote=spec.get("max_options", 5),
+    )
+    opts.markup_map = dict(spec.get("markup") or {})
+    return app_models.QuoteRequest(
+        customer=app_models.CustomerInfo(name=spec["customer"]),
+        shipment=app_models.ShipmentInfo(
+            pol=spec["pol"],
+            pod=spec.get("pod"),
+            place_of_delivery=spec["place_of_delivery"],
+            cargo_ready_date=spec.get("cargo_ready_date"),
+            commodity_type=spec.get("commodity_type", "ANY"),
+            is_soc=bool(spec.get("is_soc")),
+        ),
+        containers=[app_models.ContainerPlanItem(c["type"], int(c["quantity"])) for c in spec["containers"]],
+        engine_options=opts,
+    )
+
+
+ENGINES: Dict[str, tuple] = {
+    "Engine": (engine.generate_quote, to_engine_request),
+    "cost_engine": (cost_engine.generate_quote, to_app_request),
+}
+
+# --master: mỗi engine đọc Master thật bằng hàm load của chính nó
+# (rule reefer của Engine khác của app)
+MASTER_LOADERS: Dict[str, Callable[[str], pd.DataFrame]] = {
+    "Engine": engine.load_master,
+    "cost_engine": app_models.load_master,
+}
+
+
+# ================= SCHEDULE GIẢ =================
+
+# Nhóm khai thác chung service (cột GROUP của Schedule.xlsx), phủ mọi carrier của Master
+CARRIER_GROUPS = ["ONE/YML/HMM", "COSCO/CMA/EMC", "MSC/HPL", "ZIM/WHL", "UWL/SEALEAD/KMTC"]
+
+SCHEDULE_PORTS = ["USLAX", "USLGB", "USOAK", "USTIW", "USSEA", "CAVAN", "CATIW", "CAPRR",
+                  "USNYC", "USSAV", "USCHS", "USORF", "USJAX", "USBAL", "USHOU", "USMOB", "CAHAL"]
+
+
+def synthesize_schedule(weeks: int = 52, services_per_group: int = 12, seed: int = 0) -> pd.DataFrame:
+    """
+    Schedule.xlsx giả: mỗi nhóm carrier `services_per_group` service, mỗi
+    service 1-2 dòng (ANY hoặc HCM + HPH, khác ngày chạy), 2-4 POD / dòng,
+    `weeks` cột tuần bắt đầu từ W01 2026; ~8% ô là BLANK SAILING.
+    """
+    rng = np.random.default_rng(seed)
+    days = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+    monday = pd.Timestamp("2025-12-29")    # thứ 2 của ISO week 1 / 2026
+
+    rows = []
+    for group in CARRIER_GROUPS:
+        for k in range(services_per_group):
+            name = f"{group[:2]}{k + 1}"
+            pods = "; ".join(rng.choice(SCHEDULE_PORTS, int(rng.integers(2, 5)), replace=False))
+            tags = [""] if rng.random() < 0.5 else [" (HCM)", " (HPH)"]
+            for tag in tags:
+                rows.append({"GROUP": group, "SERVICE": f"{name}{tag} ({rng.choice(days)})", "POD": pods})
+    df = pd.DataFrame(rows)
+
+    vessels = np.array([f"VESSEL {i:03d}" for i in range(400)], dtype=object)
+    for w in range(weeks):
+        start = monday + pd.Timedelta(weeks=w)
+        end = start + pd.Timedelta(days=6)
+        label = f"W{start.isocalendar().week:02d} ({start:%d %b} - {end:%d %b})".upper()
+        col = np.char.add(vessels[rng.integers(0, len(vessels), len(df))].astype(str), f" {w:03d}E").astype(object)
+        col[rng.random(len(df)) < 0.08] = "BLANK SAILING"
+        df[label] = col
+    return df
+
+
+def benchmark_schedule(weeks: int, services_per_group: int, repeat: int = 5, seed: int = 0) -> Dict[str, Any]:
+    raw = synthesize_schedule(weeks, services_per_group, seed)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        idx = schedule_index_from_frame(raw)
+        times.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    sailings = sailing_index_from_frame(raw, published=pd.Timestamp("2026-01-01").date())
+    sailing_ms = (time.perf_counter() - t0) * 1000
+
+    # Tra next_sailing: carrier / POD / POL / cargo date ngẫu nhiên trong năm
+    rng = np.random.default_rng(seed + 1)
+    carriers = sorted({c for g in CARRIER_GROUPS for c in g.split("/")})
+    n = 20_000
+    lookups = list(zip(
+        rng.choice(carriers, n).tolist(),
+        rng.choice(SCHEDULE_PORTS, n).tolist(),
+        rng.choice(["HCM", "HPH"], n).tolist(),
+        (pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 7 * weeks, n), unit="D")).date,
+    ))
+    t0 = time.perf_counter()
+    hits = sum(
+        sailings.next_sailing(c, _pod_candidates(p), ("ANY", pol), d) is not None for c, p, pol, d in lookups
+    )
+    lookup_us = (time.perf_counter() - t0) * 1e6 / n
+    return {
+        "schedule_rows": len(raw),
+        "weeks": weeks,
+        "index_rows": len(idx),
+        "build_ms_min": float(np.min(times)),
+        "build_ms_median": float(np.median(times)),
+        "sailing_index_ms": sailing_ms,
+        "lookup_us": lookup_us,
+        "lookup_hit_rate": hits / n,
+    }
+
+
+# ================= ĐO =================
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values.size else (np.nan,) * 3
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def run_engine(
+    name: str,
+    quote: Callable[[pd.DataFrame, Any], Dict[str, Any]],
+    master_df: pd.DataFrame,
+    requests: List[Any],
+    traced: List[Any],
+    warmup: int = 20,
+) -> Dict[str, Any]:
+    """
+    Lượt 1: latency từng request (perf_counter, không tracemalloc).
+    Lượt 2: trên `traced` (request dựng riêng), bộ nhớ cấp phát đỉnh và
+    còn giữ lại của mỗi request.
+    """
+    for req in requests[:warmup]:
+        quote(master_df, req)
+
+    lat = np.empty(len(requests))
+    errors = 0
+    start = time.perf_counter()
+    for i, req in enumerate(requests):
+        t0 = time.perf_counter()
+        result = quote(master_df, req)
+        lat[i] = (time.perf_counter() - t0) * 1000
+        errors += "error" in result
+    wall = time.perf_counter() - start
+
+    peaks, kept = [], []
+    tracemalloc.start()
+    try:
+        for req in traced:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            result = quote(master_df, req)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            kept.append(current - before)
+            del result
+    finally:
+        tracemalloc.stop()
+
+    out = {
+        "engine": name,
+        "requests": len(requests),
+        "no_rate": int(errors),
+        "throughput_rps": len(requests) / wall if wall else float("nan"),
+        "mean_ms": float(lat.mean()) if lat.size else float("nan"),
+    }
+    out.update(_percentiles(lat))
+    out["alloc_peak_kb"] = float(np.mean(peaks)) / 1024 if peaks else float("nan")
+    out["alloc_kept_kb"] = float(np.mean(kept)) / 1024 if kept else float("nan")
+    return out
+
+
+def benchmark_master(
+    master_df: pd.DataFrame,
+    specs: List[Dict[str, Any]],
+    engines: List[str],
+    label: str,
+    alloc_sample: int = 200,
+) -> List[Dict[str, Any]]:
+    t0 = time.perf_counter()
+    get_master_index(master_df)
+    index_ms = (time.perf_counter() - t0) * 1000
+
+    rows = []
+    for name in engines:
+        quote, build = ENGINES[name]
+        requests = [build(s) for s in specs]
+        traced = [build(s) for s in specs[:alloc_sample]]
+        res = run_engine(name, quote, master_df, requests, traced)
+        res.update({"master": label, "master_rows": len(master_df), "index_build_ms": index_ms})
+        rows.append(res)
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    cols = [
+        ("master", "{}"), ("master_rows", "{:,}"), ("engine", "{}"), ("requests", "{:,}"),
+        ("no_rate", "{:,}"), ("p50_ms", "{:.3f}"), ("p95_ms", "{:.3f}"), ("p99_ms", "{:.3f}"),
+        ("throughput_rps", "{:,.0f}"), ("alloc_peak_kb", "{:,.1f}"), ("alloc_kept_kb", "{:,.1f}"),
+        ("index_build_ms", "{:,.0f}"),
+    ]
+    table = [[name for name, _ in cols]] + [[fmt.format(r[name]) for name, fmt in cols] for r in rows]
+    widths = [max(len(line[j]) for line in table) for j in range(len(cols))]
+    for k, line in enumerate(table):
+        print("  ".join(v.rjust(w) for v, w in zip(line, widths)))
+        if k == 0:
+            print("  ".join("-" * w for w in widths))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark latency quote engine (Engine + common.cost_engine).")
+    ap.add_argument("--rows", type=int, nargs="*", default=[10_000, 100_000],
+                    help="Kích thước Master giả (mặc định 10000 100000; thêm 1000000 khi cần)")
+    ap.add_argument("--master", help="Dùng Master thật (xlsx) thay cho Master giả")
+    ap.add_argument("--requests", type=int, default=1000, help="Số request sinh ngẫu nhiên / Master")
+    ap.add_argument("--workload", help="Replay workload ghi lại (.jsonl hoặc quote_log.db)")
+    ap.add_argument("--save-workload", help="Ghi workload sinh ra ra file .jsonl")
+    ap.add_argument("--engine", choices=sorted(ENGINES), action="append", help="Chỉ chạy engine này")
+    ap.add_argument("--alloc-sample", type=int, default=200, help="Số request đo tracemalloc")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="Ghi kết quả ra file JSON (so sánh trước / sau)")
+    ap.add_argument("--schedule", action="store_true", help="Chỉ đo build schedule index trên Schedule giả")
+    ap.add_argument("--weeks", type=int, default=52, help="Số cột tuần của Schedule giả")
+    ap.add_argument("--services", type=int, default=12, help="Số service / nhóm carrier của Schedule giả")
+    args = ap.parse_args(argv)
+
+    if args.schedule:
+        res = benchmark_schedule(args.weeks, args.services, seed=args.seed)
+        print("  ".join(f"{k}={v:,.1f}" if isinstance(v, float) else f"{k}={v:,}" for k, v in res.items()))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(res, f, indent=2)
+        return 0
+
+    engines = args.engine or list(ENGINES)
+
+    # Engine.generate_quote cấp số REF -> trỏ bộ đếm sang DB tạm, không đụng số thật
+    tmp = tempfile.TemporaryDirectory()
+    engine.QUOTE_COUNTER_DB = os.path.join(tmp.name, "quote_counters.db")
+    engine.QUOTE_COUNTER_FILE = None
+
+    masters = []  # (label, engines, make)
+    if args.master:
+        label = os.path.basename(args.master)
+        for name in engines:
+            masters.append((label, [name], lambda name=name: MASTER_LOADERS[name](args.master)))
+    else:
+        for n in args.rows:
+            masters.append((f"synthetic-{n}", engines, lambda n=n: synthesize_master(n, seed=args.seed)))
+
+    recorded = load_workload(args.workload) if args.workload else None
+    workloads: Dict[str, List[Dict[str, Any]]] = {}  # label -> workload sinh ra (dùng chung các engine)
+    rows: List[Dict[str, Any]] = []
+    try:
+        for label, names, make in masters:
+            t0 = time.perf_counter()
+            master_df = make()
+            print(f"[{label} / {', '.join(names)}] Master {len(master_df):,} dòng "
+                  f"({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+            specs = recorded or workloads.get(label)
+            if specs is None:
+                specs = workloads[label] = generate_workload(master_df, args.requests, seed=args.seed + 1)
+                if args.save_workload:
+                    save_workload(specs, args.save_workload)
+            rows.extend(benchmark_master(master_df, specs, names, label, args.alloc_sample))
+            del master_df
+    finally:
+        tmp.cleanup()
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -973,7 +973,9 @@ def combine_all(list_df, include_expired: bool = False, cutoff_date: date | None
     master_with_delta = add_delta_display_columns(master_current, master_previous)
 
     # 7) Ghi Excel
-    with pd.ExcelWriter(master_file, engine="openpyxl") as writer:
+    # Ghi ra file tạm rồi os.replace -> người đọc (MasterProvider) không bao giờ thấy file ghi dở
+    staging_file = os.path.splitext(master_file)[0] + ".publishing.xlsx"
+    with pd.ExcelWriter(staging_file, engine="openpyxl") as writer:
         # Sheet Master: giá hiện tại + delta
         master_with_delta.to_excel(writer, index=False, sheet_name="Master")
         ws = writer.sheets["Master"]
@@ -1042,6 +1044,8 @@ def combine_all(list_df, include_expired: bool = False, cutoff_date: date | None
         else:
             print("[SCHEDULE] Missing Schedule.xlsx at: {0} -> skip.".format(schedule_file))
 
+    os.replace(staging_file, master_file)
+
     print("\n[DONE] MASTER FILE: {0}".format(master_file))
     print("    -> Master rows (current view) : {0}".format(len(master_current)))
     print("    -> Old_Rate rows (full history): {0}".format(len(old_rate_wide)))